@@ -0,0 +1,78 @@
+from sasi_data.util.dictionary_encoding import DictionaryEncoding
+from sqlalchemy.types import TypeDecorator, Integer
+import threading
+
+
+class Codebook(DictionaryEncoding):
+    """ Dictionary encoding for one dimension, e.g. gear ids.
+    Remembers newly assigned codes until they are persisted. """
+
+    def __init__(self, values=None):
+        self.pending = []
+        self.lock = threading.RLock()
+        DictionaryEncoding.__init__(self, values)
+
+    def add_code(self, code, value):
+        """ Adds a persisted code. Codes must be added in order. """
+        if code != len(self.values):
+            raise Exception("Codebook code %s is out of order, expected %s" % (
+                code, len(self.values)))
+        self.codes[value] = code
+        self.values.append(value)
+
+    def encode(self, value):
+        if isinstance(value, str):
+            value = value.decode('utf-8')
+        with self.lock:
+            is_new = value is not None and value not in self.codes
+            code = DictionaryEncoding.encode(self, value)
+            if is_new:
+                self.pending.append((code, value))
+        return code
+
+    def get_code(self, value):
+        if isinstance(value, str):
+            value = value.decode('utf-8')
+        with self.lock:
+            return DictionaryEncoding.get_code(self, value)
+
+    def get_pending(self):
+        with self.lock:
+            return list(self.pending)
+
+    def clear_pending(self, num_codes):
+        with self.lock:
+            self.pending = self.pending[num_codes:]
+
+
+class DimensionCode(TypeDecorator):
+    """ Stores dimension ids as integer codes from a codebook,
+    and loads them back as ids.
+    Binding only looks codes up, so filtering on an id does not add it
+    to the codebook. Writers must encode new ids before inserting them,
+    as SASI_SqlAlchemyDAO does. Unknown ids bind as UNKNOWN_CODE. """
+
+    impl = Integer
+
+    # Never stored, so it matches no rows.
+    UNKNOWN_CODE = -1
+
+    def __init__(self, codebook, *args, **kwargs):
+        TypeDecorator.__init__(self, *args, **kwargs)
+        self.codebook = codebook
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        code = self.codebook.get_code(value)
+        if code is None:
+            return self.UNKNOWN_CODE
+        return code
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self.codebook.decode(value)
+
+    def copy(self):
+        return DimensionCode(self.codebook)
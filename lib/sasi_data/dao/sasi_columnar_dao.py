@@ -0,0 +1,377 @@
+import sasi_data.models as sasi_models
+from sasi_data.util.dictionary_encoding import DictionaryEncoding
+import numpy as np
+from itertools import islice
+import json
+import os
+import shutil
+import tempfile
+
+
+class SASI_ColumnarDAO(object):
+    """ Storage backend for model results, as typed column files.
+    Each result source is partitioned by time step, with one flat binary
+    file per column per partition. Columns are read back as memory-mapped
+    numpy arrays. String id columns are stored as dictionary-encoded
+    integer codes, with dictionaries shared across sources.
+    Row counts and dictionaries live in a manifest, which is only
+    rewritten on commit. Rows appended after the last commit are not
+    visible to readers which open the store later.
+    """
+
+    MANIFEST_FILE = 'manifest.json'
+
+    def __init__(self, data_dir=None, batch_size=1e5, **kwargs):
+        self.data_dir = data_dir
+        self.batch_size = int(batch_size)
+        if not os.path.isdir(self.data_dir):
+            os.makedirs(self.data_dir)
+        self.schema = self.generateSchema()
+        self.load_manifest()
+
+    def generateSchema(self):
+        schema = { 'sources': {} }
+
+        # Result.
+        schema['sources']['SasiResult'] = {
+            'class': sasi_models.SasiResult,
+            'columns': [
+                ('cell_id', 'i4'),
+                ('gear_id', 'i4'),
+                ('substrate_id', 'i4'),
+                ('energy_id', 'i4'),
+                ('feature_id', 'i4'),
+                ('feature_category_id', 'i4'),
+                ('a', 'f8'),
+                ('x', 'f8'),
+                ('y', 'f8'),
+                ('z', 'f8'),
+                ('znet', 'f8'),
+                ('hours_fished', 'f8'),
+                ('value', 'f8'),
+            ],
+            'encoded': ['gear_id', 'substrate_id', 'energy_id', 'feature_id',
+                        'feature_category_id'],
+        }
+
+        # Fishing Results.
+        schema['sources']['FishingResult'] = {
+            'class': sasi_models.FishingResult,
+            'columns': [
+                ('cell_id', 'i4'),
+                ('gear_id', 'i4'),
+                ('generic_gear_id', 'i4'),
+                ('a', 'f8'),
+                ('value', 'f8'),
+                ('value_net', 'f8'),
+                ('hours_fished', 'f8'),
+                ('hours_fished_net', 'f8'),
+            ],
+            'encoded': ['gear_id', 'generic_gear_id'],
+        }
+
+        # Gear ids share one dictionary.
+        for source_def in schema['sources'].values():
+            source_def['dtypes'] = dict(source_def['columns'])
+            source_def['encodings'] = dict(
+                [(col, 'gear_id' if col == 'generic_gear_id' else col)
+                 for col in source_def['encoded']])
+
+        return schema
+
+    # Manifest.
+
+    def get_manifest_path(self):
+        return os.path.join(self.data_dir, self.MANIFEST_FILE)
+
+    def load_manifest(self):
+        manifest = {'encodings': {}, 'sources': {}}
+        path = self.get_manifest_path()
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                manifest = json.load(f)
+        self.encodings = {}
+        for name, values in manifest['encodings'].items():
+            self.encodings[name] = DictionaryEncoding(values)
+        self.partitions = {}
+        for source in self.schema['sources']:
+            partitions = manifest['sources'].get(source, {})
+            self.partitions[source] = dict(
+                [(int(t), num_rows) for t, num_rows in partitions.items()])
+
+    def commit(self):
+        """ Writes the manifest, making appended rows visible. """
+        manifest = {
+            'encodings': dict([(name, encoding.values) for name, encoding
+                               in self.encodings.items()]),
+            'sources': {},
+        }
+        for source, partitions in self.partitions.items():
+            manifest['sources'][source] = dict(
+                [(str(t), num_rows) for t, num_rows in partitions.items()])
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            json.dump(manifest, f)
+        path = self.get_manifest_path()
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+    def get_encoding(self, source, column):
+        name = self.schema['sources'][source]['encodings'][column]
+        return self.encodings.setdefault(name, DictionaryEncoding())
+
+    # Writing.
+
+    def get_partition_dir(self, source, t):
+        return os.path.join(self.data_dir, source, "t_%s" % t)
+
+    def get_column_path(self, source, t, column):
+        return os.path.join(self.get_partition_dir(source, t),
+                            "%s.col" % column)
+
+    def save_dicts(self, source, dicts, batch_size=None, commit=True):
+        self.append(source, dicts, lambda r, attr: r.get(attr),
+                    batch_size=batch_size, commit=commit)
+
+    def bulk_insert_objects(self, source, objects, batch_size=None,
+                            commit=True):
+        self.append(source, objects, lambda o, attr: getattr(o, attr, None),
+                    batch_size=batch_size, commit=commit)
+
+    def append(self, source, records, getter, batch_size=None, commit=True):
+        batch_size = int(batch_size or self.batch_size)
+        records = iter(records)
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            self.append_batch(source, batch, getter)
+        if commit:
+            self.commit()
+
+    def append_batch(self, source, records, getter):
+        """ Appends a batch of records, grouped by time step. """
+        records_by_t = {}
+        for record in records:
+            records_by_t.setdefault(getter(record, 't'), []).append(record)
+
+        source_def = self.schema['sources'][source]
+        for t, t_records in records_by_t.items():
+            t = int(t)
+            partition_dir = self.get_partition_dir(source, t)
+            if not os.path.isdir(partition_dir):
+                os.makedirs(partition_dir)
+            num_rows = self.partitions[source].get(t, 0)
+            for column, dtype in source_def['columns']:
+                values = [getter(r, column) for r in t_records]
+                if column in source_def['encodings']:
+                    values = self.get_encoding(source, column).encode_many(
+                        values)
+                elif dtype.startswith('i'):
+                    values = [DictionaryEncoding.NULL_CODE if v is None
+                              else v for v in values]
+                # None becomes nan for float columns.
+                arr = np.array(values, dtype=dtype)
+                self.write_column(source, t, column, arr, num_rows)
+            self.partitions[source][t] = num_rows + len(t_records)
+
+    def write_column(self, source, t, column, arr, offset):
+        """ Writes arr at row offset, dropping any uncommitted rows from
+        an earlier, interrupted write. """
+        path = self.get_column_path(source, t, column)
+        mode = 'r+b' if os.path.exists(path) else 'wb'
+        with open(path, mode) as f:
+            f.seek(offset * arr.dtype.itemsize)
+            f.truncate()
+            arr.tofile(f)
+
+    def clear_source(self, source, commit=False):
+        """ Delete all rows for a source. """
+        source_dir = os.path.join(self.data_dir, source)
+        if os.path.isdir(source_dir):
+            shutil.rmtree(source_dir)
+        self.partitions[source] = {}
+        if commit:
+            self.commit()
+
+    # Reading.
+
+    def get_time_steps(self, source):
+        return sorted(self.partitions[source].keys())
+
+    def get_time_steps_for(self, source, t=None):
+        if t is None:
+            return self.get_time_steps(source)
+        if isinstance(t, (list, tuple, set)):
+            return [t_ for t_ in sorted(t) if t_ in self.partitions[source]]
+        return [t] if t in self.partitions[source] else []
+
+    def get_column(self, source, t, column):
+        """ Returns a column for one time step, as a memory-mapped array.
+        Encoded columns are returned as codes. """
+        num_rows = self.partitions[source].get(t, 0)
+        if column == 't':
+            return np.repeat(np.int32(t), num_rows)
+        dtype = np.dtype(self.schema['sources'][source]['dtypes'][column])
+        if num_rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.get_column_path(source, t, column),
+                         dtype=dtype, mode='r', shape=(num_rows,))
+
+    def get_filter_mask(self, source, t, filters):
+        """ Returns a boolean mask for rows matching all filters.
+        Filters map column names to a value or a list of values. """
+        mask = np.ones(self.partitions[source].get(t, 0), dtype=bool)
+        for column, values in (filters or {}).items():
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            if column in self.schema['sources'][source]['encodings']:
+                encoding = self.get_encoding(source, column)
+                values = [encoding.get_code(v) for v in values]
+                values = [v for v in values if v is not None]
+            mask &= np.in1d(self.get_column(source, t, column),
+                            np.array(list(values)))
+        return mask
+
+    def get_columns(self, source, columns=None, t=None, filters=None,
+                    decode=False):
+        """ Returns a dict of column arrays for the selected time steps.
+        t can be a single time step, a list of time steps, or None for all.
+        If decode is True, encoded columns are returned as object arrays
+        of ids rather than codes. """
+        if columns is None:
+            columns = ['t'] + [c for c, dtype in
+                               self.schema['sources'][source]['columns']]
+        parts = dict([(column, []) for column in columns])
+        for t_ in self.get_time_steps_for(source, t):
+            mask = None
+            if filters:
+                mask = self.get_filter_mask(source, t_, filters)
+            for column in columns:
+                arr = self.get_column(source, t_, column)
+                if mask is not None:
+                    arr = arr[mask]
+                parts[column].append(arr)
+
+        result = {}
+        for column in columns:
+            if column == 't':
+                dtype = np.dtype('i4')
+            else:
+                dtype = np.dtype(
+                    self.schema['sources'][source]['dtypes'][column])
+            if not parts[column]:
+                arr = np.empty(0, dtype=dtype)
+            elif len(parts[column]) == 1:
+                arr = parts[column][0]
+            else:
+                arr = np.concatenate(parts[column])
+            if decode and column in \
+               self.schema['sources'][source]['encodings']:
+                arr = self.decode_column(source, column, arr)
+            result[column] = arr
+        return result
+
+    def decode_column(self, source, column, codes):
+        encoding = self.get_encoding(source, column)
+        # Code -1 maps to the trailing None.
+        lookup = np.array(encoding.values + [None], dtype=object)
+        return lookup[codes]
+
+    def count(self, source, t=None, filters=None):
+        count = 0
+        for t_ in self.get_time_steps_for(source, t):
+            if filters:
+                count += int(self.get_filter_mask(source, t_, filters).sum())
+            else:
+                count += self.partitions[source][t_]
+        return count
+
+    def get_results(self, source, t=None, filters=None, batch_size=None):
+        """ Yields result model objects, one time step at a time. """
+        batch_size = int(batch_size or self.batch_size)
+        source_def = self.schema['sources'][source]
+        columns = [c for c, dtype in source_def['columns']]
+        for t_ in self.get_time_steps_for(source, t):
+            arrays = self.get_columns(source, columns=columns, t=t_,
+                                      filters=filters)
+            num_rows = len(arrays[columns[0]])
+            for start in range(0, num_rows, batch_size):
+                end = start + batch_size
+                values = []
+                for column in columns:
+                    arr = arrays[column][start:end]
+                    if column in source_def['encodings']:
+                        values.append(self.decode_column(
+                            source, column, arr).tolist())
+                    else:
+                        values.append(arr.tolist())
+                for row in zip(*values):
+                    obj = source_def['class'](t=t_, **dict(zip(columns, row)))
+                    for column, dtype in source_def['columns']:
+                        if dtype.startswith('i') and obj[column] == -1:
+                            obj[column] = None
+                    yield obj
+
+    def aggregate(self, source, group_by=None, fields=None, t=None,
+                  filters=None):
+        """ Sums fields over groups of rows.
+        group_by columns must be integer or encoded columns, or 't'.
+        Returns a list of dicts with group values, sums, and a 'count'.
+        nan values count as 0 in sums. """
+        group_by = group_by or []
+        fields = fields or []
+        arrays = self.get_columns(source, columns=group_by + fields, t=t,
+                                  filters=filters)
+        if group_by:
+            num_rows = len(arrays[group_by[0]])
+        elif fields:
+            num_rows = len(arrays[fields[0]])
+        else:
+            num_rows = self.count(source, t=t, filters=filters)
+
+        if not group_by:
+            row = {'count': num_rows}
+            for field in fields:
+                row[field] = float(np.nansum(arrays[field]))
+            return [row]
+
+        if num_rows == 0:
+            return []
+
+        # Combine group columns into a single int64 key.
+        key = np.zeros(num_rows, dtype='i8')
+        for column in group_by:
+            arr = arrays[column].astype('i8')
+            arr_min = arr.min()
+            key = key * (arr.max() - arr_min + 1) + (arr - arr_min)
+        unique_keys, first_idxs, inverse = np.unique(
+            key, return_index=True, return_inverse=True)
+        num_groups = len(unique_keys)
+
+        counts = np.bincount(inverse, minlength=num_groups)
+        sums = {}
+        for field in fields:
+            values = np.nan_to_num(arrays[field].astype('f8'))
+            sums[field] = np.bincount(inverse, weights=values,
+                                      minlength=num_groups)
+
+        group_values = {}
+        for column in group_by:
+            values = arrays[column][first_idxs]
+            if column in self.schema['sources'][source]['encodings']:
+                group_values[column] = self.decode_column(
+                    source, column, values).tolist()
+            else:
+                group_values[column] = values.tolist()
+
+        rows = []
+        for i in range(num_groups):
+            row = {'count': int(counts[i])}
+            for column in group_by:
+                row[column] = group_values[column][i]
+            for field in fields:
+                row[field] = float(sums[field][i])
+            rows.append(row)
+        return rows
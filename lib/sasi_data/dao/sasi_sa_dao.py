@@ -1,25 +1,45 @@
 import sasi_data.models as sasi_models 
+from sasi_data.dao.dimension_code import Codebook, DimensionCode
 from sa_dao.orm_dao import ORM_DAO
 from sqlalchemy import (Table, Column, ForeignKey, ForeignKeyConstraint, 
-                        Integer, String, Boolean, Text, Float, PickleType, 
-                        create_engine, MetaData)
-from sqlalchemy.orm import (mapper, relationship)
+                        Integer, BigInteger, String, Boolean, Text, Float,
+                        PickleType, Index, create_engine, MetaData, select,
+                        inspect, event)
+from sqlalchemy.orm import (mapper, relationship, object_mapper)
 import sys
 import logging
 
 
 class SASI_SqlAlchemyDAO(ORM_DAO):
 
-    def __init__(self, session=None, create_tables=True, **kwargs):
+    DIMENSIONS = ['gear', 'substrate', 'energy', 'feature',
+                  'feature_category']
+
+    def __init__(self, session=None, create_tables=True,
+                 encode_dimensions=False, defer_indexes=False, **kwargs):
+        """ If encode_dimensions is True, fact tables store dimension ids
+        as integer codes. Codes are assigned as new ids are saved, and
+        are stored in the dimension_code table. Only one DAO should write
+        to a database at a time when encoding dimensions.
+        If defer_indexes is True, secondary indexes are not created with
+        the tables, and are built by create_indexes(), e.g. after a bulk
+        load. """
         self.session = session
+        self.encode_dimensions = encode_dimensions
+        self.defer_indexes = defer_indexes
         self.setUp()
         ORM_DAO.__init__(self, session=self.session, schema=self.schema,
                          **kwargs)
         if create_tables:
             self.create_tables()
+        if self.encode_dimensions:
+            self.load_codebooks()
+            event.listen(self.session, 'before_flush', self.assign_codes)
 
     def setUp(self):
         self.metadata = MetaData()
+        self.codebooks = dict([(dimension, Codebook()) 
+                               for dimension in self.DIMENSIONS])
         self.schema = self.generateSchema()
 
     def get_local_mapped_class(self, base_class, table, local_name, **kw):
@@ -32,6 +52,12 @@ class SASI_SqlAlchemyDAO(ORM_DAO):
             bind = self.session.bind
         self.metadata.create_all(bind=bind)
 
+    def dimension_column(self, name, dimension, **kwargs):
+        if self.encode_dimensions:
+            return Column(name, DimensionCode(self.codebooks[dimension]),
+                          **kwargs)
+        return Column(name, String(convert_unicode=True), **kwargs)
+
     def generateSchema(self):
         schema = { 'sources': {} }
 
@@ -53,8 +79,8 @@ class SASI_SqlAlchemyDAO(ORM_DAO):
         mappings['Habitat'] = {
             'table': Table('habitat', self.metadata,
                            Column('id', Integer, primary_key=True),
-                           Column('substrate_id', String(convert_unicode=True)),
-                           Column('energy_id', String(convert_unicode=True)),
+                           self.dimension_column('substrate_id', 'substrate'),
+                           self.dimension_column('energy_id', 'energy'),
                            Column('depth', Float),
                            Column('area', Float),
                           ),
@@ -112,10 +138,10 @@ class SASI_SqlAlchemyDAO(ORM_DAO):
         # Vulnerability Assessment.
         mappings['VA'] = {
             'table': Table('va', self.metadata,
-                           Column('gear_id', String(convert_unicode=True), primary_key=True),
-                           Column('feature_id', String(convert_unicode=True), primary_key=True),
-                           Column('substrate_id', String(convert_unicode=True), primary_key=True),
-                           Column('energy_id', String(convert_unicode=True), primary_key=True),
+                           self.dimension_column('gear_id', 'gear', primary_key=True),
+                           self.dimension_column('feature_id', 'feature', primary_key=True),
+                           self.dimension_column('substrate_id', 'substrate', primary_key=True),
+                           self.dimension_column('energy_id', 'energy', primary_key=True),
                            Column('s', Integer),
                            Column('r', Integer),
                           ),
@@ -127,11 +153,15 @@ class SASI_SqlAlchemyDAO(ORM_DAO):
                            Column('id', Integer, primary_key=True),
                            Column('time', Integer),
                            Column('cell_id', Integer),
-                           Column('gear_id', String(convert_unicode=True)),
+                           self.dimension_column('gear_id', 'gear'),
                            Column('a', Float),
                            Column('hours_fished', Float),
                            Column('value', Float),
                           ),
+            'indexes': [
+                ('ix_effort_time_cell_gear', ['time', 'cell_id', 'gear_id']),
+                ('ix_effort_time_gear', ['time', 'gear_id']),
+            ],
         }
 
         # Model Parameters.
@@ -160,17 +190,22 @@ class SASI_SqlAlchemyDAO(ORM_DAO):
                            Column('id', Integer, primary_key=True),
                            Column('t', Integer),
                            Column('cell_id', Integer),
-                           Column('gear_id', String(convert_unicode=True)),
-                           Column('substrate_id', String(convert_unicode=True)),
-                           Column('energy_id', String(convert_unicode=True)),
-                           Column('feature_id', String(convert_unicode=True)),
-                           Column('feature_category_id', String(convert_unicode=True)),
+                           self.dimension_column('gear_id', 'gear'),
+                           self.dimension_column('substrate_id', 'substrate'),
+                           self.dimension_column('energy_id', 'energy'),
+                           self.dimension_column('feature_id', 'feature'),
+                           self.dimension_column('feature_category_id', 
+                                                 'feature_category'),
                            Column('a', Float),
                            Column('x', Float),
                            Column('y', Float),
                            Column('z', Float),
                            Column('znet', Float),
                           ),
+            'indexes': [
+                ('ix_sasi_result_t_cell', ['t', 'cell_id']),
+                ('ix_sasi_result_t_gear', ['t', 'gear_id']),
+            ],
         }
 
         # Fishing Results.
@@ -179,16 +214,49 @@ class SASI_SqlAlchemyDAO(ORM_DAO):
                            Column('id', Integer, primary_key=True),
                            Column('t', Integer),
                            Column('cell_id', Integer),
-                           Column('gear_id', String(convert_unicode=True)),
-                           Column('generic_gear_id', String(convert_unicode=True)),
+                           self.dimension_column('gear_id', 'gear'),
+                           self.dimension_column('generic_gear_id', 'gear'),
                            Column('a', Float),
                            Column('value', Float),
                            Column('value_net', Float),
                            Column('hours_fished', Float),
                            Column('hours_fished_net', Float),
                           ),
+            'indexes': [
+                ('ix_fishing_result_t_cell', ['t', 'cell_id']),
+                ('ix_fishing_result_t_gear', ['t', 'gear_id']),
+            ],
+        }
+
+
+        # Fingerprints of ingested sections.
+        mappings['SectionFingerprint'] = {
+            'table': Table('section_fingerprint', self.metadata,
+                           Column('id', String(convert_unicode=True),
+                                  primary_key=True),
+                           Column('fingerprint', String(convert_unicode=True)),
+                          ),
         }
 
+        # Progress of section ingests, for resuming interrupted ingests.
+        mappings['IngestCheckpoint'] = {
+            'table': Table('ingest_checkpoint', self.metadata,
+                           Column('id', String(convert_unicode=True),
+                                  primary_key=True),
+                           Column('fingerprint', String(convert_unicode=True)),
+                           Column('status', String(convert_unicode=True)),
+                           Column('offset', BigInteger),
+                           Column('num_records', Integer),
+                          ),
+        }
+
+        # Secondary indexes.
+        self.indexes = []
+        for class_name, mapping in mappings.items():
+            for index_name, columns in mapping.get('indexes', []):
+                self.indexes.append((mapping['table'], index_name, columns))
+        if not self.defer_indexes:
+            self.get_indexes()
 
         for class_name, mapping in mappings.items():
             mapped_class = self.get_local_mapped_class(
@@ -199,8 +267,112 @@ class SASI_SqlAlchemyDAO(ORM_DAO):
             )
             schema['sources'][class_name] = mapped_class
 
+        # Dimension codes, for encoded dimension ids.
+        self.dimension_code_table = Table(
+            'dimension_code', self.metadata,
+            Column('dimension', String(convert_unicode=True), 
+                   primary_key=True),
+            Column('code', Integer, primary_key=True),
+            Column('value', String(convert_unicode=True)),
+        )
+
         return schema
 
+    def get_indexes(self):
+        """ Returns Index objects for the secondary indexes. 
+        Note that creating an Index adds it to its table's indexes. """
+        if not hasattr(self, '_indexes'):
+            self._indexes = [
+                Index(index_name, *[table.c[c] for c in columns])
+                for table, index_name, columns in self.indexes]
+        return self._indexes
+
+    def create_indexes(self, bind=None, analyze=True):
+        """ Creates secondary indexes which do not exist yet.
+        If analyze is True, also updates planner statistics, 
+        for databases which support ANALYZE. """
+        if not bind:
+            bind = self.session.bind
+        inspector = inspect(bind)
+        for index in self.get_indexes():
+            existing = [i['name'] for i in 
+                        inspector.get_indexes(index.table.name)]
+            if index.name not in existing:
+                index.create(bind=bind)
+        if analyze and bind.dialect.name in ['sqlite', 'postgresql']:
+            bind.execute('ANALYZE')
+
+    def load_codebooks(self):
+        table = self.dimension_code_table
+        rows = self.session.execute(
+            select([table.c.dimension, table.c.code, table.c.value])\
+            .order_by(table.c.dimension, table.c.code))
+        for dimension, code, value in rows:
+            self.codebooks[dimension].add_code(code, value)
+
+    def get_codebook(self, dimension):
+        return self.codebooks[dimension]
+
+    def get_dimension_columns(self, table):
+        """ Returns (column key, codebook) for a table's encoded columns. """
+        return [(c.key, c.type.codebook) for c in table.c
+                if isinstance(c.type, DimensionCode)]
+
+    def encode_dicts(self, table, dicts):
+        """ Assigns codes for new ids in dicts, as they are saved. """
+        columns = self.get_dimension_columns(table)
+        for d in dicts:
+            for key, codebook in columns:
+                codebook.encode(d.get(key))
+            yield d
+
+    def assign_codes(self, session, flush_context, instances):
+        """ Assigns codes for new ids in objects about to be flushed.
+        Codes are only assigned here and in save_dicts, so queries
+        on unknown ids do not add codes. """
+        for obj in list(session.new) + list(session.dirty):
+            table = object_mapper(obj).local_table
+            for key, codebook in self.get_dimension_columns(table):
+                codebook.encode(getattr(obj, key, None))
+
+    def save_codebooks(self):
+        """ Inserts new dimension codes.
+        Returns the number of codes saved per dimension. """
+        saved = {}
+        rows = []
+        for dimension, codebook in self.codebooks.items():
+            pending = codebook.get_pending()
+            saved[dimension] = len(pending)
+            for code, value in pending:
+                rows.append({'dimension': dimension, 'code': code, 
+                             'value': value})
+        if rows:
+            self.session.execute(self.dimension_code_table.insert(), rows)
+        return saved
+
+    def commit(self):
+        if self.encode_dimensions:
+            # Flush first, so that codes for new ids get assigned, and
+            # save them in the same transaction as the rows that use them.
+            self.session.flush()
+            saved = self.save_codebooks()
+            ORM_DAO.commit(self)
+            for dimension, num_codes in saved.items():
+                self.codebooks[dimension].clear_pending(num_codes)
+        else:
+            ORM_DAO.commit(self)
+
+    def save_dicts(self, source, dicts, batch_size=1e4, commit=True):
+        if self.encode_dimensions:
+            table = self.get_table_for_class(self.schema['sources'][source])
+            ORM_DAO.save_dicts(self, source, self.encode_dicts(table, dicts),
+                               batch_size=batch_size, commit=False)
+            if commit:
+                self.commit()
+        else:
+            ORM_DAO.save_dicts(self, source, dicts, batch_size=batch_size,
+                               commit=commit)
+
     def bulk_insert_objects(self, source, objects, batch_size=1e4, commit=True):
         table = self.get_table_for_class(
             self.schema['sources'][source])
@@ -212,3 +384,45 @@ class SASI_SqlAlchemyDAO(ORM_DAO):
 
         self.save_dicts(source, obj_dicts(), batch_size=batch_size, 
                         commit=commit)
+
+    def clear_source(self, source, commit=False):
+        """ Delete all rows for a source. """
+        table = self.get_table_for_class(self.schema['sources'][source])
+        self.session.execute(table.delete())
+        if commit:
+            self.commit()
+
+    def get_section_fingerprint(self, section_id):
+        fingerprint = self.session.query(
+            self.schema['sources']['SectionFingerprint']).get(section_id)
+        if fingerprint:
+            return fingerprint.fingerprint
+        return None
+
+    def set_section_fingerprint(self, section_id, fingerprint, commit=True):
+        self.session.merge(self.schema['sources']['SectionFingerprint'](
+            id=section_id, fingerprint=fingerprint))
+        if commit:
+            self.commit()
+
+    def get_ingest_checkpoint(self, section_id):
+        return self.session.query(
+            self.schema['sources']['IngestCheckpoint']).get(section_id)
+
+    def set_ingest_checkpoint(self, section_id, fingerprint=None,
+                              status=None, offset=None, num_records=None,
+                              commit=True):
+        """ Saves a section's progress. Call with commit=False before
+        committing a batch of rows, so that the checkpoint is saved in
+        the same transaction as the rows. """
+        self.session.merge(self.schema['sources']['IngestCheckpoint'](
+            id=section_id, fingerprint=fingerprint, status=status,
+            offset=offset, num_records=num_records))
+        if commit:
+            self.commit()
+
+    def get_source_ids(self, source):
+        """ Returns the set of ids saved for a source. """
+        table = self.get_table_for_class(self.schema['sources'][source])
+        return set([row[0] for row in 
+                    self.session.execute(select([table.c.id]))])
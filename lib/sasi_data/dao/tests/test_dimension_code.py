@@ -0,0 +1,84 @@
+import unittest
+from sasi_data.dao.dimension_code import Codebook, DimensionCode
+from sasi_data.dao.sasi_sa_dao import SASI_SqlAlchemyDAO
+from sqlalchemy import (Table, Column, Integer, MetaData, create_engine,
+                        select)
+from sqlalchemy.orm import sessionmaker
+
+
+class DimensionCodeTest(unittest.TestCase):
+
+    def test_codebook(self):
+        codebook = Codebook()
+        self.assertEquals(codebook.encode('G1'), 0)
+        self.assertEquals(codebook.encode(u'G2'), 1)
+        self.assertEquals(codebook.encode(u'G1'), 0)
+        self.assertEquals(codebook.encode(None), -1)
+        self.assertEquals(codebook.get_pending(), [(0, u'G1'), (1, u'G2')])
+        codebook.clear_pending(1)
+        self.assertEquals(codebook.get_pending(), [(1, u'G2')])
+
+        loaded = Codebook()
+        loaded.add_code(0, u'G1')
+        self.assertEquals(loaded.encode('G1'), 0)
+        self.assertEquals(loaded.get_pending(), [])
+        self.assertRaises(Exception, loaded.add_code, 5, u'G5')
+
+    def test_dimension_code_type(self):
+        codebook = Codebook()
+        metadata = MetaData()
+        table = Table('fact', metadata,
+                      Column('id', Integer, primary_key=True),
+                      Column('gear_id', DimensionCode(codebook)))
+        engine = create_engine('sqlite://')
+        metadata.create_all(bind=engine)
+
+        # Writers assign codes before inserting.
+        codebook.encode_many(['G1', 'G2'])
+        engine.execute(table.insert(), [
+            {'id': 1, 'gear_id': 'G1'},
+            {'id': 2, 'gear_id': 'G2'},
+            {'id': 3, 'gear_id': None},
+            {'id': 4, 'gear_id': 'G1'},
+        ])
+
+        # Stored as codes.
+        raw = engine.execute("SELECT gear_id FROM fact ORDER BY id").fetchall()
+        self.assertEquals([r[0] for r in raw], [0, 1, None, 0])
+
+        # Loaded and filtered as ids.
+        rows = engine.execute(
+            select([table.c.id, table.c.gear_id])\
+            .where(table.c.gear_id == 'G1').order_by(table.c.id)).fetchall()
+        self.assertEquals([tuple(r) for r in rows], [(1, 'G1'), (4, 'G1')])
+
+        # Filtering on an unknown id matches nothing, and does not add it.
+        rows = engine.execute(
+            select([table.c.id]).where(table.c.gear_id == 'NOPE')).fetchall()
+        self.assertEquals(rows, [])
+        self.assertEquals(codebook.get_code('NOPE'), None)
+        self.assertEquals(len(codebook), 2)
+
+    def test_dao_codes(self):
+        session = sessionmaker()(bind=create_engine('sqlite://'))
+        dao = SASI_SqlAlchemyDAO(session=session, encode_dimensions=True)
+        Effort = dao.schema['sources']['Effort']
+        dao.save(Effort(id=1, gear_id='G1'), commit=False)
+        dao.save_dicts('Effort', [{'id': 2, 'gear_id': 'G2'}])
+        self.assertEquals(sorted(dao.get_codebook('gear').values),
+                          [u'G1', u'G2'])
+
+        efforts = session.query(Effort).filter(Effort.gear_id == 'G2').all()
+        self.assertEquals([e.id for e in efforts], [2])
+        self.assertEquals(
+            session.query(Effort).filter(Effort.gear_id == 'NOPE').all(), [])
+        dao.commit()
+
+        self.assertEquals(sorted(dao.get_codebook('gear').values),
+                          [u'G1', u'G2'])
+        codes = session.execute(
+            select([dao.dimension_code_table.c.value])).fetchall()
+        self.assertEquals(sorted([r[0] for r in codes]), [u'G1', u'G2'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from sasi_data.dao.sasi_columnar_dao import SASI_ColumnarDAO
+import sasi_data.models as sasi_models
+import tempfile
+import shutil
+
+
+class SASI_ColumnarDAOTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def generate_results(self):
+        results = []
+        for t in range(2):
+            for cell_id in range(3):
+                for gear_id in ['G1', 'G2']:
+                    results.append(sasi_models.SasiResult(
+                        t=t, cell_id=cell_id, gear_id=gear_id,
+                        substrate_id='S1', energy_id='High',
+                        feature_id='F1', feature_category_id=None,
+                        a=1.0, x=float(cell_id), y=2.0, z=3.0, znet=None))
+        return results
+
+    def test_append_and_read(self):
+        dao = SASI_ColumnarDAO(data_dir=self.data_dir)
+        results = self.generate_results()
+        dao.bulk_insert_objects('SasiResult', results, batch_size=5)
+
+        # Reopen, to read from disk.
+        dao = SASI_ColumnarDAO(data_dir=self.data_dir)
+        self.assertEquals(dao.get_time_steps('SasiResult'), [0, 1])
+        self.assertEquals(dao.count('SasiResult'), len(results))
+        self.assertEquals(dao.count('SasiResult', t=1,
+                                    filters={'gear_id': 'G2'}), 3)
+
+        columns = dao.get_columns('SasiResult', columns=['gear_id', 'x'],
+                                  t=0, decode=True)
+        self.assertEquals(list(columns['gear_id']), ['G1', 'G2'] * 3)
+        self.assertEquals(list(columns['x']), [0.0, 0.0, 1.0, 1.0, 2.0, 2.0])
+
+        read_results = list(dao.get_results('SasiResult'))
+        self.assertEquals(len(read_results), len(results))
+        for attr in ['t', 'cell_id', 'gear_id', 'feature_category_id', 'x']:
+            self.assertEquals([r[attr] for r in read_results],
+                              [r[attr] for r in results])
+
+    def test_uncommitted_rows(self):
+        dao = SASI_ColumnarDAO(data_dir=self.data_dir)
+        results = self.generate_results()
+        dao.bulk_insert_objects('SasiResult', results[:4])
+        dao.bulk_insert_objects('SasiResult', results[4:], commit=False)
+        dao = SASI_ColumnarDAO(data_dir=self.data_dir)
+        self.assertEquals(dao.count('SasiResult'), 4)
+
+        # New rows should replace the uncommitted ones.
+        dao.bulk_insert_objects('SasiResult', results[4:])
+        dao = SASI_ColumnarDAO(data_dir=self.data_dir)
+        self.assertEquals([r.x for r in dao.get_results('SasiResult')],
+                          [r.x for r in results])
+
+    def test_aggregate(self):
+        dao = SASI_ColumnarDAO(data_dir=self.data_dir)
+        dao.bulk_insert_objects('SasiResult', self.generate_results())
+        rows = dao.aggregate('SasiResult', group_by=['t', 'gear_id'],
+                             fields=['x', 'znet'])
+        rows = sorted(rows, key=lambda r: (r['t'], r['gear_id']))
+        self.assertEquals(
+            [(r['t'], r['gear_id'], r['count'], r['x'], r['znet'])
+             for r in rows],
+            [
+                (0, 'G1', 3, 3.0, 0.0),
+                (0, 'G2', 3, 3.0, 0.0),
+                (1, 'G1', 3, 3.0, 0.0),
+                (1, 'G2', 3, 3.0, 0.0),
+            ]
+        )
+        totals = dao.aggregate('SasiResult', fields=['a'],
+                               filters={'cell_id': [0, 1]})
+        self.assertEquals(totals, [{'count': 8, 'a': 8.0}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1 +1,6 @@
 from csv_exporter import CSV_Exporter
+# NumPy is not available on all platforms, e.g. Jython.
+try:
+    from npy_exporter import NPY_Exporter
+except ImportError:
+    pass
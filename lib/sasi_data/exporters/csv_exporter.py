@@ -1,50 +1,280 @@
+from sasi_data.exporters.exporter import Exporter
 import csv
+import gzip
 import logging
+import os
+from collections import deque
+from cStringIO import StringIO
+from multiprocessing.pool import ThreadPool
 
 
 
-class CSV_Exporter(object):
-    def __init__(self, csv_file=None, data=[], mappings={},
-                 logger=logging.getLogger()):
-        self.mappings = mappings
-        self.data = data
-        self.logger = logger
+class CSV_Exporter(Exporter):
+    """ Writes items to a csv file.
+    Mappings are compiled once, into a function which converts a chunk
+    of items to rows. Rows are written chunk_size at a time.
 
-        if isinstance(csv_file, str):
-            self.csv_file = open(csv_file, 'wb')
-        self.writer = csv.writer(self.csv_file)
+    Output options:
+    - compress: gzip the output. Chunks are compressed as separate gzip
+      members, which standard gzip readers read as one stream.
+    - split_rows, split_bytes: start a new part file once a part has
+      split_rows rows, or split_bytes bytes on disk.
+    - split_by: write one part per value of this item attribute, e.g.
+      't'. Items should be ordered by the attribute.
+    - workers: number of threads which convert and compress chunks.
+      Chunks are still written in order.
+    Part files are named after csv_file, e.g. 'results.part0001.csv' or
+    'results.t_1.csv'. Each has a header row, and is written to a
+    temporary name and renamed once complete, so consumers can load
+    finished parts while the export is running.
+    """
+    def __init__(self, csv_file=None, data=None, mappings={},
+                 logger=logging.getLogger(), chunk_size=1000,
+                 yield_per=1000, objects=None, compress=False,
+                 compress_level=6, split_rows=None, split_bytes=None,
+                 split_by=None, workers=1, **kwargs):
+        Exporter.__init__(self, data=data, mappings=mappings, logger=logger,
+                          chunk_size=chunk_size, yield_per=yield_per,
+                          objects=objects, **kwargs)
+        self.compress = compress
+        self.compress_level = compress_level
+        self.split_rows = split_rows
+        self.split_bytes = split_bytes
+        self.split_by = split_by
+        self.workers = workers
+        self.part_paths = []
 
-        for i in range(len(self.mappings)):
-            if isinstance(self.mappings[i], str):
-                self.mappings[i] = {'source': self.mappings[i], 'target':
-                                    self.mappings[i]}
+        self.csv_path = None
+        self.csv_file = None
+        if isinstance(csv_file, basestring):
+            self.csv_path = csv_file
+        else:
+            self.csv_file = csv_file
+        if self.is_split() and not self.csv_path:
+            raise Exception("Splitting output requires a file path.")
+
+        self.convert_rows = self.compile_mappings(self.mappings)
+
+    def is_split(self):
+        return bool(self.split_rows or self.split_bytes or self.split_by)
+
+    def get_chunk_size(self):
+        chunk_size = self.chunk_size
+        if self.split_rows:
+            # Use a chunk size which divides split_rows, so that
+            # parts have exactly split_rows rows.
+            chunk_size = min(chunk_size, int(self.split_rows))
+            while self.split_rows % chunk_size:
+                chunk_size -= 1
+        return chunk_size
+
+    def get_keyed_chunks(self, items):
+        """ Yields (key, items) chunks. Chunks are also split where the
+        split_by attribute changes. """
+        for chunk in self.get_chunks(items, self.get_chunk_size()):
+            if not self.split_by:
+                yield None, chunk
+                continue
+            group = []
+            key = None
+            for item in chunk:
+                item_key = getattr(item, self.split_by, None)
+                if group and item_key != key:
+                    yield key, group
+                    group = []
+                key = item_key
+                group.append(item)
+            yield key, group
+
+    def encode_rows(self, rows):
+        buf = StringIO()
+        csv.writer(buf).writerows(rows)
+        data = buf.getvalue()
+        if self.compress:
+            data = gzip_compress(data, self.compress_level)
+        return data
+
+    def encode_chunk(self, key, chunk):
+        return key, len(chunk), self.encode_rows(self.convert_rows(chunk))
 
     def export(self, log_interval=1000):
-        fields = [mapping['target'] for mapping in self.mappings]
-        self.writer.writerow(fields)
-        if isinstance(self.data, dict):
-            items = self.data.get('items')
-            num_items = self.data.get('num_items')
-            if num_items is None:
-                num_items = len(items)
-        else:
-            items = self.data
-            num_items = len(items)
+        """ Writes the header and all items. Returns the number of items
+        written. """
+        if self.compress or self.is_split() or self.workers > 1:
+            return self.export_parts(log_interval=log_interval)
+
+        csv_file = self.csv_file
+        if self.csv_path:
+            csv_file = open(self.csv_path, 'wb')
+        writer = csv.writer(csv_file)
+        writer.writerow(self.get_fields())
+        items, num_items = self.get_items()
+        counter = 0
+        for key, chunk in self.get_keyed_chunks(items):
+            writer.writerows(self.convert_rows(chunk))
+            counter += len(chunk)
+            if (counter // log_interval) != (
+                (counter - len(chunk)) // log_interval):
+                self.log_progress(counter, num_items)
+        # Only close files that we opened.
+        if self.csv_path:
+            csv_file.close()
+            self.part_paths = [self.csv_path]
+        return counter
+
+    def export_parts(self, log_interval=1000):
+        part_writer = PartWriter(
+            csv_file=self.csv_file,
+            csv_path=self.csv_path,
+            header=self.encode_rows([self.get_fields()]),
+            split_rows=self.split_rows,
+            split_bytes=self.split_bytes,
+            split_by=self.split_by,
+        )
+        items, num_items = self.get_items()
+        pool = None
+        if self.workers > 1:
+            pool = ThreadPool(self.workers)
+        # Bound the number of chunks in flight, to bound memory use.
+        max_pending = max(1, 2 * self.workers)
+        pending = deque()
         counter = 0
-        for item in items:
-            counter += 1
-            if ((counter % log_interval) == 0):
-                self.logger.info("%d of %d (%.1f%%)" % (
-                    counter, num_items, (1.0 * counter/num_items) * 100))
-            row = []
-            for mapping in self.mappings:
-                raw_value = getattr(item, mapping['source'], None)
-                if raw_value == None and mapping.get('default'):
-                    raw_value = mapping['default']
-                processor = mapping.get('processor')
-                if not processor:
-                    processor = lambda value: value
-                value = processor(raw_value)
-                row.append(value)
-            self.writer.writerow(row)
-        self.csv_file.close()
+        try:
+            chunks = self.get_keyed_chunks(items)
+            while True:
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    if pool:
+                        pending.append(pool.apply_async(self.encode_chunk,
+                                                        chunk))
+                    else:
+                        pending.append(self.encode_chunk(*chunk))
+                    if len(pending) < max_pending:
+                        continue
+                if not pending:
+                    break
+                result = pending.popleft()
+                if pool:
+                    result = result.get()
+                key, num_rows, data = result
+                part_writer.write(key, num_rows, data)
+                counter += num_rows
+                if (counter // log_interval) != (
+                    (counter - num_rows) // log_interval):
+                    self.log_progress(counter, num_items)
+            part_writer.close()
+        except:
+            part_writer.abort()
+            raise
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+        self.part_paths = part_writer.paths
+        return counter
+
+
+def gzip_compress(data, compress_level=6):
+    """ Returns data as a complete gzip member. """
+    buf = StringIO()
+    gz = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=compress_level)
+    gz.write(data)
+    gz.close()
+    return buf.getvalue()
+
+
+class PartWriter(object):
+    """ Writes encoded chunks to a file, or to a series of part files.
+    Part files are written under a temporary name, and renamed when
+    they are complete. """
+    def __init__(self, csv_file=None, csv_path=None, header='',
+                 split_rows=None, split_bytes=None, split_by=None):
+        self.csv_file = csv_file
+        self.csv_path = csv_path
+        self.header = header
+        self.split_rows = split_rows
+        self.split_bytes = split_bytes
+        self.split_by = split_by
+        self.paths = []
+        self.part_file = None
+        self.part_path = None
+        self.part_key = None
+        self.part_index = 0
+        self.key_counts = {}
+
+    def is_split(self):
+        return bool(self.split_rows or self.split_bytes or self.split_by)
+
+    def get_part_path(self, key):
+        if not self.is_split():
+            return self.csv_path
+        self.part_index += 1
+        path = self.csv_path
+        suffix = ''
+        if path.endswith('.gz'):
+            path, suffix = path[:-3], '.gz'
+        root, ext = os.path.splitext(path)
+        if self.split_by:
+            label = "%s_%s" % (self.split_by, key)
+            count = self.key_counts[key] = self.key_counts.get(key, 0) + 1
+            if count > 1:
+                label += "_%d" % count
+        else:
+            label = "part%04d" % self.part_index
+        return "%s.%s%s%s" % (root, label, ext, suffix)
+
+    def needs_new_part(self, key, num_rows):
+        if self.part_file is None:
+            return True
+        if self.split_by and key != self.part_key:
+            return True
+        if self.split_rows and self.part_rows > 0 and \
+           self.part_rows + num_rows > self.split_rows:
+            return True
+        if self.split_bytes and self.part_bytes >= self.split_bytes:
+            return True
+        return False
+
+    def open_part(self, key):
+        self.part_key = key
+        self.part_rows = 0
+        self.part_bytes = 0
+        if self.csv_path:
+            self.part_path = self.get_part_path(key)
+            self.part_file = open(self.part_path + '.tmp', 'wb')
+        else:
+            self.part_file = self.csv_file
+        self.part_file.write(self.header)
+        self.part_bytes += len(self.header)
+
+    def close_part(self):
+        if self.part_file is None:
+            return
+        if self.csv_path:
+            self.part_file.close()
+            if os.name == 'nt' and os.path.exists(self.part_path):
+                os.remove(self.part_path)
+            os.rename(self.part_path + '.tmp', self.part_path)
+            self.paths.append(self.part_path)
+        self.part_file = None
+
+    def write(self, key, num_rows, data):
+        if self.needs_new_part(key, num_rows):
+            self.close_part()
+            self.open_part(key)
+        self.part_file.write(data)
+        self.part_rows += num_rows
+        self.part_bytes += len(data)
+
+    def close(self):
+        # Write a header-only file if there were no rows.
+        if self.part_file is None and not self.paths:
+            self.open_part(None)
+        self.close_part()
+
+    def abort(self):
+        if self.part_file is not None and self.csv_path:
+            self.part_file.close()
+            if os.path.exists(self.part_path + '.tmp'):
+                os.remove(self.part_path + '.tmp')
+        self.part_file = None
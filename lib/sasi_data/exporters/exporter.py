@@ -0,0 +1,93 @@
+import logging
+from itertools import islice
+
+
+class Exporter(object):
+    """ Base class for exporters.
+    data can be a list, a dict with 'items' and an optional 'num_items',
+    or any iterable. SQLAlchemy queries are streamed with yield_per and
+    server-side cursors, rather than loaded all at once.
+    Mappings are strings, or dicts with 'source' and optional 'target',
+    'default' and 'processor' keys.
+    """
+    def __init__(self, data=None, mappings={}, logger=logging.getLogger(),
+                 chunk_size=1000, yield_per=1000, objects=None, **kwargs):
+        self.mappings = mappings
+        if data is None:
+            data = objects if objects is not None else []
+        self.data = data
+        self.logger = logger
+        self.chunk_size = int(chunk_size)
+        self.yield_per = yield_per
+
+        for i in range(len(self.mappings)):
+            if isinstance(self.mappings[i], str):
+                self.mappings[i] = {'source': self.mappings[i], 'target':
+                                    self.mappings[i]}
+            else:
+                self.mappings[i].setdefault('target',
+                                            self.mappings[i]['source'])
+
+    def compile_mappings(self, mappings):
+        """ Returns a function which converts a list of items to a list
+        of rows. """
+        namespace = {}
+        body = []
+        for i, mapping in enumerate(mappings):
+            body.append("v%s = getattr(item, %r, None)" % (
+                i, mapping['source']))
+            if mapping.get('default'):
+                namespace['_default_%s' % i] = mapping['default']
+                body.append("if v%s == None: v%s = _default_%s" % (i, i, i))
+            if mapping.get('processor'):
+                namespace['_processor_%s' % i] = mapping['processor']
+                body.append("v%s = _processor_%s(v%s)" % (i, i, i))
+        row = "[%s]" % ", ".join(["v%s" % i for i in range(len(mappings))])
+
+        lines = ["def convert_rows(items):"]
+        lines.append("    rows = []")
+        lines.append("    append_row = rows.append")
+        lines.append("    for item in items:")
+        lines.extend(["        " + line for line in body])
+        lines.append("        append_row(%s)" % row)
+        lines.append("    return rows")
+        code = compile("\n".join(lines) + "\n",
+                       "<%s mappings>" % self.__class__.__name__, 'exec')
+        exec(code, namespace)
+        return namespace['convert_rows']
+
+    def get_items(self):
+        """ Returns (items, num_items). num_items is None if the total
+        is unknown, e.g. for queries and generators. """
+        if isinstance(self.data, dict):
+            items = self.data.get('items')
+            num_items = self.data.get('num_items')
+        else:
+            items = self.data
+            num_items = None
+        if num_items is None and isinstance(items, (list, tuple)):
+            num_items = len(items)
+        if self.yield_per and hasattr(items, 'yield_per'):
+            if hasattr(items, 'execution_options'):
+                items = items.execution_options(stream_results=True)
+            items = items.yield_per(int(self.yield_per))
+        return items, num_items
+
+    def get_chunks(self, items, chunk_size=None):
+        chunk_size = int(chunk_size or self.chunk_size)
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, chunk_size))
+            if not chunk:
+                break
+            yield chunk
+
+    def get_fields(self):
+        return [mapping['target'] for mapping in self.mappings]
+
+    def log_progress(self, counter, num_items):
+        log_msg = "%d" % counter
+        if num_items:
+            log_msg += " of %d (%.1f%%)" % (
+                num_items, 1.0 * counter/num_items * 100)
+        self.logger.info(log_msg)
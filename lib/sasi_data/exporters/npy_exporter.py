@@ -0,0 +1,163 @@
+from sasi_data.exporters.exporter import Exporter
+from sasi_data.util.dictionary_encoding import DictionaryEncoding
+import numpy as np
+import json
+import logging
+import os
+import struct
+
+try:
+    from sqlalchemy.orm import class_mapper
+    from sqlalchemy.orm.exc import UnmappedClassError
+except ImportError:
+    class_mapper = None
+
+
+NPY_HEADER_SIZE = 128
+
+def write_npy_header(npy_file, dtype, num_rows):
+    """ Writes a version 1.0 .npy header for a 1-d array, padded to
+    NPY_HEADER_SIZE bytes so it can be rewritten in place. """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(np.dtype(dtype)), num_rows)
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + '\n'
+    npy_file.write('\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) +
+                   header)
+
+
+class NPY_Exporter(Exporter):
+    """ Writes items as typed column files, one .npy file per mapping,
+    plus a manifest.json. Column files can be loaded with numpy.load,
+    with mmap_mode for memory-mapping.
+    Mappings can have a 'dtype' (default 'f8'). Mappings with 'encode'
+    set are dictionary-encoded as int32 codes, with None as -1; their
+    dictionaries are written to the manifest. None values in integer
+    columns are written as -1, and in float columns as nan.
+    """
+
+    MANIFEST_FILE = 'manifest.json'
+
+    def __init__(self, output_dir=None, data=None, mappings={},
+                 logger=logging.getLogger(), chunk_size=1e4,
+                 yield_per=1e4, objects=None, **kwargs):
+        Exporter.__init__(self, data=data, mappings=mappings, logger=logger,
+                          chunk_size=chunk_size, yield_per=yield_per,
+                          objects=objects, **kwargs)
+        self.output_dir = output_dir
+        self.encodings = {}
+        self.dtypes = []
+        for mapping in self.mappings:
+            if mapping.get('encode'):
+                self.encodings[mapping['target']] = DictionaryEncoding()
+                self.dtypes.append(np.dtype('i4'))
+            else:
+                self.dtypes.append(np.dtype(mapping.get('dtype', 'f8')))
+        self.convert_rows = self.compile_mappings(self.mappings)
+
+    @classmethod
+    def get_result_attrs(clz, result_class):
+        """ Returns the table columns of a mapped class, e.g. a DAO's
+        SasiResult, or the public attributes of a new instance. """
+        if class_mapper is not None:
+            try:
+                return class_mapper(result_class).local_table.c.keys()
+            except UnmappedClassError:
+                pass
+        return [attr for attr in result_class().__dict__.keys()
+                if not attr.startswith('_')]
+
+    @classmethod
+    def get_result_mappings(clz, result_class=None, attrs=None):
+        """ Returns mappings for a SasiResult or FishingResult-like class,
+        or for a list of attrs, encoding string ids. """
+        if attrs is None:
+            attrs = clz.get_result_attrs(result_class)
+        mappings = []
+        for attr in attrs:
+            if attr in ['t', 'cell_id', 'id']:
+                mappings.append({'source': attr, 'dtype': 'i4'})
+            elif attr.endswith('_id'):
+                mappings.append({'source': attr, 'encode': True})
+            else:
+                mappings.append({'source': attr, 'dtype': 'f8'})
+        return sorted(mappings, key=lambda m: m['source'])
+
+    def get_column_path(self, mapping):
+        return os.path.join(self.output_dir, "%s.npy" % mapping['target'])
+
+    def export(self, log_interval=1000):
+        """ Writes all items. Returns the number of items written. """
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+        column_files = []
+        for mapping, dtype in zip(self.mappings, self.dtypes):
+            column_file = open(self.get_column_path(mapping), 'wb')
+            write_npy_header(column_file, dtype, 0)
+            column_files.append(column_file)
+
+        items, num_items = self.get_items()
+        counter = 0
+        try:
+            for chunk in self.get_chunks(items):
+                columns = zip(*self.convert_rows(chunk))
+                for i, mapping in enumerate(self.mappings):
+                    values = columns[i]
+                    encoding = self.encodings.get(mapping['target'])
+                    if encoding is not None:
+                        values = encoding.encode_many(values)
+                    elif self.dtypes[i].kind in 'iu':
+                        values = [-1 if v is None else v for v in values]
+                    np.array(values, dtype=self.dtypes[i]).tofile(
+                        column_files[i])
+                counter += len(chunk)
+                if (counter // log_interval) != (
+                    (counter - len(chunk)) // log_interval):
+                    self.log_progress(counter, num_items)
+
+            # Rewrite headers with the final shapes.
+            for column_file, dtype in zip(column_files, self.dtypes):
+                column_file.seek(0)
+                write_npy_header(column_file, dtype, counter)
+        finally:
+            for column_file in column_files:
+                column_file.close()
+
+        self.write_manifest(counter)
+        return counter
+
+    def write_manifest(self, num_rows):
+        manifest = {
+            'num_rows': num_rows,
+            'columns': [],
+            'encodings': {},
+        }
+        for mapping, dtype in zip(self.mappings, self.dtypes):
+            manifest['columns'].append({
+                'name': mapping['target'],
+                'file': os.path.basename(self.get_column_path(mapping)),
+                'dtype': np.lib.format.dtype_to_descr(dtype),
+                'encoded': mapping['target'] in self.encodings,
+            })
+        for name, encoding in self.encodings.items():
+            manifest['encodings'][name] = encoding.values
+        with open(os.path.join(self.output_dir, self.MANIFEST_FILE),
+                  'wb') as f:
+            json.dump(manifest, f, indent=2)
+
+
+def load_npy_export(output_dir, mmap_mode='r'):
+    """ Returns (columns, encodings) for an NPY_Exporter output dir.
+    columns is a dict of arrays, memory-mapped by default. """
+    with open(os.path.join(output_dir, NPY_Exporter.MANIFEST_FILE),
+              'rb') as f:
+        manifest = json.load(f)
+    # Empty files can't be memory-mapped.
+    if manifest['num_rows'] == 0:
+        mmap_mode = None
+    columns = {}
+    for column in manifest['columns']:
+        columns[column['name']] = np.load(
+            os.path.join(output_dir, column['file']), mmap_mode=mmap_mode)
+    encodings = dict([(name, DictionaryEncoding(values)) for name, values
+                      in manifest['encodings'].items()])
+    return columns, encodings
@@ -1,6 +1,10 @@
 import unittest
 from sasi_data.exporters import CSV_Exporter
 from StringIO import StringIO
+import gzip
+import os
+import shutil
+import tempfile
 
 
 class CSV_Ingestor_TestCase(unittest.TestCase):
@@ -33,6 +37,76 @@ class CSV_Ingestor_TestCase(unittest.TestCase):
             mappings=mappings
         )
         csv_exporter.export()
+        self.assertEquals(
+            csv_file.getvalue().splitlines(),
+            ['attr1_t,attr2', '0,attr2_0', '10,attr2_1', '20,attr2_2'])
+
+    def test_streaming_export(self):
+
+        class TestClass(object):
+            def __init__(self, attr1):
+                self.attr1 = attr1
+
+        def generate_objects():
+            for i in range(25):
+                yield TestClass(i)
+
+        csv_file = StringIO()
+        csv_exporter = CSV_Exporter(
+            csv_file=csv_file,
+            data=generate_objects(),
+            mappings=['attr1', {'source': 'missing', 'target': 'missing',
+                                'default': 'x'}],
+            chunk_size=10,
+        )
+        self.assertEquals(csv_exporter.export(log_interval=10), 25)
+        lines = csv_file.getvalue().splitlines()
+        self.assertEquals(len(lines), 26)
+        self.assertEquals(lines[-1], '24,x')
+
+    def test_compressed_split_export(self):
+
+        class TestClass(object):
+            def __init__(self, t, attr1):
+                self.t = t
+                self.attr1 = attr1
+
+        objects = [TestClass(t, i) for t in range(3) for i in range(5)]
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            csv_exporter = CSV_Exporter(
+                csv_file=os.path.join(tmp_dir, 'results.csv.gz'),
+                data=objects,
+                mappings=['t', 'attr1'],
+                chunk_size=2,
+                compress=True,
+                split_by='t',
+                workers=2,
+            )
+            self.assertEquals(csv_exporter.export(), 15)
+            self.assertEquals(
+                [os.path.basename(p) for p in csv_exporter.part_paths],
+                ['results.t_%s.csv.gz' % t for t in range(3)])
+            self.assertEquals(sorted(os.listdir(tmp_dir)),
+                              ['results.t_%s.csv.gz' % t for t in range(3)])
+            lines = gzip.open(csv_exporter.part_paths[1]).read().splitlines()
+            self.assertEquals(lines, ['t,attr1'] + 
+                              ['1,%s' % i for i in range(5)])
+
+            csv_exporter = CSV_Exporter(
+                csv_file=os.path.join(tmp_dir, 'rows.csv'),
+                data=objects,
+                mappings=['t', 'attr1'],
+                split_rows=4,
+            )
+            csv_exporter.export()
+            num_rows = [len(open(p).read().splitlines()) - 1
+                        for p in csv_exporter.part_paths]
+            self.assertEquals(num_rows, [4, 4, 4, 3])
+            self.assertEquals(os.path.basename(csv_exporter.part_paths[0]),
+                              'rows.part0001.csv')
+        finally:
+            shutil.rmtree(tmp_dir)
 
 if __name__ == '__main__':
     unittest.main()
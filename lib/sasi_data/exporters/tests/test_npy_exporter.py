@@ -0,0 +1,81 @@
+import unittest
+from sasi_data.exporters.npy_exporter import NPY_Exporter, load_npy_export
+from sasi_data.dao.sasi_sa_dao import SASI_SqlAlchemyDAO
+import sasi_data.models as models
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import numpy as np
+import shutil
+import tempfile
+
+
+class NPY_Exporter_TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_npy_exporter(self):
+        results = []
+        for i in range(25):
+            results.append(models.SasiResult(
+                t=i % 2, cell_id=i, gear_id='G%s' % (i % 3),
+                feature_category_id=None, a=i * 1.5, znet=None))
+
+        npy_exporter = NPY_Exporter(
+            output_dir=self.output_dir,
+            data=iter(results),
+            mappings=NPY_Exporter.get_result_mappings(models.SasiResult),
+            chunk_size=10,
+        )
+        self.assertEquals(npy_exporter.export(), 25)
+
+        columns, encodings = load_npy_export(self.output_dir)
+        self.assertEquals(columns['cell_id'].dtype, np.dtype('i4'))
+        self.assertEquals(columns['cell_id'].tolist(), range(25))
+        self.assertEquals(columns['a'].tolist(), [i * 1.5 for i in range(25)])
+        self.assertTrue(np.isnan(columns['znet']).all())
+        self.assertEquals(columns['feature_category_id'].tolist(), [-1] * 25)
+        self.assertEquals(
+            encodings['gear_id'].decode_many(columns['gear_id']),
+            [r.gear_id for r in results])
+
+    def test_dao_export(self):
+        session = sessionmaker()(bind=create_engine('sqlite://'))
+        dao = SASI_SqlAlchemyDAO(session=session)
+        result_class = dao.schema['sources']['SasiResult']
+        for i in range(5):
+            dao.save(result_class(t=0, cell_id=i, gear_id='G%s' % (i % 2),
+                                  a=i * 2.0), commit=False)
+        dao.commit()
+
+        mappings = NPY_Exporter.get_result_mappings(result_class)
+        self.assertEquals(
+            [m['source'] for m in mappings],
+            ['a', 'cell_id', 'energy_id', 'feature_category_id',
+             'feature_id', 'gear_id', 'id', 'substrate_id', 't', 'x', 'y',
+             'z', 'znet'])
+        npy_exporter = NPY_Exporter(
+            output_dir=self.output_dir,
+            data=dao.query('__SasiResult'),
+            mappings=mappings,
+        )
+        self.assertEquals(npy_exporter.export(), 5)
+        columns, encodings = load_npy_export(self.output_dir)
+        self.assertEquals(sorted(columns['a'].tolist()),
+                          [i * 2.0 for i in range(5)])
+        self.assertEquals(
+            sorted(encodings['gear_id'].decode_many(columns['gear_id'])),
+            ['G0', 'G0', 'G0', 'G1', 'G1'])
+
+    def test_empty_export(self):
+        npy_exporter = NPY_Exporter(output_dir=self.output_dir, data=[],
+                                    mappings=['a'])
+        self.assertEquals(npy_exporter.export(), 0)
+        columns, encodings = load_npy_export(self.output_dir)
+        self.assertEquals(columns['a'].shape, (0,))
+
+if __name__ == '__main__':
+    unittest.main()
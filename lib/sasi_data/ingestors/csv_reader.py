@@ -1,13 +1,27 @@
 import csv
+import os
 
 
 class CSVReader(object):
+    """ Reads records from a csv file path or file object.
+    total_bytes can be given for file objects which can't report their
+    size, e.g. zip archive members, so that progress can be reported.
+    If start_offset is given, the header is read, and reading continues
+    from that byte offset, e.g. a bytes_read value from an earlier read.
+    """
     def __init__(self, csv_file=None, as_unicode=True, encoding='utf-8',
-                 **kwargs):
+                 total_bytes=None, start_offset=None, **kwargs):
         self.csv_file = csv_file
         self.csv_fh = self.get_csv_fh()
         self.as_unicode = as_unicode
         self.encoding = encoding
+        self.bytes_read = 0
+        if total_bytes is None:
+            total_bytes = self.get_total_bytes()
+        self.total_bytes = total_bytes
+        self.fieldnames = None
+        if start_offset:
+            self.skip_to(start_offset)
 
     def get_csv_fh(self):
         if isinstance(self.csv_file, str) or isinstance(self.csv_file, unicode):
@@ -15,8 +29,43 @@ class CSVReader(object):
         else:
             return self.csv_file
 
+    def get_total_bytes(self):
+        """ Number of bytes left to read, or None if unknown. """
+        try:
+            pos = self.csv_fh.tell()
+            if hasattr(self.csv_fh, 'fileno'):
+                return os.fstat(self.csv_fh.fileno()).st_size - pos
+            self.csv_fh.seek(0, os.SEEK_END)
+            end = self.csv_fh.tell()
+            self.csv_fh.seek(pos)
+            return end - pos
+        except Exception:
+            return None
+
+    def skip_to(self, offset):
+        header = self.csv_fh.readline()
+        self.fieldnames = csv.reader([header]).next()
+        try:
+            self.csv_fh.seek(offset)
+        except (AttributeError, IOError, ValueError):
+            # Not seekable, e.g. a zip member, so read up to the offset.
+            remaining = offset - len(header)
+            while remaining > 0:
+                chunk = self.csv_fh.read(min(remaining, 2**20))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+        self.bytes_read = offset
+
+    def get_lines(self):
+        """ Iterate over raw lines, keeping track of bytes read. """
+        for line in self.csv_fh:
+            self.bytes_read += len(line)
+            yield line
+
     def get_records(self):
-        for row in csv.DictReader(self.csv_fh):
+        for row in csv.DictReader(self.get_lines(),
+                                  fieldnames=self.fieldnames):
             if self.as_unicode:
                 yield dict([(key, unicode(value, 'utf-8')) for key, value in row.iteritems()])
             else:
@@ -26,10 +75,16 @@ class CSVReader(object):
         size = 0
         for r in csv.DictReader(self.csv_fh):
             size += 1
-            if limit is not None and (size % limit) == 0:
+            if limit is not None and size >= limit:
                 break
         self.csv_fh.seek(0)
         return size
 
+    def get_progress(self):
+        """ Fraction of the file read so far, or None if unknown. """
+        if self.total_bytes:
+            return 1.0 * self.bytes_read/self.total_bytes
+        return None
+
     def close(self):
         self.csv_fh.close()
@@ -1,14 +1,95 @@
 from sasi_data.ingestors.processor import Processor
 
 
+def crosses_interval(counter, num_records, interval, total=None):
+    """ True if a batch of num_records ending at counter reaches
+    a multiple of interval, or the total. """
+    if not interval:
+        return False
+    if counter == total:
+        return True
+    return (counter // interval) != ((counter - num_records) // interval)
+
+
 class DAOWriter(Processor):
-    def __init__(self, dao=None, commit_interval=None, **kwargs):
+    """ Saves objects via the DAO, committing every commit_interval
+    records. If on_commit is given, it is called with the counter
+    before each commit, e.g. to save progress in the same transaction.
+    """
+    def __init__(self, dao=None, commit_interval=None, on_commit=None,
+                 **kwargs):
         Processor.__init__(self, **kwargs)
         self.dao = dao
         self.commit_interval = commit_interval
+        self.on_commit = on_commit
 
     def process(self, data=None, counter=None, total=None, **kwargs):
         self.dao.save(data, commit=False)
         if self.commit_interval:
             if (counter % self.commit_interval) == 0 or counter == total:
-                self.dao.commit()
+                self.commit(counter)
+        return data
+
+    def process_batch(self, records=None, counter=None, total=None,
+                      **kwargs):
+        for data in records:
+            self.dao.save(data, commit=False)
+        if crosses_interval(counter, len(records), self.commit_interval,
+                            total):
+            self.commit(counter)
+        return records
+
+    def commit(self, counter):
+        if self.on_commit:
+            self.on_commit(counter)
+        self.dao.commit()
+
+class BulkDAOWriter(Processor):
+    """ Writes plain dicts in batches via the DAO's save_dicts,
+    which sends them through SQLAlchemy Core executemany, without
+    creating ORM instances. Call finish() to write the last batch.
+    on_commit is called as for DAOWriter.
+    """
+    def __init__(self, dao=None, source=None, batch_size=1e4, 
+                 commit_interval=None, on_commit=None, **kwargs):
+        Processor.__init__(self, **kwargs)
+        self.dao = dao
+        self.source = source
+        self.batch_size = int(batch_size)
+        self.commit_interval = commit_interval
+        self.on_commit = on_commit
+        self.batch = []
+
+    def process(self, data=None, counter=None, total=None, **kwargs):
+        self.batch.append(data)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+        if self.commit_interval:
+            if (counter % self.commit_interval) == 0 or counter == total:
+                self.commit(counter)
+        return data
+
+    def process_batch(self, records=None, counter=None, total=None,
+                      **kwargs):
+        self.batch.extend(records)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+        if crosses_interval(counter, len(records), self.commit_interval,
+                            total):
+            self.commit(counter)
+        return records
+
+    def commit(self, counter):
+        self.flush()
+        if self.on_commit:
+            self.on_commit(counter)
+        self.dao.commit()
+
+    def flush(self):
+        if self.batch:
+            self.dao.save_dicts(self.source, self.batch,
+                                batch_size=self.batch_size, commit=False)
+            self.batch = []
+
+    def finish(self):
+        self.flush()
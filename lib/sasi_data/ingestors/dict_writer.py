@@ -10,3 +10,10 @@ class DictWriter(Processor):
     def process(self, data=None, counter=None, total=None, **kwargs):
         key = self.key_func(data)
         self.dict_[key] = data
+        return data
+
+    def process_batch(self, records=None, counter=None, total=None,
+                      **kwargs):
+        key_func = self.key_func
+        self.dict_.update((key_func(data), data) for data in records)
+        return records
@@ -1,46 +1,143 @@
+from sasi_data.ingestors.processor import (get_batch_processor,
+                                           get_record_processor,
+                                           get_processor_name)
+from itertools import islice
 import logging
+import time
 
 
 class Ingestor(object):
+    """ Sends records from a reader through a chain of processors.
+    If count_records is False, the reader is not pre-scanned to count
+    records. Progress is then reported from size_hint, or from the
+    reader's get_progress() if it has one.
+    If batch_size is set, records are read in chunks, and lists of
+    records are passed through the processors' process_batch methods.
+    After ingest, counter is the number of records read.
+    If metrics is given, e.g. a section from an IngestMetrics, the time
+    spent in the reader and in each processor is added to it.
+    """
     def __init__(self, reader=None, processors=[], logger=logging.getLogger(),
-                 limit=None, log_interval=1000, **kwargs):
+                 limit=None, log_interval=1000, count_records=True,
+                 size_hint=None, batch_size=None, metrics=None, **kwargs):
         self.logger = logger
         self.reader = reader
         self.processors = processors
         self.limit = limit
         self.log_interval = log_interval
+        self.count_records = count_records
+        self.size_hint = size_hint
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.counter = 0
 
     def ingest(self):
+        if self.metrics:
+            self.metrics.start()
+        try:
+            num_records = self.get_num_records()
+            if self.batch_size:
+                self.counter = self.ingest_batches(num_records)
+            else:
+                self.counter = self.ingest_records(num_records)
+
+            # Let processors write out any buffered data.
+            for processor in self.processors:
+                if hasattr(processor, 'finish'):
+                    finish = processor.finish
+                    if self.metrics:
+                        finish = self.metrics.timed(
+                            finish, get_processor_name(processor))
+                    finish()
+
+            self.reader.close()
+        finally:
+            if self.metrics:
+                self.metrics.add_records(self.counter)
+                self.metrics.stop()
+
+    def get_processor_funcs(self, get_processor):
+        """ Get processing functions, timed if there are metrics. """
+        funcs = [get_processor(p) for p in self.processors]
+        if self.metrics:
+            funcs = [self.metrics.timed(func, get_processor_name(p))
+                     for func, p in zip(funcs, self.processors)]
+        return funcs
+
+    def ingest_records(self, num_records):
         counter = 0
-        self.logger.info("Counting total number of records...")
-        num_records = self.reader.get_size(limit=self.limit)
-        self.logger.info("%s total records." % num_records)
-        if self.limit is not None:
-            self.logger.info("Limiting to %s records" % self.limit)
-            num_records = min(num_records, self.limit)
-        for record in self.reader.get_records():
+        # Processor can be processor obj, or function.
+        processors = self.get_processor_funcs(get_record_processor)
+        records = self.reader.get_records()
+        if self.metrics:
+            records = self.metrics.timed_iter(
+                records, get_processor_name(self.reader))
+        for record in records:
             counter += 1
             if (counter % self.log_interval) == 0:
-                log_msg = "%d" % counter
-                if num_records:
-                    log_msg += " of %d (%.1f%%)" % (
-                        num_records, 1.0 * counter/num_records* 100)
-                self.logger.info(log_msg)
+                self.log_progress(counter, num_records)
 
             # Send record through processor chain,
             # passing previous result to next item in the chain.
             data = record
-            for processor in self.processors:
-                # Processor can be processor obj, or function.
-                if hasattr(processor, 'process'):
-                    data = processor.process(data=data, counter=counter,
-                                             total=num_records)
-                else:
-                    data = processor(data=data, counter=counter, 
-                                     total=num_records)
+            for process in processors:
+                data = process(data=data, counter=counter, total=num_records)
             data = None
 
-            if counter >= num_records:
+            if self.limit is not None and counter >= self.limit:
                 break
+        return counter
+
+    def ingest_batches(self, num_records):
+        counter = 0
+        processors = self.get_processor_funcs(get_batch_processor)
+        records = iter(self.reader.get_records())
+        while True:
+            batch_size = int(self.batch_size)
+            if self.limit is not None:
+                batch_size = min(batch_size, self.limit - counter)
+            if batch_size <= 0:
+                break
+            start = time.time()
+            batch = list(islice(records, batch_size))
+            if self.metrics:
+                self.metrics.add_time(get_processor_name(self.reader),
+                                      time.time() - start)
+            if not batch:
+                break
+            counter += len(batch)
+            if (counter // self.log_interval) != (
+                (counter - len(batch)) // self.log_interval):
+                self.log_progress(counter, num_records)
+
+            data = batch
+            for process_batch in processors:
+                data = process_batch(records=data, counter=counter,
+                                     total=num_records)
+            data = None
+            batch = None
+        return counter
+
+    def get_num_records(self):
+        if self.count_records:
+            self.logger.info("Counting total number of records...")
+            num_records = self.reader.get_size(limit=self.limit)
+            self.logger.info("%s total records." % num_records)
+        else:
+            num_records = self.size_hint
+        if self.limit is not None:
+            self.logger.info("Limiting to %s records" % self.limit)
+            if num_records is not None:
+                num_records = min(num_records, self.limit)
+        return num_records
 
-        self.reader.close()
+    def log_progress(self, counter, num_records):
+        log_msg = "%d" % counter
+        if num_records:
+            log_msg += " of %d (%.1f%%)" % (
+                num_records, 1.0 * counter/num_records* 100)
+        elif hasattr(self.reader, 'get_progress'):
+            progress = self.reader.get_progress()
+            if progress is not None:
+                log_msg += " (%.1f%% of input read)" % (progress * 100)
+        self.logger.info(log_msg)
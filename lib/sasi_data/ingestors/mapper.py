@@ -1,10 +1,22 @@
 from sasi_data.ingestors.processor import Processor
+import keyword
+import re
 
 
 class Mapper(Processor):
+    """ Maps source records to targets.
+    Mappings are compiled once, into a function that converts a single
+    record (convert) and one that converts a list of records
+    (convert_batch).
+    Subclasses can compile inline statements for initialize_target and
+    set_target_attr. These are only used if those methods have not
+    been overridden further.
+    """
     def __init__(self, mappings=[], **kwargs):
         Processor.__init__(self, **kwargs)
         self.mappings = self.prepare_mappings(mappings)
+        self.convert, self.convert_batch = self.compile_mappings(
+            self.mappings)
 
     def prepare_mappings(self, mappings=[]):
         prepared_mappings = []
@@ -18,18 +30,60 @@ class Mapper(Processor):
             prepared_mappings.append(prepared_mapping)
         return prepared_mappings
 
+    def compile_mappings(self, mappings=[]):
+        namespace = {}
+        body = [self.compile_initialize_target(namespace)]
+        for i, mapping in enumerate(mappings):
+            body.append("value = data.get(%r)" % mapping['source'])
+            if mapping.get('default'):
+                namespace['_default_%s' % i] = mapping['default']
+                body.append("if value == None: value = _default_%s" % i)
+            if mapping.get('processor'):
+                namespace['_processor_%s' % i] = mapping['processor']
+                body.append("value = _processor_%s(value)" % i)
+            body.append(self.compile_set_target_attr(
+                mapping['target'], namespace))
+
+        lines = ["def convert(data, counter=None):"]
+        lines.extend(["    " + line for line in body])
+        lines.append("    return target")
+        # counter is the counter of the last record in the batch, so
+        # step it through the batch to give each record its own counter.
+        lines.append("def convert_batch(records, counter=None):")
+        lines.append("    targets = []")
+        lines.append("    append_target = targets.append")
+        lines.append("    if counter is not None: counter -= len(records)")
+        lines.append("    for data in records:")
+        lines.append("        if counter is not None: counter += 1")
+        lines.extend(["        " + line for line in body])
+        lines.append("        append_target(target)")
+        lines.append("    return targets")
+        code = compile("\n".join(lines) + "\n", 
+                       "<%s mappings>" % self.__class__.__name__, 'exec')
+        exec(code, namespace)
+        return namespace['convert'], namespace['convert_batch']
+
+    def compile_initialize_target(self, namespace):
+        """ Returns source for a statement that assigns 'target'. """
+        namespace['_initialize_target'] = self.initialize_target
+        return "target = _initialize_target(data, counter)"
+
+    def compile_set_target_attr(self, attr, namespace):
+        """ Returns source for a statement that sets attr on 'target'
+        to 'value'. """
+        namespace['_set_target_attr'] = self.set_target_attr
+        return "_set_target_attr(target, %r, value)" % attr
+
+    def is_overridden(self, method_name, clz):
+        """ True if method_name is not clz's implementation. """
+        return getattr(self, method_name).im_func is not \
+                getattr(clz, method_name).im_func
+
     def process(self, data={}, counter=None, **kwargs):
-        target = self.initialize_target(data, counter)
-        for mapping in self.mappings:
-            raw_value = data.get(mapping['source'])
-            if raw_value == None and mapping.get('default'):
-                raw_value = mapping['default']
-            processor = mapping.get('processor')
-            value = raw_value
-            if processor:
-                value = processor(value)
-            self.set_target_attr(target, mapping['target'], value)
-        return target
+        return self.convert(data, counter)
+
+    def process_batch(self, records=None, counter=None, **kwargs):
+        return self.convert_batch(records, counter)
 
     def initialize_target(self, data, counter):
         pass
@@ -38,15 +92,34 @@ class Mapper(Processor):
 
 class ClassMapper(Mapper):
     def __init__(self, clazz=None, **kwargs):
-        Mapper.__init__(self, **kwargs)
         self.clazz = clazz
+        Mapper.__init__(self, **kwargs)
     def initialize_target(self, data, counter):
         return self.clazz()
     def set_target_attr(self, target,attr, value):
         setattr(target, attr, value)
+    def compile_initialize_target(self, namespace):
+        if self.is_overridden('initialize_target', ClassMapper):
+            return Mapper.compile_initialize_target(self, namespace)
+        namespace['_clazz'] = self.clazz
+        return "target = _clazz()"
+    def compile_set_target_attr(self, attr, namespace):
+        if self.is_overridden('set_target_attr', ClassMapper):
+            return Mapper.compile_set_target_attr(self, attr, namespace)
+        if re.match(r'^[A-Za-z_]\w*$', attr) and not keyword.iskeyword(attr):
+            return "target.%s = value" % attr
+        return "setattr(target, %r, value)" % attr
 
 class DictMapper(Mapper):
     def initialize_target(self, data, counter):
         return {}
     def set_target_attr(self, target, attr, value):
-        target.set(attr, value)
+        target[attr] = value
+    def compile_initialize_target(self, namespace):
+        if self.is_overridden('initialize_target', DictMapper):
+            return Mapper.compile_initialize_target(self, namespace)
+        return "target = {}"
+    def compile_set_target_attr(self, attr, namespace):
+        if self.is_overridden('set_target_attr', DictMapper):
+            return Mapper.compile_set_target_attr(self, attr, namespace)
+        return "target[%r] = value" % attr
@@ -0,0 +1,218 @@
+from contextlib import contextmanager
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from sqlalchemy import event
+except ImportError:
+    event = None
+
+
+def get_max_rss():
+    """ Peak resident set size of this process in KB, or None if it
+    is not available, e.g. on Jython or Windows. Child processes,
+    such as overlay workers, are not included. """
+    if resource is None:
+        return None
+    try:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except Exception:
+        return None
+    # ru_maxrss is in bytes on OS X, and KB elsewhere.
+    if sys.platform == 'darwin':
+        max_rss = max_rss / 1024
+    return max_rss
+
+
+class SectionMetrics(object):
+    """ Timings for one phase of an ingest, e.g. a CSV section.
+    A section can be started several times, e.g. once per grid tile,
+    and its times are summed. Nested starts of the same section are
+    only timed once. """
+    def __init__(self, name=None, parent=None):
+        self.name = name
+        self.parent = parent
+        self.wall_time = 0.0
+        self.records = 0
+        self.commit_time = 0.0
+        self.num_commits = 0
+        self.max_rss_delta = None
+        self.timings = {}
+        self.timing_names = []
+        self.depth = 0
+        self.start_time = None
+        self.start_rss = None
+
+    def start(self):
+        self.depth += 1
+        if self.depth > 1:
+            return
+        self.start_time = time.time()
+        self.start_rss = get_max_rss()
+        if self.parent:
+            self.parent.current.append(self)
+
+    def stop(self):
+        self.depth -= 1
+        if self.depth > 0:
+            return
+        self.wall_time += time.time() - self.start_time
+        end_rss = get_max_rss()
+        if end_rss is not None and self.start_rss is not None:
+            self.max_rss_delta = max(self.max_rss_delta,
+                                     end_rss - self.start_rss)
+        if self.parent and self in self.parent.current:
+            self.parent.current.remove(self)
+
+    def add_records(self, num_records):
+        self.records += num_records
+
+    def add_time(self, name, seconds, calls=1):
+        if name not in self.timings:
+            self.timings[name] = {'time': 0.0, 'calls': 0}
+            self.timing_names.append(name)
+        self.timings[name]['time'] += seconds
+        self.timings[name]['calls'] += calls
+
+    def add_commit(self, seconds):
+        self.commit_time += seconds
+        self.num_commits += 1
+
+    def timed(self, func, name):
+        """ Returns a wrapper for func which adds its run time to the
+        timing for name. """
+        def timed_func(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add_time(name, time.time() - start)
+        return timed_func
+
+    def timed_iter(self, iterable, name):
+        """ Yields items from iterable, adding the time spent getting
+        them to the timing for name. """
+        iterator = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = iterator.next()
+            except StopIteration:
+                self.add_time(name, time.time() - start, calls=0)
+                return
+            self.add_time(name, time.time() - start)
+            yield item
+
+    def get_records_per_sec(self):
+        if self.wall_time > 0:
+            return self.records / self.wall_time
+        return None
+
+    def to_dict(self):
+        return {
+            'section': self.name,
+            'wall_time': self.wall_time,
+            'records': self.records,
+            'records_per_sec': self.get_records_per_sec(),
+            'max_rss_delta_kb': self.max_rss_delta,
+            'commit_time': self.commit_time,
+            'num_commits': self.num_commits,
+            'timings': [
+                dict(name=name, **self.timings[name])
+                for name in self.timing_names
+            ],
+        }
+
+
+class IngestMetrics(object):
+    """ Collects per-section timings for an ingest.
+    Sections are created with get_section, and timed with the section
+    context manager, or by passing them to an Ingestor as its metrics.
+    If a session is watched, commit times are added to the innermost
+    running section, and to the totals.
+    """
+    def __init__(self):
+        self.sections = []
+        self.sections_by_name = {}
+        self.current = []
+        self.totals = SectionMetrics(name='ingest')
+        self.commit_start = None
+
+    def get_section(self, name):
+        if name not in self.sections_by_name:
+            section = SectionMetrics(name=name, parent=self)
+            self.sections.append(section)
+            self.sections_by_name[name] = section
+        return self.sections_by_name[name]
+
+    @contextmanager
+    def section(self, name):
+        section = self.get_section(name)
+        section.start()
+        try:
+            yield section
+        finally:
+            section.stop()
+
+    def start(self):
+        self.totals.start()
+
+    def stop(self):
+        self.totals.stop()
+        self.totals.records = sum([s.records for s in self.sections])
+
+    def watch_session(self, session):
+        """ Times commits on a SQLAlchemy session. """
+        if event is None:
+            return
+        event.listen(session, 'before_commit', self.on_before_commit)
+        event.listen(session, 'after_commit', self.on_after_commit)
+
+    def unwatch_session(self, session):
+        if event is None or not hasattr(event, 'remove'):
+            return
+        event.remove(session, 'before_commit', self.on_before_commit)
+        event.remove(session, 'after_commit', self.on_after_commit)
+
+    def on_before_commit(self, session):
+        self.commit_start = time.time()
+
+    def on_after_commit(self, session):
+        if self.commit_start is None:
+            return
+        seconds = time.time() - self.commit_start
+        self.commit_start = None
+        self.totals.add_commit(seconds)
+        if self.current:
+            self.current[-1].add_commit(seconds)
+
+    def get_report(self):
+        report = self.totals.to_dict()
+        del report['section']
+        del report['timings']
+        report['max_rss_kb'] = get_max_rss()
+        report['sections'] = [section.to_dict() for section in self.sections]
+        return report
+
+    def write_report(self, report_file):
+        with open(report_file, 'wb') as f:
+            json.dump(self.get_report(), f, indent=2)
+
+    def log_summary(self, logger):
+        for section in self.sections:
+            msg = "'%s': %.2fs" % (section.name, section.wall_time)
+            if section.records:
+                msg += ", %d records" % section.records
+                records_per_sec = section.get_records_per_sec()
+                if records_per_sec:
+                    msg += " (%.0f/s)" % records_per_sec
+            if section.num_commits:
+                msg += ", %.2fs in %d commits" % (section.commit_time,
+                                                  section.num_commits)
+            logger.info(msg)
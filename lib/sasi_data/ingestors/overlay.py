@@ -0,0 +1,78 @@
+""" Functions for computing cell habitat compositions.
+These are module-level so that they can be run in worker processes.
+"""
+import sasi_data.util.gis as gis_util
+from collections import namedtuple
+from math import floor
+
+
+OverlayHabitat = namedtuple('OverlayHabitat', 
+                            ['id', 'substrate_id', 'energy_id', 'depth',
+                             'area', 'shape', 'mbr'])
+
+def mbrs_intersect(mbr1, mbr2):
+    return (mbr1[0] <= mbr2[2] and mbr2[0] <= mbr1[2] and
+            mbr1[1] <= mbr2[3] and mbr2[1] <= mbr1[3])
+
+def compute_cell_composition(cell_shape, cell_area, habs, area_crs=None,
+                             projected=False, cell_mbr=None):
+    """ Returns (composition, depth) for a cell.
+    habs should be sorted, so that results do not depend on the
+    order in which candidates were found.
+    If projected is True, shapes are assumed to already be in area_crs.
+    Habitats whose mbrs do not overlap cell_mbr are skipped.
+    """
+    composition = {}
+    depth = 0
+    prepared_cell = gis_util.prepare_shape(cell_shape)
+    for hab in habs:
+        if cell_mbr is not None and not mbrs_intersect(cell_mbr, hab.mbr):
+            continue
+        if not prepared_cell.intersects(hab.shape):
+            continue
+        # Use known areas when one shape covers the other.
+        if prepared_cell.within(hab.shape):
+            intersection_area = cell_area
+        elif prepared_cell.contains(hab.shape):
+            intersection_area = hab.area
+        else:
+            intersection = gis_util.get_intersection(cell_shape, hab.shape)
+            if not intersection:
+                continue
+            if projected:
+                intersection_area = intersection.area
+            else:
+                intersection_area = gis_util.get_shape_area(
+                    intersection,
+                    target_crs=area_crs,
+                )
+        hab_key = (hab.substrate_id, hab.energy_id,)
+        pct_area = intersection_area/cell_area
+        composition[hab_key] = composition.get(hab_key, 0) + pct_area
+        depth += pct_area * hab.depth
+    return composition, depth
+
+def get_tile_key(mbr, tile_size):
+    return (int(floor(mbr[0]/tile_size)), int(floor(mbr[1]/tile_size)))
+
+def compute_tile_compositions(tile):
+    """ Computes compositions for the cells in a tile.
+    tile is a dict with 'cells' as (id, wkb, area, mbr) tuples,
+    'habs' as (id, substrate_id, energy_id, depth, area, wkb, mbr) tuples,
+    'area_crs', and 'projected'.
+    Returns a list of (cell_id, composition, depth) tuples.
+    """
+    habs = []
+    for hab_id, substrate_id, energy_id, depth, area, wkb, mbr in tile['habs']:
+        habs.append(OverlayHabitat(hab_id, substrate_id, energy_id, depth,
+                                   area, gis_util.wkb_to_shape(wkb), mbr))
+    habs.sort(key=lambda hab: hab.id)
+
+    results = []
+    for cell_id, wkb, area, mbr in tile['cells']:
+        composition, depth = compute_cell_composition(
+            gis_util.wkb_to_shape(wkb), area, habs,
+            area_crs=tile['area_crs'], projected=tile['projected'],
+            cell_mbr=mbr)
+        results.append((cell_id, composition, depth))
+    return results
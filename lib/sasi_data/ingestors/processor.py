@@ -2,9 +2,49 @@ class Processor(object):
     """ A Processor is one item in a possible chain of processors.
     Each processor receives data as input, and returns a result
     that is passed to the next processor.
+    Processors can also implement process_batch, which receives and
+    returns a list of records. By default it calls process for each
+    record.
     In the future, processors could be keyed with ids to allow for
     more complex handling, but that seems too complicated for right
     now.
     """
-    def process(data=None, counter=None, total=None, **kwargs):
+    def process(self, data=None, counter=None, total=None, **kwargs):
         pass
+
+    def process_batch(self, records=None, counter=None, total=None, 
+                      **kwargs):
+        """ counter is the counter of the last record in the batch. """
+        return process_records(self.process, records, counter, total)
+
+def process_records(process, records, counter, total):
+    """ Calls process for each record, with per-record counters. """
+    start = counter - len(records)
+    return [process(data=data, counter=start + i + 1, total=total)
+            for i, data in enumerate(records)]
+
+def get_batch_processor(processor):
+    """ Get a batch processing function for a processor obj or 
+    function. """
+    if hasattr(processor, 'process_batch'):
+        return processor.process_batch
+    elif hasattr(processor, 'process'):
+        process = processor.process
+    else:
+        process = processor
+    def process_batch(records=None, counter=None, total=None, **kwargs):
+        return process_records(process, records, counter, total)
+    return process_batch
+
+def get_processor_name(processor):
+    """ Name of a processor obj or function, for reporting. """
+    if hasattr(processor, '__name__'):
+        return processor.__name__
+    return processor.__class__.__name__
+
+def get_record_processor(processor):
+    """ Get a record processing function for a processor obj or
+    function. """
+    if hasattr(processor, 'process'):
+        return processor.process
+    return processor
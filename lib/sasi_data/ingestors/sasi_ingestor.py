@@ -1,13 +1,23 @@
 from sasi_data.ingestors.ingestor import Ingestor
+from sasi_data.ingestors.metrics import IngestMetrics
 from sasi_data.ingestors.csv_reader import CSVReader
 from sasi_data.ingestors.shapefile_reader import ShapefileReader
-from sasi_data.ingestors.dao_writer import DAOWriter 
+from sasi_data.ingestors.dao_writer import DAOWriter, BulkDAOWriter
 from sasi_data.ingestors.dict_writer import DictWriter 
-from sasi_data.ingestors.mapper import ClassMapper
+from sasi_data.ingestors.mapper import ClassMapper, DictMapper
+from sasi_data.ingestors.processor import Processor
+from sasi_data.ingestors import overlay
+from sasi_data import validation
 import sasi_data.util.gis as gis_util
+import sasi_data.util.shapefile as shapefile_util
+from sasi_data.util.data_source import get_data_source
+from sasi_data.util.overlay_cache import OverlayCache
 from sasi_data.util.spatial_hash import SpatialHash
+from sasi_data.util.str_tree import STRTree
 from sqlalchemy.sql import select
 from sqlalchemy.sql.expression import literal_column
+from multiprocessing import Pool
+import platform
 import os
 import csv
 import logging
@@ -45,17 +55,139 @@ def parse_bool(v):
     except:
         return False
 
+class AreaMbrProcessor(Processor):
+    """ Adds area and mbr attributes to geom entities.
+    If projected is True, shapes are assumed to already be in
+    area_crs. """
+    def __init__(self, area_crs=None, projected=False, **kwargs):
+        Processor.__init__(self, **kwargs)
+        self.area_crs = area_crs
+        self.projected = projected
+
+    def process(self, data=None, **kwargs):
+        if self.projected:
+            data.area = data.shape.area
+        else:
+            data.area = gis_util.get_shape_area(
+                data.shape, target_crs=self.area_crs)
+        data.mbr = gis_util.get_shape_mbr(data.shape)
+        return data
+
+    def process_batch(self, records=None, **kwargs):
+        get_shape_area = gis_util.get_shape_area
+        get_shape_mbr = gis_util.get_shape_mbr
+        area_crs = self.area_crs
+        for data in records:
+            if self.projected:
+                data.area = data.shape.area
+            else:
+                data.area = get_shape_area(data.shape, target_crs=area_crs)
+            data.mbr = get_shape_mbr(data.shape)
+        return records
+
 class SASI_Ingestor(object):
     def __init__(self, data_dir=None, dao=None, logger=logging.getLogger(),
                  config={}, hash_cell_size=.1, **kwargs):
+        """ data_dir can be a directory, or a zip archive of one. """
         self.data_dir = data_dir
+        self.data_source = get_data_source(data_dir)
+        self.grid_path = os.path.join('grid', 'grid.shp')
+        self.habs_path = os.path.join('habitats', 'habitats.shp')
         self.dao = dao
         self.logger = logger
         self.hash_cell_size = hash_cell_size
         self.config = config
         self.commit_interval = config.get('commit_interval', 1e4)
-
-    def ingest(self):
+        self.bulk_insert = config.get('bulk_insert', True)
+        self.batch_size = config.get('batch_size', 1e4)
+        # Number of processes for computing cell compositions.
+        self.overlay_workers = config.get('overlay_workers', 1)
+        # Size of the tiles that cells are sharded into, in degrees.
+        self.overlay_tile_size = config.get('overlay_tile_size', 1.0)
+        # Spatial index for habitats: 'hash' or 'str'.
+        self.spatial_index = config.get('spatial_index', 'hash')
+        # If true, reproject geometries once, directly into the model's
+        # projection, and do area and overlay calculations there.
+        self.reproject_once = config.get('reproject_once', False)
+        # Projected units per degree, for scaling index cell and tile
+        # sizes when reprojecting once. Default assumes meters.
+        self.projected_units_per_degree = config.get(
+            'projected_units_per_degree', 111320.0)
+        # If set, process the grid in square tiles of this size, in the
+        # grid shapefile's CRS units, to bound memory use.
+        self.grid_tile_size = config.get('grid_tile_size')
+        # If true, section fingerprints include hashes of file contents,
+        # rather than just file sizes and modification times.
+        self.fingerprint_contents = config.get('fingerprint_contents', False)
+        # On-disk cache of cell compositions, shared across ingests.
+        self.overlay_cache = None
+        if config.get('overlay_cache_dir'):
+            self.overlay_cache = OverlayCache(
+                cache_dir=config['overlay_cache_dir'],
+                max_age=config.get('overlay_cache_max_age'),
+                max_size=config.get('overlay_cache_max_size'),
+            )
+        self.overlay_input_hashes = None
+        # If true, build the DAO's secondary indexes after ingest, for
+        # DAOs created with deferred indexes.
+        self.create_indexes = config.get('create_indexes', False)
+        # If true, check section files and columns before ingesting.
+        self.validate = config.get('validate', False)
+        # If true, type-check CSV rows while they are ingested.
+        self.validate_rows = config.get('validate_rows', False)
+        # If set, a JSON report of ingest timings is written to this
+        # file at the end of ingest().
+        self.metrics_file = config.get('metrics_file')
+        self.metrics = IngestMetrics()
+        self.resume = False
+        self.cells_fingerprint = None
+        self.saved_cell_ids = None
+        self.num_cells_saved = 0
+
+    def ingest(self, incremental=False, resume=False):
+        """ Ingest all sections.
+        If incremental is True, sections whose source files have the
+        same fingerprints as in the last ingest are skipped, and cell
+        compositions are only recomputed if the grid, habitats or model
+        projection changed.
+        Progress is checkpointed in the DAO every commit_interval
+        records. If resume is True, sections which were completed by an
+        earlier ingest of the same files are skipped, and interrupted
+        sections continue from their last checkpoint.
+        Timings for each section are collected in self.metrics, and its
+        report is written to the metrics_file, if one is configured.
+        The data source is closed when the ingest ends. """
+        self.resume = resume
+        self.metrics = IngestMetrics()
+        self.metrics.start()
+        session = getattr(self.dao, 'session', None)
+        if session is not None:
+            self.metrics.watch_session(session)
+        try:
+            self.ingest_sections(incremental=incremental)
+        finally:
+            if session is not None:
+                self.metrics.unwatch_session(session)
+            self.metrics.stop()
+            self.data_source.close()
+
+        self.logger.info("Ingest took %.2fs." % self.metrics.totals.wall_time)
+        self.metrics.log_summary(self.logger)
+        if self.metrics_file:
+            self.metrics.write_report(self.metrics_file)
+
+    def get_metrics(self):
+        """ Returns the timings report for the last ingest. """
+        return self.metrics.get_report()
+
+    def ingest_sections(self, incremental=False):
+        if self.validate:
+            self.logger.info("Validating data...")
+            with self.metrics.section('validation'):
+                validation.SASIDataValidator(
+                    data_dir=self.data_dir, data_source=self.data_source,
+                    config=self.config,
+                    logger=self.logger).validate()
 
         # Define generic CSV ingests.
         csv_sections = [
@@ -171,20 +303,108 @@ class SASI_Ingestor(object):
             ]
 
         for section in csv_sections:
-            self.ingest_csv_section(section)
+            with self.metrics.section(section['id']):
+                self.ingest_csv_section(section, incremental=incremental)
 
         # Convenience shortcuts.
         self.model_parameters = self.dao.query('__ModelParameters').fetchone()
-        self.geographic_crs = self.model_parameters.projection
-
-        self.ingest_grid()
-        self.ingest_habitats()
-
-        self.post_ingest()
+        # The mapping default only applies to missing values, so also
+        # default empty projections.
+        self.geographic_crs = (self.model_parameters.projection or
+                               gis_util.get_default_geographic_crs())
+
+        self.ingest_cells(incremental=incremental)
+
+        if self.create_indexes and hasattr(self.dao, 'create_indexes'):
+            self.logger.info("Creating indexes...")
+            with self.metrics.section('create_indexes'):
+                self.dao.create_indexes()
+
+    def ingest_cells(self, incremental=False):
+        """ Ingest the grid and habitats, and compute cell compositions. """
+        # Settings that cells depend on, as for the overlay cache key.
+        sections_config = self.config.get('sections', {})
+        fingerprint = self.get_files_fingerprint(
+            self.data_source.get_shapefile_paths(self.grid_path) +
+            self.data_source.get_shapefile_paths(self.habs_path),
+            extra=(
+                self.geographic_crs,
+                self.reproject_once,
+                self.projected_units_per_degree,
+                sorted(sections_config.get('grid', {}).items()),
+                sorted(sections_config.get('habitats', {}).items()),
+            ),
+        )
+        if incremental:
+            if fingerprint == self.dao.get_section_fingerprint('cells'):
+                self.logger.info("Grid and habitats are unchanged, "
+                                 "skipping cell compositions.")
+                return
+            self.dao.clear_source('Cell')
+
+        self.cells_fingerprint = fingerprint
+        self.saved_cell_ids = None
+        self.num_cells_saved = 0
+        if self.resume:
+            checkpoint = self.dao.get_ingest_checkpoint('cells')
+            if checkpoint and checkpoint.fingerprint == fingerprint:
+                if checkpoint.status == 'complete':
+                    self.logger.info("Cells were already ingested, "
+                                     "skipping.")
+                    return
+                # Cells are committed in batches along with the
+                # checkpoint, so saved cells are all complete.
+                self.saved_cell_ids = self.dao.get_source_ids('Cell')
+                self.num_cells_saved = len(self.saved_cell_ids)
+                self.logger.info("Resuming cells after %s saved cells." %
+                                 self.num_cells_saved)
+            else:
+                self.dao.clear_source('Cell')
+
+        if self.grid_tile_size:
+            self.ingest_grid_tiles()
+        else:
+            self.ingest_grid()
+            if self.cells:
+                self.ingest_overlay()
+        self.dao.set_ingest_checkpoint(
+            'cells', fingerprint=fingerprint, status='complete',
+            num_records=self.num_cells_saved, commit=False)
+        self.dao.set_section_fingerprint('cells', fingerprint)
+
+    def get_files_fingerprint(self, paths, extra=None):
+        return self.data_source.get_fingerprint(
+            paths, hash_contents=self.fingerprint_contents, extra=extra)
+
+    def ingest_csv_section(self, section, incremental=False):
+        csv_file = "%s.csv" % section['id']
+        section_config = self.config.get('sections', {}).get(
+            section['id'], {})
+        fingerprint = self.get_files_fingerprint(
+            [csv_file], extra=sorted(section_config.items()))
+        if incremental:
+            if fingerprint == self.dao.get_section_fingerprint(section['id']):
+                self.logger.info("'%s' is unchanged, skipping." % 
+                                 section['id'])
+                return
+            self.dao.clear_source(section['class'].__name__)
+
+        start_offset = None
+        start_num_records = 0
+        if self.resume:
+            checkpoint = self.dao.get_ingest_checkpoint(section['id'])
+            if checkpoint and checkpoint.fingerprint == fingerprint:
+                if checkpoint.status == 'complete':
+                    self.logger.info("'%s' was already ingested, skipping."
+                                     % section['id'])
+                    return
+                start_offset = checkpoint.offset
+                start_num_records = checkpoint.num_records or 0
+            else:
+                # Remove any rows from an interrupted ingest of other files.
+                self.dao.clear_source(section['class'].__name__)
 
-    def ingest_csv_section(self, section):
-        csv_file = os.path.join(self.data_dir, "%s.csv" % section['id'])
-        if not os.path.isfile(csv_file):
+        if not self.data_source.exists(csv_file):
             if not section.get('optional'):
                 raise Exception(
                     ("Error ingesting '%s': "
@@ -192,38 +412,178 @@ class SASI_Ingestor(object):
                     (section['id'], csv_file)
                 )
             else:
+                self.dao.set_ingest_checkpoint(
+                    section['id'], fingerprint=fingerprint,
+                    status='complete', commit=False)
+                self.dao.set_section_fingerprint(section['id'], None)
                 return
 
         base_msg = "Ingesting '%s'..." % section['id']
         self.logger.info(base_msg)
-        section_config = self.config.get('sections', {}).get(
-            section['id'], {})
-
-        Ingestor(
-            reader=CSVReader(csv_file=csv_file),
-            processors=[
+        limit = section_config.get('limit')
+        if start_offset:
+            self.logger.info("Resuming '%s' after %s records." % (
+                section['id'], start_num_records))
+            if limit is not None:
+                limit = max(limit - start_num_records, 0)
+
+        reader = CSVReader(
+            csv_file=self.data_source.open(csv_file),
+            total_bytes=self.data_source.get_size(csv_file),
+            start_offset=start_offset)
+
+        def save_checkpoint(counter):
+            # Called before each commit, so the checkpoint is saved
+            # in the same transaction as the rows it covers.
+            self.dao.set_ingest_checkpoint(
+                section['id'], fingerprint=fingerprint, status='in_progress',
+                offset=reader.bytes_read,
+                num_records=start_num_records + counter, commit=False)
+
+        if self.bulk_insert:
+            # Write plain dicts via Core inserts, skipping the ORM.
+            processors = [
+                DictMapper(mappings=section['mappings']),
+                BulkDAOWriter(dao=self.dao,
+                              source=section['class'].__name__,
+                              batch_size=self.batch_size,
+                              commit_interval=self.commit_interval,
+                              on_commit=save_checkpoint),
+            ]
+        else:
+            processors = [
                 ClassMapper(clazz=section['class'],
                             mappings=section['mappings']),
-                DAOWriter(dao=self.dao, commit_interval=self.commit_interval),
-            ],
+                DAOWriter(dao=self.dao, commit_interval=self.commit_interval,
+                          on_commit=save_checkpoint),
+            ]
+
+        if self.validate_rows:
+            processors.insert(0, validation.get_row_validator(section['id']))
+
+        ingestor = Ingestor(
+            reader=reader,
+            processors=processors,
             logger=self.get_section_logger(section['id'], base_msg),
-            limit=section_config.get('limit'),
-        ).ingest()
+            limit=limit,
+            # Read CSV files in a single pass, without pre-counting rows.
+            count_records=False,
+            size_hint=section_config.get('size_hint'),
+            batch_size=self.batch_size,
+            metrics=self.metrics.get_section(section['id']),
+        )
+        ingestor.ingest()
+        self.dao.set_ingest_checkpoint(
+            section['id'], fingerprint=fingerprint, status='complete',
+            offset=reader.bytes_read,
+            num_records=start_num_records + ingestor.counter, commit=False)
         self.dao.commit()
-
-    def ingest_grid(self):
+        self.dao.set_section_fingerprint(section['id'], fingerprint)
+
+    def get_grid_file(self):
+        return self.data_source.get_shapefile_path(self.grid_path)
+
+    def get_habs_file(self):
+        return self.data_source.get_shapefile_path(self.habs_path)
+
+    def ingest_grid_tiles(self):
+        """ Ingests the grid one tile at a time. For each tile, only
+        the habitats that intersect the tile's cells are loaded.
+        Cells and habitats are released after each tile is saved.
+        Each tile is read with a bbox filter. Unless the grid and habitat
+        shapefiles have spatial indexes (.qix files), each read scans the
+        whole file, so the cost is O(tiles x features). """
+        reader = shapefile_util.get_shapefile_reader(self.get_habs_file())
+        self.habs_crs = reader.get_crs()
+        reader.close()
+
+        tiles = self.get_grid_tiles()
+        for i, tile in enumerate(tiles):
+            self.logger.info("Processing grid tile %d of %d..." % (
+                i + 1, len(tiles)))
+            self.ingest_grid(bbox=tile)
+            if not self.cells:
+                continue
+            self.ingest_overlay(tile=tile)
+
+    def get_grid_tiles(self):
+        """ Returns the bboxes of grid tiles which contain cell mbr
+        origins, from one pass over the grid, so that empty tiles are
+        skipped. Tiles are in the grid shapefile's CRS. """
+        tile_size = self.grid_tile_size
+        def fit_key(key, value):
+            # Guard against rounding, so that the tile's bbox contains
+            # value, as ShapefileReader's bbox_origin_only filter checks.
+            while key * tile_size > value:
+                key -= 1
+            while (key + 1) * tile_size <= value:
+                key += 1
+            return key
+
+        tile_keys = set()
+        reader = shapefile_util.get_shapefile_reader(self.get_grid_file())
+        try:
+            for record in reader.records():
+                mbr = gis_util.get_shape_mbr(
+                    gis_util.geojson_to_shape(record['geometry']))
+                kx, ky = overlay.get_tile_key(mbr, tile_size)
+                tile_keys.add((fit_key(kx, mbr[0]), fit_key(ky, mbr[1])))
+        finally:
+            reader.close()
+        return [(kx * tile_size, ky * tile_size, 
+                 (kx + 1) * tile_size, (ky + 1) * tile_size)
+                for kx, ky in sorted(tile_keys)]
+
+    def get_habs_bbox(self, cells, segments_per_side=16):
+        """ Get the bbox of cells in the habitat shapefile's CRS. """
+        mbrs = [cell.mbr for cell in cells]
+        x0 = min([mbr[0] for mbr in mbrs])
+        y0 = min([mbr[1] for mbr in mbrs])
+        x1 = max([mbr[2] for mbr in mbrs])
+        y1 = max([mbr[3] for mbr in mbrs])
+        # Densify the bbox's sides, since they can curve when 
+        # reprojected.
+        coords = []
+        for i in range(segments_per_side):
+            f = 1.0 * i/segments_per_side
+            coords.append((x0 + f * (x1 - x0), y0))
+        for i in range(segments_per_side):
+            f = 1.0 * i/segments_per_side
+            coords.append((x1, y0 + f * (y1 - y0)))
+        for i in range(segments_per_side):
+            f = 1.0 * i/segments_per_side
+            coords.append((x1 - f * (x1 - x0), y1))
+        for i in range(segments_per_side):
+            f = 1.0 * i/segments_per_side
+            coords.append((x0, y1 - f * (y1 - y0)))
+        coords.append(coords[0])
+        bbox_shape = gis_util.geojson_to_shape({
+            'type': 'Polygon', 'coordinates': [coords]})
+        bbox_shape = gis_util.reproject_shape(
+            bbox_shape, self.get_working_crs(), self.habs_crs)
+        return gis_util.get_shape_mbr(bbox_shape)
+
+    def ingest_grid(self, bbox=None):
         base_msg = "Ingesting 'grid'..."
         self.logger.info(base_msg)
         grid_logger = self.get_section_logger('grid', base_msg)
 
         self.cells = {}
-        grid_file = os.path.join(self.data_dir, 'grid', "grid.shp")
+        grid_file = self.get_grid_file()
         grid_config = self.config.get('sections', {}).get('grid', {})
 
+        def shape_to_geographic_wkt(shape):
+            if self.reproject_once:
+                shape = gis_util.reproject_shape(
+                    shape, self.geographic_crs, 'EPSG:4326')
+            return gis_util.shape_to_wkt(shape)
+
         Ingestor(
             reader=ShapefileReader(
                 shp_file=grid_file,
-                reproject_to='EPSG:4326',
+                reproject_to=self.get_working_crs(),
+                bbox=bbox,
+                bbox_origin_only=True,
             ),
             processors=[
                 ClassMapper(
@@ -232,27 +592,39 @@ class SASI_Ingestor(object):
                         {'source': 'ID', 'target': 'id', 'processor': int}, 
                         {'source': '__shape', 'target': 'shape'},
                         {'source': '__shape', 'target': 'geom_wkt',
-                         'processor': gis_util.shape_to_wkt}
+                         'processor': shape_to_geographic_wkt}
                     ]
                 ),
-                self.add_area_mbr,
-                DictWriter(dict_=self.cells),
+                AreaMbrProcessor(area_crs=self.geographic_crs,
+                                 projected=self.reproject_once),
+                # Key cells by id, as overlay results are.
+                DictWriter(dict_=self.cells, key_func=lambda cell: cell.id),
             ],
             logger=grid_logger,
             limit=grid_config.get('limit'),
+            count_records=(bbox is None),
+            batch_size=self.batch_size,
+            metrics=self.metrics.get_section('grid'),
         ).ingest()
 
-    def ingest_habitats(self):
+        # When resuming, skip cells which were already saved.
+        if self.saved_cell_ids:
+            for cell_id in self.saved_cell_ids.intersection(self.cells):
+                del self.cells[cell_id]
+
+    def ingest_habitats(self, bbox=None):
         base_msg = "Ingesting 'habitats'..."
         self.logger.info(base_msg)
         habs_logger=self.get_section_logger('habs', base_msg)
 
         self.habs = {}
-        self.habs_spatial_hash = SpatialHash(cell_size=self.hash_cell_size)
-        habs_file = os.path.join(self.data_dir, 'habitats', "habitats.shp")
+        self.habs_spatial_hash = self.get_spatial_index()
+        habs_file = self.get_habs_file()
         habs_config = self.config.get('sections', {}).get('habitats', {})
 
-        def add_to_habs_spatial_hash(data=None, **kwargs):
+        def add_to_habs_spatial_hash(data=None, counter=None, **kwargs):
+            # Sequential ids give habitats a stable order in overlays.
+            data.id = counter
             self.habs_spatial_hash.add_rect(data.mbr, data)
             return data
 
@@ -264,7 +636,8 @@ class SASI_Ingestor(object):
         Ingestor(
             reader=ShapefileReader(
                 shp_file=habs_file,
-                reproject_to='EPSG:4326',
+                reproject_to=self.get_working_crs(),
+                bbox=bbox,
             ),
             processors=[
                 ClassMapper(
@@ -277,73 +650,219 @@ class SASI_Ingestor(object):
                         {'source': '__shape', 'target': 'shape'}, 
                     ]
                 ),
-                self.add_area_mbr,
+                AreaMbrProcessor(area_crs=self.geographic_crs,
+                                 projected=self.reproject_once),
                 add_to_habs_spatial_hash,
                 DictWriter(dict_=self.habs),
             ],
             logger=habs_logger,
             limit=habs_config.get('limit'),
+            count_records=(bbox is None),
+            batch_size=self.batch_size,
+            metrics=self.metrics.get_section('habitats'),
         ).ingest()
 
+    def get_working_crs(self):
+        """ CRS that geometries are reprojected to on ingest. """
+        if self.reproject_once:
+            return self.geographic_crs
+        return 'EPSG:4326'
+
+    def get_working_units_per_degree(self):
+        if self.reproject_once:
+            return self.projected_units_per_degree
+        return 1.0
+
+    def get_spatial_index(self):
+        if self.spatial_index == 'str':
+            return STRTree(
+                node_capacity=self.config.get('str_node_capacity', 10))
+        elif self.spatial_index == 'hash':
+            return SpatialHash(cell_size=(
+                self.hash_cell_size * self.get_working_units_per_degree()))
+        raise Exception("Unknown spatial index type '%s'" % 
+                        self.spatial_index)
+
     def get_section_logger(self, section_id, base_msg):
         logger = logging.getLogger("%s_%s" % (id(self), section_id))
-        formatter = logging.Formatter(base_msg + ' %(message)s.')
-        log_handler = LoggerLogHandler(self.logger)
-        log_handler.setFormatter(formatter)
-        logger.addHandler(log_handler)
+        if not logger.handlers:
+            formatter = logging.Formatter(base_msg + ' %(message)s.')
+            log_handler = LoggerLogHandler(self.logger)
+            log_handler.setFormatter(formatter)
+            logger.addHandler(log_handler)
         logger.setLevel(self.logger.level)
         return logger
 
-    def post_ingest(self):
-        self.post_process_cells()
+    def ingest_overlay(self, tile=None):
+        """ Computes compositions for the ingested cells, or gets them
+        from the overlay cache. Habitats are only ingested if needed. 
+        If tile is given, only habitats intersecting the cells are
+        ingested. """
+        cache_key = None
+        compositions = None
+        if self.overlay_cache:
+            cache_key = self.get_overlay_cache_key(tile=tile)
+            compositions = self.overlay_cache.get(cache_key)
+            if compositions is not None:
+                if set(self.cells.keys()) <= set(compositions.keys()):
+                    self.logger.info("Using cached cell compositions.")
+                else:
+                    compositions = None
+            # Don't cache compositions for a partial set of cells.
+            if self.saved_cell_ids:
+                cache_key = None
+
+        if compositions is None:
+            if tile is None:
+                self.ingest_habitats()
+            else:
+                self.ingest_habitats(
+                    bbox=self.get_habs_bbox(self.cells.values()))
+        self.post_ingest(compositions=compositions, cache_key=cache_key)
+
+    def get_overlay_cache_key(self, tile=None):
+        # Compositions only depend on the contents of the grid and
+        # habitat files, not on where they are, so key on content hashes.
+        if self.overlay_input_hashes is None:
+            self.overlay_input_hashes = []
+            for shp_path in [self.grid_path, self.habs_path]:
+                self.overlay_input_hashes.append(sorted([
+                    (os.path.splitext(path)[1], 
+                     self.data_source.hash_file(path))
+                    for path in self.data_source.get_shapefile_paths(shp_path)
+                ]))
+        sections_config = self.config.get('sections', {})
+        return OverlayCache.get_key(
+            self.overlay_input_hashes,
+            self.geographic_crs,
+            self.reproject_once,
+            tile,
+            sections_config.get('grid'),
+            sections_config.get('habitats'),
+        )
+
+    def post_ingest(self, compositions=None, cache_key=None):
+        self.post_process_cells(compositions=compositions, cache_key=cache_key)
 
         # Allow for cells and habs to be garbage collected.
         self.cells = None
         self.habs = None
         self.habs_spatial_hash = None
 
-    def post_process_cells(self, log_interval=1000):
+    def post_process_cells(self, log_interval=1000, compositions=None,
+                           cache_key=None):
+        """ Sets cell compositions and depths, and saves cells.
+        compositions is a dict of (composition, depth) tuples, keyed by
+        cell id. If it is not given, compositions are computed, and 
+        cached under cache_key. """
+        if compositions is None:
+            with self.metrics.section('compositions') as metrics:
+                compositions = self.compute_compositions(log_interval)
+                metrics.add_records(len(self.cells))
+            if cache_key is not None:
+                self.overlay_cache.put(cache_key, compositions)
+
+        for cell_id, cell in self.cells.items():
+            cell.habitat_composition, cell.depth = compositions[cell_id]
+
+            # Convert cell area to km^2.
+            cell.area = cell.area/(1000.0**2)
+
+        with self.metrics.section('save_cells') as metrics:
+            self.save_cells(self.cells.values())
+            metrics.add_records(len(self.cells))
+
+    def compute_compositions(self, log_interval=1000):
         base_msg = 'Calculating cell compositions...'
         self.logger.info(base_msg)
         logger = self.get_section_logger('habitat_areas', base_msg)
 
+        if self.overlay_workers > 1 and platform.system() != 'Java':
+            results = self.compute_compositions_parallel()
+        else:
+            results = self.compute_compositions_serial()
+
+        compositions = {}
         num_cells = len(self.cells)
         counter = 0
-        for cell in self.cells.values():
+        for cell_id, composition, depth in results:
             counter += 1
             if (counter % log_interval) == 0:
                 logger.info(" %d of %d (%.1f%%)" % (
                     counter, num_cells, 1.0 * counter/num_cells* 100))
+            compositions[cell_id] = (composition, depth)
+        return compositions
 
-            composition = {}
-            cell.depth = 0
-
+    def compute_compositions_serial(self):
+        for cell_id in sorted(self.cells.keys()):
+            cell = self.cells[cell_id]
             # Get candidate intersecting habitats.
-            candidate_habs = self.habs_spatial_hash.items_for_rect(cell.mbr)
-            for hab in candidate_habs:
-                intersection = gis_util.get_intersection(cell.shape, hab.shape)
-                if not intersection:
-                    continue
-                intersection_area = gis_util.get_shape_area(
-                    intersection,
-                    target_crs=self.geographic_crs,
-                )
-                hab_key = (hab.substrate_id, hab.energy_id,)
-                pct_area = intersection_area/cell.area
-                composition[hab_key] = composition.get(hab_key, 0) + pct_area
-                cell.depth += pct_area * hab.depth
-
-            cell.habitat_composition = composition
-
-            # Convert cell area to km^2.
-            cell.area = cell.area/(1000.0**2)
-
-            self.dao.save(cell, commit=False)
-        self.dao.commit()
-
-    # Define processor for adding area, mbr to geom entities.
-    def add_area_mbr(self, data=None, **kwargs):
-        data.area = gis_util.get_shape_area(
-            data.shape, target_crs=self.geographic_crs)
-        data.mbr = gis_util.get_shape_mbr(data.shape)
-        return data 
+            candidate_habs = sorted(
+                self.habs_spatial_hash.items_for_rect(cell.mbr),
+                key=lambda hab: hab.id)
+            composition, depth = overlay.compute_cell_composition(
+                cell.shape, cell.area, candidate_habs,
+                area_crs=self.geographic_crs, projected=self.reproject_once,
+                cell_mbr=cell.mbr)
+            yield cell_id, composition, depth
+
+    def compute_compositions_parallel(self):
+        """ Shards cells into spatial tiles, and computes each tile's
+        compositions in a worker process. """
+        pool = Pool(processes=self.overlay_workers)
+        try:
+            for results in pool.imap_unordered(
+                overlay.compute_tile_compositions, self.get_overlay_tiles()):
+                for result in results:
+                    yield result
+        finally:
+            pool.close()
+            pool.join()
+
+    def get_overlay_tiles(self):
+        cells_by_tile = {}
+        tile_size = (self.overlay_tile_size * 
+                     self.get_working_units_per_degree())
+        for cell in self.cells.values():
+            tile_key = overlay.get_tile_key(cell.mbr, tile_size)
+            cells_by_tile.setdefault(tile_key, []).append(cell)
+
+        for tile_key in sorted(cells_by_tile.keys()):
+            tile_cells = cells_by_tile[tile_key]
+            # Only send the habitats that intersect the tile's cells.
+            tile_habs = {}
+            for cell in tile_cells:
+                for hab in self.habs_spatial_hash.items_for_rect(cell.mbr):
+                    tile_habs[hab.id] = hab
+            yield {
+                'cells': [
+                    (cell.id, gis_util.shape_to_wkb(cell.shape), cell.area,
+                     cell.mbr) for cell in tile_cells
+                ],
+                'habs': [
+                    (hab.id, hab.substrate_id, hab.energy_id, hab.depth,
+                     hab.area, gis_util.shape_to_wkb(hab.shape), hab.mbr)
+                    for hab in tile_habs.values()
+                ],
+                'area_crs': self.geographic_crs,
+                'projected': self.reproject_once,
+            }
+
+    def save_cells(self, cells):
+        """ Saves cells in id order, committing every commit_interval
+        cells along with the cells checkpoint. """
+        cells = sorted(cells, key=lambda cell: cell.id)
+        interval = int(self.commit_interval or len(cells) or 1)
+        for i in range(0, len(cells), interval):
+            batch = cells[i:i + interval]
+            if self.bulk_insert:
+                self.dao.bulk_insert_objects('Cell', batch, commit=False)
+            else:
+                for cell in batch:
+                    self.dao.save(cell, commit=False)
+            self.num_cells_saved += len(batch)
+            self.dao.set_ingest_checkpoint(
+                'cells', fingerprint=self.cells_fingerprint,
+                status='in_progress', num_records=self.num_cells_saved,
+                commit=False)
+            self.dao.commit()
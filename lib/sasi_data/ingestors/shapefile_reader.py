@@ -1,4 +1,5 @@
 import csv
+from itertools import islice
 import sasi_data.util.shapefile as shapefile_util
 import sasi_data.util.gis as gis_util
 
@@ -7,31 +8,70 @@ class ShapefileReader(object):
     """ Reads GeoJSON records from shapefiles.
     Special '__shape' attr can be used to access
     shape. Otherwise attrs access GeoJSON dict's properties.
+    If bbox is given, only records whose shapes intersect it are read.
+    If bbox_origin_only is also True, only records whose mbr's 
+    (minx, miny) corner lies in bbox are read, so that each record
+    is read for only one of a set of adjacent bboxes. bboxes are in the
+    shapefile's CRS.
     """
     def __init__(self, shp_file=None, force_multipolygon=True,
-                 reproject_to=None, **kwargs):
+                 reproject_to=None, reproject_batch_size=1000, bbox=None,
+                 bbox_origin_only=False, **kwargs):
         self.shp_file = shp_file
         self.force_multipolygon = force_multipolygon
         self.reproject_to = reproject_to
+        self.reproject_batch_size = reproject_batch_size
+        self.bbox = bbox
+        self.bbox_origin_only = bbox_origin_only
         self.reader = shapefile_util.get_shapefile_reader(self.shp_file)
 
     def get_records(self):
-        for geojson in self.reader.records():
-            record = {}
-            record.update(geojson.get('properties', {}))
-            shape = gis_util.geojson_to_shape(geojson['geometry'])
+        # Shapes are reprojected in batches, so that coordinate
+        # transforms can be done in bulk.
+        geojsons = iter(self.reader.records(bbox=self.bbox))
+        while True:
+            batch = list(islice(geojsons, self.reproject_batch_size))
+            if not batch:
+                break
+            shapes = [gis_util.geojson_to_shape(geojson['geometry'])
+                      for geojson in batch]
+            if self.bbox is not None and self.bbox_origin_only:
+                batch, shapes = self.filter_by_origin(batch, shapes)
             if self.reproject_to:
-                shape = gis_util.reproject_shape(
-                    shape, self.reader.get_crs(), self.reproject_to)
-            if shape.geom_type == 'Polygon' and self.force_multipolygon:
-                shape = gis_util.polygon_to_multipolygon(shape)
-            record['__shape'] = shape
-            yield record
+                shapes = gis_util.reproject_shapes(
+                    shapes, self.reader.get_crs(), self.reproject_to)
+            for geojson, shape in zip(batch, shapes):
+                record = {}
+                record.update(geojson.get('properties', {}))
+                if shape.geom_type == 'Polygon' and self.force_multipolygon:
+                    shape = gis_util.polygon_to_multipolygon(shape)
+                record['__shape'] = shape
+                yield record
+
+    def filter_by_origin(self, geojsons, shapes):
+        x0, y0, x1, y1 = self.bbox
+        filtered_geojsons = []
+        filtered_shapes = []
+        for geojson, shape in zip(geojsons, shapes):
+            mbr = gis_util.get_shape_mbr(shape)
+            if x0 <= mbr[0] < x1 and y0 <= mbr[1] < y1:
+                filtered_geojsons.append(geojson)
+                filtered_shapes.append(shape)
+        return filtered_geojsons, filtered_shapes
 
     def get_size(self, **kwargs):
+        """ Number of records, or None if reading from a bbox. """
+        if self.bbox is not None:
+            return None
         if not hasattr(self, '_size'):
             self._size = self.reader.size
         return self._size
 
+    def get_mbr(self):
+        return self.reader.get_mbr()
+
+    def get_crs(self):
+        return self.reader.get_crs()
+
     def close(self):
         self.reader.close()
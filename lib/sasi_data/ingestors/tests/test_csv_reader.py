@@ -0,0 +1,53 @@
+import unittest
+from sasi_data.ingestors.ingestor import Ingestor
+from sasi_data.ingestors.csv_reader import CSVReader
+from StringIO import StringIO
+import csv
+
+
+class CSVReader_TestCase(unittest.TestCase):
+
+    def generate_csv_file(self, n=10):
+        csv_data = StringIO()
+        writer = csv.DictWriter(csv_data, fieldnames=['s_attr1', 's_attr2'])
+        writer.writeheader()
+        for i in range(n):
+            writer.writerow({
+                's_attr1': i,
+                's_attr2': "s_attr2_%s" % i,
+            })
+        return StringIO(csv_data.getvalue())
+
+    def test_get_progress(self):
+        reader = CSVReader(csv_file=self.generate_csv_file())
+        records = [r for r in reader.get_records()]
+        self.assertEquals(len(records), 10)
+        self.assertEquals(reader.get_progress(), 1.0)
+
+    def test_single_pass_limit(self):
+        records = []
+        def collect(data=None, **kwargs):
+            records.append(data)
+        Ingestor(
+            reader=CSVReader(csv_file=self.generate_csv_file()),
+            processors=[collect],
+            count_records=False,
+            limit=3,
+        ).ingest()
+        self.assertEquals([r['s_attr1'] for r in records], ['0', '1', '2'])
+
+    def test_start_offset(self):
+        reader = CSVReader(csv_file=self.generate_csv_file())
+        records = iter(reader.get_records())
+        for i in range(4):
+            records.next()
+        offset = reader.bytes_read
+        reader = CSVReader(csv_file=self.generate_csv_file(),
+                           start_offset=offset)
+        records = [r for r in reader.get_records()]
+        self.assertEquals([r['s_attr1'] for r in records],
+                          [str(i) for i in range(4, 10)])
+        self.assertEquals(reader.get_progress(), 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from sasi_data.ingestors.ingestor import Ingestor
+from sasi_data.ingestors.dao_writer import BulkDAOWriter
+from sasi_data.ingestors.csv_reader import CSVReader
+from sasi_data.ingestors.mapper import DictMapper
+from sa_dao.orm_dao import ORM_DAO
+from StringIO import StringIO
+import csv
+from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+
+class BulkDAOWriter_TestCase(unittest.TestCase):
+
+    def setUp(self):
+        Base = declarative_base()
+
+        class TestClass(Base):
+            __tablename__ = 'testclass'
+            id = Column(Integer, primary_key=True)
+            attr1 = Column(Integer) 
+            attr2 = Column(String)
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker()(bind=engine)
+        self.dao = ORM_DAO(session=self.session,
+                           schema={'sources': {'TestClass': TestClass}})
+
+    def generate_csv_file(self, n=5):
+        csv_data = StringIO()
+        writer = csv.DictWriter(csv_data, fieldnames=['s_attr1', 's_attr2'])
+        writer.writeheader()
+        for i in range(n):
+            writer.writerow({
+                's_attr1': i,
+                's_attr2': "s_attr2_%s" % i,
+            })
+        return StringIO(csv_data.getvalue())
+
+    def test_bulk_dao_csv_ingestor(self):
+        mappings = [
+            {
+                'source': 's_attr1', 
+                'target': 'attr1',
+                'processor': lambda value: int(value) * 10
+            },
+            {
+                'source': 's_attr2', 
+                'target': 'attr2',
+            },
+        ]
+
+        commits = []
+        Ingestor(
+            reader=CSVReader(csv_file=self.generate_csv_file()),
+            processors=[
+                DictMapper(mappings=mappings),
+                BulkDAOWriter(dao=self.dao, source='TestClass', batch_size=2,
+                              commit_interval=3, on_commit=commits.append),
+            ],
+            count_records=False,
+            batch_size=1,
+        ).ingest()
+        self.assertEquals(commits, [3])
+        self.dao.commit()
+        results = self.dao.query({
+            'SELECT': ['__TestClass']
+        }).all()
+        self.assertEquals(sorted([r.attr1 for r in results]),
+                          [0, 10, 20, 30, 40])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from sasi_data.ingestors.ingestor import Ingestor
+from sasi_data.ingestors.processor import Processor
+
+
+class ListReader(object):
+    def __init__(self, records=[]):
+        self.records = records
+    def get_records(self):
+        return iter(self.records)
+    def get_size(self, **kwargs):
+        return len(self.records)
+    def close(self):
+        pass
+
+class BatchRecorder(Processor):
+    def __init__(self, **kwargs):
+        Processor.__init__(self, **kwargs)
+        self.batches = []
+    def process_batch(self, records=None, counter=None, **kwargs):
+        self.batches.append((list(records), counter))
+        return records
+
+class Ingestor_TestCase(unittest.TestCase):
+
+    def test_batch_ingest(self):
+        counters = []
+        def add_one(data=None, counter=None, **kwargs):
+            counters.append(counter)
+            return data + 1
+        recorder = BatchRecorder()
+        Ingestor(
+            reader=ListReader(range(5)),
+            processors=[add_one, recorder],
+            batch_size=2,
+        ).ingest()
+        self.assertEquals(counters, [1, 2, 3, 4, 5])
+        self.assertEquals(recorder.batches, 
+                          [([1, 2], 2), ([3, 4], 4), ([5], 5)])
+
+    def test_batch_ingest_limit(self):
+        recorder = BatchRecorder()
+        Ingestor(
+            reader=ListReader(range(5)),
+            processors=[recorder],
+            batch_size=2,
+            limit=3,
+        ).ingest()
+        self.assertEquals(recorder.batches, [([0, 1], 2), ([2], 3)])
+
+if __name__ == '__main__':
+    unittest.main()
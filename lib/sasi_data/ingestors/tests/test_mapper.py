@@ -0,0 +1,61 @@
+import unittest
+from sasi_data.ingestors.mapper import ClassMapper, DictMapper
+
+
+class Mapper_TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.mappings = [
+            {
+                'source': 's_attr1', 
+                'target': 'attr1',
+                'processor': lambda value: int(value) * 10
+            },
+            {
+                'source': 's_attr2', 
+                'target': 'attr2',
+                'default': 'default_attr2',
+            },
+            'attr3',
+        ]
+        self.records = [
+            {'s_attr1': '1', 's_attr2': 'a', 'attr3': 'x'},
+            {'s_attr1': '2', 'attr3': 'y'},
+        ]
+        self.expected = [
+            {'attr1': 10, 'attr2': 'a', 'attr3': 'x'},
+            {'attr1': 20, 'attr2': 'default_attr2', 'attr3': 'y'},
+        ]
+
+    def test_class_mapper(self):
+        class TestClass(object):
+            pass
+        mapper = ClassMapper(clazz=TestClass, mappings=self.mappings)
+        results = [mapper.process(data=r) for r in self.records]
+        self.assertEquals([r.__dict__ for r in results], self.expected)
+
+    def test_dict_mapper(self):
+        mapper = DictMapper(mappings=self.mappings)
+        results = [mapper.process(data=r) for r in self.records]
+        self.assertEquals(results, self.expected)
+
+    def test_convert_batch(self):
+        mapper = DictMapper(mappings=self.mappings)
+        self.assertEquals(mapper.convert_batch(self.records), self.expected)
+
+    def test_overridden_methods(self):
+        class UpperDictMapper(DictMapper):
+            def initialize_target(self, data, counter):
+                return {'counter': counter}
+            def set_target_attr(self, target, attr, value):
+                target[attr.upper()] = value
+        mapper = UpperDictMapper(mappings=['attr3'])
+        self.assertEquals(mapper.process(data=self.records[0], counter=1),
+                          {'counter': 1, 'ATTR3': 'x'})
+        # Each record gets its own counter.
+        self.assertEquals(mapper.convert_batch(self.records, counter=5),
+                          [{'counter': 4, 'ATTR3': 'x'},
+                           {'counter': 5, 'ATTR3': 'y'}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from sasi_data.ingestors.ingestor import Ingestor
+from sasi_data.ingestors.metrics import IngestMetrics
+from sasi_data.ingestors.processor import Processor
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import json
+import os
+import tempfile
+
+
+class ListReader(object):
+    def __init__(self, records=[]):
+        self.records = records
+    def get_records(self):
+        return iter(self.records)
+    def get_size(self, **kwargs):
+        return len(self.records)
+    def close(self):
+        pass
+
+class Passthrough(Processor):
+    def process_batch(self, records=None, **kwargs):
+        return records
+
+class IngestMetrics_TestCase(unittest.TestCase):
+
+    def test_ingestor_metrics(self):
+        def add_one(data=None, **kwargs):
+            return data + 1
+        metrics = IngestMetrics()
+        metrics.start()
+        for batch_size in [2, None]:
+            Ingestor(
+                reader=ListReader(range(5)),
+                processors=[add_one, Passthrough()],
+                batch_size=batch_size,
+                metrics=metrics.get_section('numbers'),
+            ).ingest()
+        metrics.stop()
+
+        report = metrics.get_report()
+        self.assertEquals(report['records'], 10)
+        section = report['sections'][0]
+        self.assertEquals(section['section'], 'numbers')
+        self.assertEquals(section['records'], 10)
+        self.assertEquals([t['name'] for t in section['timings']],
+                          ['ListReader', 'add_one', 'Passthrough'])
+        # 4 batch reads, the last one empty, then 5 record reads.
+        self.assertEquals([t['calls'] for t in section['timings']],
+                          [4 + 5, 3 + 5, 3 + 5])
+        self.assertTrue(report['wall_time'] >= section['wall_time'])
+
+    def test_nested_sections(self):
+        metrics = IngestMetrics()
+        with metrics.section('a') as outer:
+            with metrics.section('a') as inner:
+                inner.add_records(1)
+            self.assertEquals(metrics.current, [outer])
+        self.assertEquals(metrics.current, [])
+        self.assertEquals(len(metrics.sections), 1)
+        self.assertEquals(outer.records, 1)
+
+    def test_commit_times(self):
+        session = sessionmaker()(bind=create_engine('sqlite://'))
+        metrics = IngestMetrics()
+        metrics.watch_session(session)
+        with metrics.section('a'):
+            session.commit()
+        session.commit()
+        metrics.unwatch_session(session)
+        session.commit()
+        report = metrics.get_report()
+        self.assertEquals(report['num_commits'], 2)
+        self.assertEquals(report['sections'][0]['num_commits'], 1)
+
+    def test_write_report(self):
+        metrics = IngestMetrics()
+        with metrics.section('a') as section:
+            section.add_records(3)
+        fd, report_file = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            metrics.write_report(report_file)
+            with open(report_file) as f:
+                report = json.load(f)
+        finally:
+            os.remove(report_file)
+        self.assertEquals(report['sections'][0]['records'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
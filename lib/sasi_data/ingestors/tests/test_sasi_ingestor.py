@@ -3,11 +3,17 @@ from sasi_data.ingestors.sasi_ingestor import SASI_Ingestor
 import sasi_data.util.data_generators as dg
 import sasi_data.models as models
 from sasi_data.dao.sasi_sa_dao import SASI_SqlAlchemyDAO
+from sasi_data.util.overlay_cache import OverlayCache
+from sasi_data.validation import SASIDataValidationError
 import shutil
+import csv
+import json
+import os
 import logging
 import tempfile
 import platform
-from sqlalchemy import create_engine
+import zipfile
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.orm import scoped_session, sessionmaker
 
 
@@ -16,13 +22,14 @@ logger.addHandler(logging.StreamHandler())
 logger.setLevel(logging.INFO)
 
 
+class IngestInterrupted(Exception): pass
+
 class SASI_Ingestor_TestCase(unittest.TestCase):
     def tearDown(self):
         if getattr(self, 'data_dir', None):
             shutil.rmtree(self.data_dir)
 
-    def test_sasi_ingestor(self):
-
+    def get_dao(self, **kwargs):
         if platform.system() == 'Java':
             db_uri = 'h2+zxjdbc:///mem:'
         else:
@@ -30,14 +37,16 @@ class SASI_Ingestor_TestCase(unittest.TestCase):
         engine = create_engine(db_uri)
         connection = engine.connect()
         session = sessionmaker()(bind=connection)
+        return SASI_SqlAlchemyDAO(session=session, **kwargs)
 
+    def test_sasi_ingestor(self):
         self.data_dir = self.generate_data_dir(
             time_start=0,
             time_end=1,
             time_step=1,
         )
 
-        dao = SASI_SqlAlchemyDAO(session=session)
+        dao = self.get_dao()
         sasi_ingestor = SASI_Ingestor(
             data_dir=self.data_dir, 
             dao=dao,
@@ -73,6 +82,383 @@ class SASI_Ingestor_TestCase(unittest.TestCase):
                     v
                 )
 
+    def test_parallel_overlay(self):
+        self.data_dir = self.generate_data_dir(
+            time_start=0,
+            time_end=1,
+            time_step=1,
+        )
+
+        compositions = []
+        for config in [{}, {'overlay_workers': 2, 'overlay_tile_size': 2}]:
+            dao = self.get_dao()
+            SASI_Ingestor(
+                data_dir=self.data_dir, 
+                dao=dao,
+                hash_cell_size=8,
+                config=config,
+            ).ingest()
+            compositions.append(dict(
+                [(c.id, (c.habitat_composition, c.depth)) 
+                 for c in dao.query('__Cell').all()]))
+        self.assertEquals(compositions[0], compositions[1])
+
+    def test_str_tree_overlay(self):
+        self.data_dir = self.generate_data_dir(
+            time_start=0,
+            time_end=1,
+            time_step=1,
+        )
+
+        compositions = []
+        for config in [{}, {'spatial_index': 'str'}]:
+            dao = self.get_dao()
+            SASI_Ingestor(
+                data_dir=self.data_dir, 
+                dao=dao,
+                hash_cell_size=8,
+                config=config,
+            ).ingest()
+            compositions.append(dict(
+                [(c.id, (c.habitat_composition, c.depth)) 
+                 for c in dao.query('__Cell').all()]))
+        self.assertEquals(compositions[0], compositions[1])
+
+    def test_grid_tiles(self):
+        self.data_dir = self.generate_data_dir(
+            time_start=0,
+            time_end=1,
+            time_step=1,
+        )
+
+        compositions = []
+        for config in [{}, {'grid_tile_size': 1.5}]:
+            dao = self.get_dao()
+            sasi_ingestor = SASI_Ingestor(
+                data_dir=self.data_dir, 
+                dao=dao,
+                hash_cell_size=8,
+                config=config,
+            )
+            grid_bboxes = []
+            ingest_grid = sasi_ingestor.ingest_grid
+            def recording_ingest_grid(bbox=None):
+                grid_bboxes.append(bbox)
+                return ingest_grid(bbox=bbox)
+            sasi_ingestor.ingest_grid = recording_ingest_grid
+            sasi_ingestor.ingest()
+            compositions.append(dict(
+                [(c.id, (c.habitat_composition, c.depth)) 
+                 for c in dao.query('__Cell').all()]))
+        self.assertEquals(compositions[0], compositions[1])
+        # Only tiles with cell origins are read.
+        self.assertEquals(grid_bboxes, [(0, -3, 1.5, -1.5), (0, 0, 1.5, 1.5)])
+
+    def test_incremental_ingest(self):
+        self.data_dir = self.generate_data_dir(
+            time_start=0,
+            time_end=1,
+            time_step=1,
+        )
+
+        dao = self.get_dao()
+        SASI_Ingestor(data_dir=self.data_dir, dao=dao,
+                      hash_cell_size=8).ingest()
+        num_efforts = len(dao.query('__Effort').all())
+        num_cells = len(dao.query('__Cell').all())
+
+        # Re-ingesting unchanged data should skip all sections.
+        sasi_ingestor = SASI_Ingestor(data_dir=self.data_dir, dao=dao,
+                                      hash_cell_size=8)
+        sasi_ingestor.ingest_grid = None
+        sasi_ingestor.ingest(incremental=True)
+        self.assertEquals(len(dao.query('__Effort').all()), num_efforts)
+        self.assertEquals(len(dao.query('__Cell').all()), num_cells)
+
+        # Changed sections should be replaced.
+        substrates_file = os.path.join(self.data_dir, 'substrates.csv')
+        with open(substrates_file, 'ab') as f:
+            f.write("S3,,,\n")
+        SASI_Ingestor(data_dir=self.data_dir, dao=dao, 
+                      hash_cell_size=8).ingest(incremental=True)
+        substrate_ids = [s.id for s in dao.query('__Substrate').all()]
+        self.assertEquals(['S1', 'S2', 'S3'], sorted(substrate_ids))
+
+    def test_incremental_config_changes(self):
+        self.data_dir = self.generate_data_dir(
+            time_start=0,
+            time_end=1,
+            time_step=1,
+        )
+        dao = self.get_dao()
+        SASI_Ingestor(data_dir=self.data_dir, dao=dao,
+                      hash_cell_size=8).ingest()
+
+        def ingest_cells(config):
+            sasi_ingestor = SASI_Ingestor(data_dir=self.data_dir, dao=dao,
+                                          hash_cell_size=8, config=config)
+            grid_calls = []
+            ingest_grid = sasi_ingestor.ingest_grid
+            def recording_ingest_grid(**kwargs):
+                grid_calls.append(kwargs)
+                return ingest_grid(**kwargs)
+            sasi_ingestor.ingest_grid = recording_ingest_grid
+            sasi_ingestor.ingest(incremental=True)
+            return len(grid_calls) > 0
+
+        # Settings that cells depend on should force a re-ingest.
+        self.assertFalse(ingest_cells({}))
+        self.assertTrue(ingest_cells({'reproject_once': True}))
+        self.assertTrue(ingest_cells({'reproject_once': True,
+                                      'projected_units_per_degree': 1e5}))
+        self.assertTrue(ingest_cells({'sections': {'grid': {'limit': 1}}}))
+        self.assertEquals(len(dao.query('__Cell').all()), 1)
+
+        # As should CSV section settings.
+        self.assertTrue(len(dao.query('__Effort').all()) > 1)
+        SASI_Ingestor(data_dir=self.data_dir, dao=dao, hash_cell_size=8,
+                      config={'sections': {'fishing_efforts': {'limit': 1}}}
+                      ).ingest(incremental=True)
+        self.assertEquals(len(dao.query('__Effort').all()), 1)
+
+    def test_overlay_cache(self):
+        self.data_dir = self.generate_data_dir(
+            time_start=0,
+            time_end=1,
+            time_step=1,
+        )
+        cache_dir = tempfile.mkdtemp()
+        config = {'overlay_cache_dir': cache_dir}
+
+        compositions = []
+        for i in range(2):
+            dao = self.get_dao()
+            sasi_ingestor = SASI_Ingestor(data_dir=self.data_dir, dao=dao,
+                                          hash_cell_size=8, config=config)
+            if i == 1:
+                # Habitats should not be needed on a cache hit.
+                sasi_ingestor.ingest_habitats = None
+            sasi_ingestor.ingest()
+            compositions.append(dict(
+                [(c.id, (c.habitat_composition, c.depth)) 
+                 for c in dao.query('__Cell').all()]))
+            # Cached compositions are keyed by cell id, which is stable
+            # across processes.
+            cached = OverlayCache(cache_dir=cache_dir).get(
+                sasi_ingestor.get_overlay_cache_key())
+            self.assertEquals(sorted(cached.keys()), [0, 1])
+        shutil.rmtree(cache_dir)
+        self.assertEquals(compositions[0], compositions[1])
+
+    def test_create_indexes(self):
+        self.data_dir = self.generate_data_dir(
+            time_start=0,
+            time_end=1,
+            time_step=1,
+        )
+        dao = self.get_dao(defer_indexes=True)
+        self.assertEquals(inspect(dao.session.bind).get_indexes('effort'), [])
+
+        sasi_ingestor = SASI_Ingestor(data_dir=self.data_dir, dao=dao,
+                                      hash_cell_size=8,
+                                      config={'create_indexes': True})
+        sasi_ingestor.ingest()
+        index_names = [i['name'] for i in 
+                       inspect(dao.session.bind).get_indexes('effort')]
+        self.assertTrue('ix_effort_time_cell_gear' in index_names)
+
+    def test_zip_ingest(self):
+        self.data_dir = self.generate_data_dir(
+            time_start=0,
+            time_end=1,
+            time_step=1,
+        )
+        zip_dir = tempfile.mkdtemp()
+        zip_path = os.path.join(zip_dir, 'data.zip')
+        z = zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED)
+        for root, dirs, files in os.walk(self.data_dir):
+            for fn in files:
+                path = os.path.join(root, fn)
+                z.write(path, os.path.relpath(path, self.data_dir))
+        z.close()
+
+        def get_contents(dao):
+            return (
+                sorted([s.id for s in dao.query('__Substrate').all()]),
+                sorted([(e.cell_id, e.time, e.gear_id, e.a)
+                        for e in dao.query('__Effort').all()]),
+                sorted([(c.id, c.habitat_composition, c.depth)
+                        for c in dao.query('__Cell').all()]),
+            )
+
+        contents = []
+        for data_dir in [self.data_dir, zip_path]:
+            dao = self.get_dao()
+            sasi_ingestor = SASI_Ingestor(data_dir=data_dir, dao=dao,
+                                          hash_cell_size=8)
+            sasi_ingestor.ingest()
+            contents.append(get_contents(dao))
+        # The zip file is closed after the ingest.
+        self.assertEquals(sasi_ingestor.data_source.zf.fp, None)
+        shutil.rmtree(zip_dir)
+        self.assertEquals(contents[0], contents[1])
+        self.assertTrue(contents[0][2])
+
+    def test_resume_ingest(self):
+        self.data_dir = self.generate_data_dir(
+            time_start=0,
+            time_end=1,
+            time_step=1,
+        )
+        config = {'batch_size': 1, 'commit_interval': 1}
+
+        def get_efforts(dao):
+            return sorted([(e.cell_id, e.time, e.gear_id) 
+                           for e in dao.query('__Effort').all()])
+
+        def get_cells(dao):
+            return sorted([(c.id, c.habitat_composition) 
+                           for c in dao.query('__Cell').all()])
+
+        expected_dao = self.get_dao()
+        SASI_Ingestor(data_dir=self.data_dir, dao=expected_dao,
+                      hash_cell_size=8, config=config).ingest()
+
+        # Interrupt ingest after the first efforts commit.
+        dao = self.get_dao()
+        save_dicts = dao.save_dicts
+        effort_batches = []
+        def interrupted_save_dicts(source, dicts, **kwargs):
+            if source == 'Effort':
+                effort_batches.append(dicts)
+                if len(effort_batches) > 1:
+                    raise IngestInterrupted()
+            return save_dicts(source, dicts, **kwargs)
+        dao.save_dicts = interrupted_save_dicts
+        self.assertRaises(IngestInterrupted, SASI_Ingestor(
+            data_dir=self.data_dir, dao=dao, hash_cell_size=8,
+            config=config).ingest)
+        dao.session.rollback()
+        del dao.save_dicts
+        checkpoint = dao.get_ingest_checkpoint('fishing_efforts')
+        self.assertEquals(checkpoint.status, 'in_progress')
+        self.assertEquals(checkpoint.num_records, 1)
+        self.assertEquals(len(get_efforts(dao)), 1)
+
+        # Resume, and interrupt after the first cells commit.
+        bulk_insert_objects = dao.bulk_insert_objects
+        def interrupted_bulk_insert_objects(source, objects, **kwargs):
+            if source == 'Cell' and dao.get_source_ids('Cell'):
+                raise IngestInterrupted()
+            return bulk_insert_objects(source, objects, **kwargs)
+        dao.bulk_insert_objects = interrupted_bulk_insert_objects
+        self.assertRaises(IngestInterrupted, SASI_Ingestor(
+            data_dir=self.data_dir, dao=dao, hash_cell_size=8,
+            config=config).ingest, resume=True)
+        dao.session.rollback()
+        del dao.bulk_insert_objects
+        self.assertEquals(get_efforts(dao), get_efforts(expected_dao))
+        self.assertEquals(dao.get_ingest_checkpoint('cells').num_records, 1)
+
+        # Resume again, skipping completed sections and saved cells.
+        saved_cell_ids = dao.get_source_ids('Cell')
+        self.assertEquals(len(saved_cell_ids), 1)
+        sasi_ingestor = SASI_Ingestor(data_dir=self.data_dir, dao=dao,
+                                      hash_cell_size=8, config=config)
+        computed_cells = []
+        compute_compositions = sasi_ingestor.compute_compositions
+        def recording_compute_compositions(*args, **kwargs):
+            computed_cells.extend(sasi_ingestor.cells.keys())
+            return compute_compositions(*args, **kwargs)
+        sasi_ingestor.compute_compositions = recording_compute_compositions
+        sasi_ingestor.ingest(resume=True)
+        self.assertEquals(len(computed_cells), len(get_cells(dao)) - 1)
+        self.assertFalse(saved_cell_ids & set(computed_cells))
+        self.assertEquals(
+            sorted([s.id for s in dao.query('__Substrate').all()]),
+            ['S1', 'S2'])
+        self.assertEquals(get_efforts(dao), get_efforts(expected_dao))
+        self.assertEquals(get_cells(dao), get_cells(expected_dao))
+        self.assertEquals(dao.get_ingest_checkpoint('cells').status,
+                          'complete')
+
+    def test_metrics_report(self):
+        self.data_dir = self.generate_data_dir(
+            time_start=0,
+            time_end=1,
+            time_step=1,
+        )
+        metrics_file = os.path.join(self.data_dir, 'metrics.json')
+        sasi_ingestor = SASI_Ingestor(data_dir=self.data_dir,
+                                      dao=self.get_dao(), hash_cell_size=8,
+                                      config={'metrics_file': metrics_file})
+        sasi_ingestor.ingest()
+        with open(metrics_file) as f:
+            report = json.load(f)
+        self.assertEquals(report['sections'],
+                          sasi_ingestor.get_metrics()['sections'])
+        sections = dict([(s['section'], s) for s in report['sections']])
+        self.assertEquals(sections['fishing_efforts']['records'],
+                          len(sasi_ingestor.dao.query('__Effort').all()))
+        for section in ['substrates', 'grid', 'habitats', 'compositions',
+                        'save_cells']:
+            self.assertTrue(section in sections)
+        self.assertTrue(report['num_commits'] > 0)
+
+    def test_reproject_once(self):
+        self.data_dir = self.generate_data_dir(
+            time_start=0,
+            time_end=1,
+            time_step=1,
+        )
+
+        dao = self.get_dao()
+        SASI_Ingestor(
+            data_dir=self.data_dir, 
+            dao=dao,
+            hash_cell_size=8,
+            config={'reproject_once': True},
+        ).ingest()
+        expected_composition = {
+            ('S1', 'High'): .25,
+            ('S1', 'Low'): .25,
+            ('S2', 'High'): .25,
+            ('S2', 'Low'): .25,
+        }
+        for c in dao.query('__Cell').all():
+            self.assertTrue(c.geom_wkt.startswith('MULTIPOLYGON'))
+            # Edges are straight in the projected CRS rather than along
+            # meridians, so fractions are only approximately equal.
+            for key, v in c.habitat_composition.items():
+                self.assertAlmostEquals(expected_composition[key], v,
+                                        places=3)
+
+    def test_validate_rows(self):
+        self.data_dir = self.generate_data_dir(
+            time_start=0,
+            time_end=1,
+            time_step=1,
+        )
+        va_file = os.path.join(self.data_dir, 'va.csv')
+        with open(va_file, 'rb') as f:
+            rows = list(csv.DictReader(f))
+        rows[-1]['s'] = 'x'
+        with open(va_file, 'wb') as f:
+            writer = csv.DictWriter(f, rows[0].keys())
+            writer.writeheader()
+            writer.writerows(rows)
+
+        dao = self.get_dao()
+        sasi_ingestor = SASI_Ingestor(data_dir=self.data_dir, dao=dao,
+                                      hash_cell_size=8,
+                                      config={'validate_rows': True})
+        try:
+            sasi_ingestor.ingest()
+            self.fail("Expected a SASIDataValidationError")
+        except SASIDataValidationError as e:
+            self.assertTrue("row %s, column 's'" % len(rows) in str(e))
+            self.assertTrue("is not a number" in str(e))
+
     def generate_data_dir(self, **kwargs):
         data = {}
 
@@ -115,28 +501,28 @@ class SASI_Ingestor_TestCase(unittest.TestCase):
                 x0=0,y0=-2,x1=1, y1=2,
                 substrate_id='S1',
                 energy_id='Low',
-                z=10
+                depth=10
             ),
             dg.generate_habitat(
                 id=2,
                 x0=1,y0=-2,x1=2, y1=2,
                 substrate_id='S1',
                 energy_id='High',
-                z=20
+                depth=20
             ),
             dg.generate_habitat(
                 id=3,
                 x0=2,y0=-2,x1=3, y1=2,
                 substrate_id='S2',
                 energy_id='Low',
-                z=30
+                depth=30
             ),
             dg.generate_habitat(
                 id=4,
                 x0=3,y0=-2,x1=4, y1=2,
                 substrate_id='S2',
                 energy_id='High',
-                z=40
+                depth=40
             ),
         ]
 
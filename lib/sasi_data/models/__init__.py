@@ -10,3 +10,5 @@ from va import VA
 from model_parameters import ModelParameters
 from sasi_result import SasiResult
 from fishing_result import FishingResult
+from section_fingerprint import SectionFingerprint
+from ingest_checkpoint import IngestCheckpoint
@@ -0,0 +1,12 @@
+class IngestCheckpoint(object):
+    """ Progress of a section's ingest. status is 'in_progress' or
+    'complete'. offset is a section-specific position, e.g. a byte
+    offset in a CSV file, and num_records is the number of records
+    committed so far. """
+    def __init__(self, id=None, fingerprint=None, status=None, offset=None,
+                 num_records=None):
+        self.id = id
+        self.fingerprint = fingerprint
+        self.status = status
+        self.offset = offset
+        self.num_records = num_records
@@ -0,0 +1,4 @@
+class SectionFingerprint(object):
+    def __init__(self, id=None, fingerprint=None):
+        self.id = id
+        self.fingerprint = fingerprint
@@ -0,0 +1,124 @@
+import unittest
+from sasi_data import validation
+import sasi_data.util.data_generators as dg
+import csv
+import os
+import shutil
+import tempfile
+import zipfile
+
+
+class SASIDataValidatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def write_csv(self, section, rows):
+        with open(os.path.join(self.data_dir, "%s.csv" % section), 'wb') as f:
+            csv.writer(f).writerows(rows)
+
+    def test_generated_data_dir(self):
+        data_dir = dg.generate_data_dir(data_dir=self.data_dir, data={})
+        validator = validation.SASIDataValidator(data_dir=data_dir, deep=True,
+                                                 check_references=True)
+        validator.validate()
+        self.assertEquals(validator.errors, [])
+
+    def test_csv_section_errors(self):
+        self.write_csv('va', [
+            ['gear_id', 'feature_id', 'substrate_id', 'energy_id', 's'],
+        ])
+        self.write_csv('model_parameters', [
+            ['time_start', 'time_end', 'time_step', 't_0'],
+            ['0', '10', '1', 'zero'],
+            ['', '10', '1', '0'],
+        ])
+        validator = validation.SASIDataValidator(data_dir=self.data_dir,
+                                                 deep=True)
+        self.assertRaises(validation.SASIDataValidationError,
+                          validator.validate)
+        errors = dict([(e.split(':')[0], e) for e in validator.errors])
+        self.assertTrue("Column 'r' was not found" in errors["Section 'va'"])
+        self.assertTrue("2 invalid values" in
+                        errors["Section 'model_parameters'"])
+        self.assertTrue("File 'substrates.csv' was not found" in
+                        errors["Section 'substrates'"])
+        # Optional sections may be missing.
+        self.assertFalse("Section 'fishing_efforts'" in errors)
+        self.assertFalse("Section 'map_layers'" in errors)
+
+    def test_zipped_data_dir(self):
+        self.write_csv('va', [
+            ['gear_id', 'feature_id', 'substrate_id', 'energy_id', 's'],
+        ])
+        zip_path = os.path.join(self.data_dir, 'data.zip')
+        z = zipfile.ZipFile(zip_path, 'w')
+        z.write(os.path.join(self.data_dir, 'va.csv'), 'data/va.csv')
+        z.close()
+        validator = validation.SASIDataValidator(data_dir=zip_path,
+                                                 deep=True)
+        self.assertRaises(validation.SASIDataValidationError,
+                          validator.validate)
+        errors = dict([(e.split(':')[0], e) for e in validator.errors])
+        self.assertTrue("Column 'r' was not found" in errors["Section 'va'"])
+        self.assertTrue("File 'gears.csv' was not found" in
+                        errors["Section 'gears'"])
+
+    def test_row_validator(self):
+        row_validator = validation.get_row_validator('va', max_samples=1)
+        records = [
+            {'gear_id': 'G1', 'feature_id': 'F1', 'substrate_id': 'S1',
+             'energy_id': 'High', 's': '1', 'r': ''},
+            {'gear_id': '', 'feature_id': 'F1', 'substrate_id': 'S1',
+             'energy_id': 'High', 's': 'x', 'r': '1.0'},
+        ]
+        self.assertEquals(
+            row_validator.process_batch(records=records[:1], counter=1),
+            records[:1])
+        self.assertRaises(validation.SASIDataValidationError,
+                          row_validator.process_batch, records=records,
+                          counter=3)
+        self.assertEquals(row_validator.num_errors, 2)
+        self.assertEquals(row_validator.samples,
+                          ["row 3, column 'gear_id': '' is empty"])
+
+    def test_referential_integrity(self):
+        self.write_csv('gears', [['id', 'generic_id'], ['G1', 'G1'],
+                                 ['G2', 'G9']])
+        self.write_csv('substrates', [['id'], ['S1']])
+        self.write_csv('energies', [['id'], ['High']])
+        self.write_csv('features', [['id', 'category'], ['F1', '']])
+        self.write_csv('va', [
+            ['gear_id', 'feature_id', 'substrate_id', 'energy_id', 's', 'r'],
+            ['G1', 'F1', 'S1', 'High', '1', '1'],
+            ['G2', 'F2', 'S1', 'Low', '1', '1'],
+            ['G3', 'F1', 'S1', 'Low', '1', '1'],
+        ])
+        self.write_csv('fishing_efforts', [
+            ['cell_id', 'time', 'gear_id'],
+            ['1', '0', 'G1'],
+            ['2', '0', 'G4'],
+        ])
+        reference_validator = validation.ReferentialIntegrityValidator(
+            data_dir=self.data_dir, max_samples=1)
+        self.assertRaises(validation.SASIDataValidationError,
+                          reference_validator.validate)
+        missing = dict([
+            ((r['section'], r['column']), (r['num_missing'], r['samples']))
+            for r in reference_validator.results])
+        self.assertEquals(missing[('va', 'gear_id')], (1, [(3, 'G3')]))
+        self.assertEquals(missing[('va', 'feature_id')], (1, [(2, 'F2')]))
+        self.assertEquals(missing[('va', 'energy_id')], (2, [(2, 'Low')]))
+        self.assertEquals(missing[('va', 'substrate_id')], (0, []))
+        self.assertEquals(missing[('gears', 'generic_id')], (1, [(2, 'G9')]))
+        self.assertEquals(missing[('fishing_efforts', 'gear_id')],
+                          (1, [(2, 'G4')]))
+        # No grid or feature categories, so those checks are skipped.
+        self.assertFalse(('fishing_efforts', 'cell_id') in missing)
+        self.assertFalse(('features', 'category') in missing)
+
+if __name__ == '__main__':
+    unittest.main()
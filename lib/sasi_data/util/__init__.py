@@ -1,6 +1,7 @@
 import platform
 import collections
 import functools
+import threading
 
 
 class memoized(object):
@@ -23,6 +24,48 @@ class memoized(object):
         return functools.partial(self.__call__, obj)
 
 
+class LRUCache(object):
+    """ Bounded, thread-safe least-recently-used cache.
+    Keeps hit/miss counters, for profiling. """
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.d = collections.OrderedDict()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, factory):
+        """ Get the value for key, creating it with factory() if
+        it is not cached yet. """
+        with self.lock:
+            if key in self.d:
+                self.hits += 1
+                value = self.d.pop(key)
+                self.d[key] = value
+                return value
+            self.misses += 1
+            value = factory()
+            self.d[key] = value
+            while len(self.d) > self.max_size:
+                self.d.popitem(last=False)
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.d.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'size': len(self.d),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
 if platform.system() == 'Java':
     from .gis.jy_gis import JyGISUtil as gis
     from .shapefile.jy_shapefile import JyShapefileUtil as shapefile
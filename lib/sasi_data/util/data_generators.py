@@ -464,7 +464,7 @@ def generate_data_dir(data_dir="", data={}, time_start=0, time_end=10,
             'geometry': json.loads(
                 gis_util.wkb_to_geojson(cell.geom.geom_wkb)),
             'properties': {
-                'ID': str(cell_counter),
+                'ID': str(cell.id),
             }
         })
         cell_counter += 1
@@ -0,0 +1,159 @@
+""" Access to SASI data files, in a directory or a zip archive.
+Paths are relative to the data dir, e.g. 'grid/grid.shp'. """
+import sasi_data.util.fingerprint as fingerprint_util
+import os
+import platform
+import shutil
+import tempfile
+import zipfile
+
+
+def get_data_source(data_dir):
+    """ Returns a data source for a data dir or a zip archive. """
+    if data_dir and os.path.isfile(data_dir) and \
+       zipfile.is_zipfile(data_dir):
+        return ZipDataSource(zip_file=data_dir)
+    return DirDataSource(data_dir=data_dir)
+
+
+class DirDataSource(object):
+    def __init__(self, data_dir=None):
+        self.data_dir = data_dir
+
+    def get_path(self, path):
+        return os.path.join(self.data_dir, path)
+
+    def exists(self, path):
+        return os.path.isfile(self.get_path(path))
+
+    def isdir(self, path):
+        return os.path.isdir(self.get_path(path))
+
+    def listdir(self, path):
+        return os.listdir(self.get_path(path))
+
+    def open(self, path):
+        return open(self.get_path(path), 'rb')
+
+    def get_size(self, path):
+        return os.path.getsize(self.get_path(path))
+
+    def get_shapefile_path(self, path):
+        """ Returns a path that shapefile readers can open. """
+        return self.get_path(path)
+
+    def get_shapefile_paths(self, path):
+        """ Paths of all of a shapefile's component files. """
+        shp_dir = os.path.dirname(path)
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        if not self.isdir(shp_dir):
+            return []
+        return [os.path.join(shp_dir, name) for name in self.listdir(shp_dir)
+                if os.path.splitext(name)[0] == base_name]
+
+    def get_fingerprint(self, paths, hash_contents=False, extra=None):
+        return fingerprint_util.get_files_fingerprint(
+            [self.get_path(path) for path in paths],
+            hash_contents=hash_contents, extra=extra)
+
+    def hash_file(self, path):
+        return fingerprint_util.hash_file(self.get_path(path))
+
+    def close(self):
+        pass
+
+
+class ZipDataSource(object):
+    """ Reads data files directly from a zip archive.
+    Members are streamed out of the archive, without extracting them.
+    Shapefiles are opened through GDAL's /vsizip/ virtual filesystem.
+    On Jython, shapefile members are extracted to a temp dir instead.
+    If root is None, and all members are in one top-level dir, that
+    dir is used as the root.
+    """
+    def __init__(self, zip_file=None, root=None):
+        self.zip_file = os.path.abspath(zip_file)
+        self.zf = zipfile.ZipFile(self.zip_file)
+        self.infos = dict([(info.filename, info)
+                           for info in self.zf.infolist()
+                           if not info.filename.endswith('/')])
+        if root is None:
+            root = self.find_root()
+        self.root = root
+        self.tmp_dir = None
+
+    def find_root(self):
+        top_level = set([name.split('/')[0] for name in self.infos])
+        if len(top_level) == 1:
+            name = top_level.pop()
+            if name not in self.infos:
+                return name + '/'
+        return ''
+
+    def get_name(self, path):
+        return self.root + path.replace(os.sep, '/').strip('/')
+
+    def exists(self, path):
+        return self.get_name(path) in self.infos
+
+    def isdir(self, path):
+        prefix = self.get_name(path) + '/'
+        for name in self.infos:
+            if name.startswith(prefix):
+                return True
+        return False
+
+    def listdir(self, path):
+        prefix = self.get_name(path) + '/'
+        children = set()
+        for name in self.infos:
+            if name.startswith(prefix):
+                children.add(name[len(prefix):].split('/')[0])
+        return sorted(children)
+
+    def open(self, path):
+        # ZipFile opens a new file handle for each member, so members
+        # can be read concurrently.
+        return self.zf.open(self.get_name(path))
+
+    def get_size(self, path):
+        return self.infos[self.get_name(path)].file_size
+
+    def get_shapefile_path(self, path):
+        if platform.system() == 'Java':
+            return self.extract_shapefile(path)
+        return "/vsizip/%s/%s" % (self.zip_file, self.get_name(path))
+
+    def extract_shapefile(self, path):
+        if self.tmp_dir is None:
+            self.tmp_dir = tempfile.mkdtemp(prefix="sasi_data.")
+        for component in self.get_shapefile_paths(path):
+            self.zf.extract(self.get_name(component), self.tmp_dir)
+        return os.path.join(self.tmp_dir, self.get_name(path))
+
+    def get_shapefile_paths(self, path):
+        shp_dir = os.path.dirname(path)
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        return [os.path.join(shp_dir, name) for name in self.listdir(shp_dir)
+                if os.path.splitext(name)[0] == base_name]
+
+    def get_fingerprint(self, paths, hash_contents=False, extra=None):
+        """ Member CRCs are content checksums, so fingerprints always
+        reflect contents. """
+        fingerprints = []
+        for path in sorted(paths):
+            if self.exists(path):
+                fingerprints.append("%s:%s" % (os.path.basename(path),
+                                               self.hash_file(path)))
+        return fingerprint_util.combine_fingerprints(fingerprints,
+                                                     extra=extra)
+
+    def hash_file(self, path):
+        info = self.infos[self.get_name(path)]
+        return "%08x:%s" % (info.CRC & 0xffffffff, info.file_size)
+
+    def close(self):
+        self.zf.close()
+        if self.tmp_dir:
+            shutil.rmtree(self.tmp_dir)
+            self.tmp_dir = None
@@ -0,0 +1,42 @@
+class DictionaryEncoding(object):
+    """ Maps values to dense integer codes, in order of first appearance.
+    None is always encoded as NULL_CODE. """
+
+    NULL_CODE = -1
+
+    def __init__(self, values=None):
+        self.values = []
+        self.codes = {}
+        for value in values or []:
+            self.encode(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, value):
+        """ Returns the code for a value, adding the value if it is new. """
+        if value is None:
+            return self.NULL_CODE
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def encode_many(self, values):
+        return [self.encode(value) for value in values]
+
+    def get_code(self, value):
+        """ Returns the code for a value, or None if the value is unknown. """
+        if value is None:
+            return self.NULL_CODE
+        return self.codes.get(value)
+
+    def decode(self, code):
+        if code is None or code < 0:
+            return None
+        return self.values[code]
+
+    def decode_many(self, codes):
+        return [self.decode(code) for code in codes]
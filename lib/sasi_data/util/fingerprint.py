@@ -0,0 +1,52 @@
+""" Content fingerprints for data files. """
+import hashlib
+import os
+
+
+def hash_file(path, block_size=2**20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+def get_file_fingerprint(path, hash_contents=False):
+    """ Fingerprint from a file's size and mtime, and optionally
+    a hash of its contents. """
+    stat = os.stat(path)
+    parts = [os.path.basename(path), str(stat.st_size), 
+             repr(stat.st_mtime)]
+    if hash_contents:
+        parts.append(hash_file(path))
+    return ':'.join(parts)
+
+def get_files_fingerprint(paths, hash_contents=False, extra=None):
+    """ Combined fingerprint for a set of files, or None if
+    none of the files exist. extra values are included in the
+    fingerprint, e.g. settings that results depend on. """
+    file_fingerprints = [get_file_fingerprint(path, hash_contents)
+                         for path in sorted(paths) if os.path.isfile(path)]
+    return combine_fingerprints(file_fingerprints, extra=extra)
+
+def combine_fingerprints(fingerprints, extra=None):
+    """ Hash of a list of fingerprints, or None if the list is empty. """
+    if not fingerprints:
+        return None
+    h = hashlib.sha1()
+    for part in fingerprints:
+        h.update(part)
+    if extra is not None:
+        h.update(repr(extra))
+    return h.hexdigest()
+
+def get_shapefile_paths(shp_file):
+    """ Paths of all of a shapefile's component files. """
+    shp_dir = os.path.dirname(shp_file)
+    base_name = os.path.splitext(os.path.basename(shp_file))[0]
+    if not os.path.isdir(shp_dir):
+        return []
+    return [os.path.join(shp_dir, name) for name in os.listdir(shp_dir)
+            if os.path.splitext(name)[0] == base_name]
@@ -7,6 +7,16 @@ class GISUtil(object):
     def reproject_shape(clz, shape, crs1, crs2):
         pass
 
+    @classmethod
+    def prepare_shape(clz, shape):
+        """ Get a version of shape optimized for repeated
+        predicate tests, e.g. prepared.intersects(other). """
+        return shape
+
+    @classmethod
+    def reproject_shapes(clz, shapes, crs1, crs2):
+        return [clz.reproject_shape(shape, crs1, crs2) for shape in shapes]
+
     @classmethod
     def get_mollweide_crs(clz):
         return """
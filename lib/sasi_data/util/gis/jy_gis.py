@@ -35,6 +35,15 @@ class Shape(object):
     def area(self):
         return self._jgeom.area
 
+    def intersects(self, other):
+        return self._jgeom.intersects(other._jgeom)
+
+    def within(self, other):
+        return self._jgeom.within(other._jgeom)
+
+    def contains(self, other):
+        return self._jgeom.contains(other._jgeom)
+
 class JyGISUtil(GISUtil):
     @classmethod
     def geojson_to_shape(clz, geojson):
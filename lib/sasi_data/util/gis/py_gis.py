@@ -1,14 +1,23 @@
 from common_gis import GISUtil
+from sasi_data.util import LRUCache
 from pyproj import Proj, transform
 from shapely import wkb, wkt
 import shapely.geometry as geometry
+from shapely.prepared import prep
 from shapely.coords import CoordinateSequence
 from osgeo import osr
+import numpy
+import functools
 import json
 import re
 
 
 class PyGISUtil(GISUtil):
+    # Parsed CRS and transformer objects, keyed by normalized
+    # CRS definitions.
+    crs_cache = LRUCache(max_size=64)
+    transformer_cache = LRUCache(max_size=256)
+
     @classmethod
     def geojson_to_shape(clz, geojson):
         if isinstance(geojson, str) or isinstance(geojson, unicode):
@@ -21,52 +30,114 @@ class PyGISUtil(GISUtil):
 
     @classmethod
     def reproject_shape(clz, shape, crs1, crs2):
-        crs1 = clz.get_crs(crs1)
-        crs2 = clz.get_crs(crs2)
+        return clz.reproject_shapes([shape], crs1, crs2)[0]
+
+    @classmethod
+    def reproject_shapes(clz, shapes, crs1, crs2):
+        """ Reprojects a list of shapes.
+        The coordinates of all the shapes are gathered into one array,
+        transformed with a single call, and then split back into
+        shapes by their offsets. """
+        layouts = []
+        coord_arrays = []
+        for shape in shapes:
+            if shape.is_empty:
+                layouts.append(None)
+                continue
+            polygon_rings = clz.get_coord_arrays(shape)
+            layouts.append((shape.geom_type, 
+                            [[len(ring) for ring in rings]
+                             for rings in polygon_rings]))
+            for rings in polygon_rings:
+                coord_arrays.extend(rings)
+
+        if coord_arrays:
+            coords = numpy.concatenate(coord_arrays)
+            xs, ys = clz.get_transformer(crs1, crs2)(coords[:, 0],
+                                                     coords[:, 1])
+            proj_coords = numpy.column_stack((xs, ys))
+
+        proj_shapes = []
+        offset = 0
+        for shape, layout in zip(shapes, layouts):
+            if layout is None:
+                proj_shapes.append(shape)
+                continue
+            geom_type, polygon_ring_sizes = layout
+            polygon_rings = []
+            for ring_sizes in polygon_ring_sizes:
+                rings = []
+                for size in ring_sizes:
+                    rings.append(proj_coords[offset:offset + size])
+                    offset += size
+                polygon_rings.append(rings)
+            proj_shapes.append(clz.coord_arrays_to_shape(geom_type,
+                                                         polygon_rings))
+        return proj_shapes
+
+    @classmethod
+    def get_coord_arrays(clz, shape):
+        """ Get a shape's coordinates as lists of (n, 2) arrays,
+        one list of rings per polygon. """
+        def to_array(coords):
+            return numpy.asarray(coords, dtype=float)[:, :2]
         if isinstance(shape, geometry.Polygon):
-            proj_shape = clz.reproject_polygon(shape, crs1, crs2)
+            polygons = [shape]
         elif isinstance(shape, geometry.MultiPolygon):
-            proj_shape = clz.reproject_multipolygon(shape, crs1, crs2)
-        elif isinstance(shape, geometry.Point):
-            proj_shape = clz.reproject_point(shape, crs1, crs2)
-        elif isinstance(shape, geometry.LineString):
-            proj_shape = clz.reproject_linestring(shape, crs1, crs2)
-        return proj_shape
+            polygons = shape.geoms
+        else:
+            return [[to_array(shape.coords)]]
+        return [
+            [to_array(polygon.exterior.coords)] + [
+                to_array(ring.coords) for ring in polygon.interiors]
+            for polygon in polygons
+        ]
+
+    @classmethod
+    def coord_arrays_to_shape(clz, geom_type, polygon_rings):
+        if geom_type == 'Polygon':
+            rings = polygon_rings[0]
+            return geometry.Polygon(rings[0], rings[1:])
+        elif geom_type == 'MultiPolygon':
+            return geometry.MultiPolygon(
+                [(rings[0], rings[1:]) for rings in polygon_rings])
+        elif geom_type == 'Point':
+            return geometry.Point(polygon_rings[0][0][0])
+        elif geom_type == 'LinearRing':
+            return geometry.polygon.LinearRing(polygon_rings[0][0])
+        elif geom_type == 'LineString':
+            return geometry.polygon.LineString(polygon_rings[0][0])
 
     @classmethod
     def reproject_polygon(clz, polygon, crs1, crs2):
-        geo_json = { "type": "Polygon", "coordinates": [] }
-        new_exterior = clz.reproject_linestring(polygon.exterior, crs1, crs2)
-        geo_json['coordinates'].append(new_exterior)
-        for interior_ring in polygon.interiors:
-            new_ring = clz.reproject_linestring(interior_ring, crs1, crs2)
-            geo_json['coordinates'].append(new_ring)
-        return geometry.shape(geo_json)
+        return clz.reproject_shapes([polygon], crs1, crs2)[0]
 
     @classmethod
     def reproject_multipolygon(clz, multipolygon, crs1, crs2):
-        geo_json = { "type": "MultiPolygon", "coordinates": [] }
-        for polygon in multipolygon.geoms:
-            proj_polygon = clz.reproject_polygon(polygon, crs1, crs2)
-            polygon_coords = [proj_polygon.exterior.coords] + [
-                ring.coords for ring in proj_polygon.interiors ]
-            geo_json['coordinates'].append(polygon_coords)
-        return geometry.shape(geo_json)
+        return clz.reproject_shapes([multipolygon], crs1, crs2)[0]
 
     @classmethod
     def reproject_point(clz, point, crs1, crs2):
         geo_json = { "type": "Point", "coordinates": [] }
         coords = zip(*point.coords)
-        new_coords = transform(crs1, crs2, *coords)
+        new_coords = clz.get_transformer(crs1, crs2)(*coords)
         geo_json['coordinates'] = zip(*new_coords)
         return geometry.shape(geo_json)
 
     @classmethod
     def reproject_linestring(clz, linestring, crs1, crs2):
         x1, y1 = zip(*linestring.coords)
-        x2, y2 = transform(crs1, crs2, x1, y1)
+        x2, y2 = clz.get_transformer(crs1, crs2)(x1, y1)
         return geometry.polygon.LineString(zip(x2, y2))
 
+    @classmethod
+    def polygon_to_multipolygon(clz, polygon):
+        return geometry.MultiPolygon([polygon])
+
+    @classmethod
+    def prepare_shape(clz, shape):
+        return prep(shape)
+
     @classmethod
     def get_intersection(clz, shape1, shape2):
         if shape1.intersects(shape2):
@@ -93,12 +164,31 @@ class PyGISUtil(GISUtil):
     def wkb_to_wkt(clz, wkb_value):
         return wkt.dumps(wkb.loads(wkb_value))
 
+    @classmethod
+    def normalize_crs(clz, crs):
+        """ Converts crs definition to a hashable key. """
+        if isinstance(crs, Proj):
+            return crs.srs
+        elif isinstance(crs, dict):
+            return tuple(sorted(crs.items()))
+        elif isinstance(crs, str) or isinstance(crs, unicode):
+            crs = ' '.join(crs.split())
+            if crs.upper().startswith('EPSG:'):
+                crs = crs.upper()
+            return crs
+        return crs
+
     @classmethod
     def get_crs(clz, crs):
         """ Converts crs definition to pyproj obj. """
         if isinstance(crs, Proj): 
             return crs
-        elif isinstance(crs, dict):
+        return clz.crs_cache.get(clz.normalize_crs(crs),
+                                 lambda: clz.parse_crs(crs))
+
+    @classmethod
+    def parse_crs(clz, crs):
+        if isinstance(crs, dict):
             return Proj(**crs)
         elif isinstance(crs, str) or isinstance(crs, unicode):
             # Convert WKT crs string to proj4 string.
@@ -107,11 +197,28 @@ class PyGISUtil(GISUtil):
                 srs.ImportFromWkt(crs)
                 crs = srs.ExportToProj4()
             # Convert EPSG code to proj4 string.
-            elif crs.startswith('EPSG:'):
-                epsg, epsg_code = crs.split(':')
+            elif crs.strip().upper().startswith('EPSG:'):
+                epsg, epsg_code = crs.strip().split(':')
                 crs = '+init=epsg:%s' % epsg_code
             return Proj(crs)
 
+    @classmethod
+    def get_transformer(clz, crs1, crs2):
+        """ Get a function that transforms coordinate sequences
+        from crs1 to crs2, e.g. xs2, ys2 = transformer(xs1, ys1). """
+        key = (clz.normalize_crs(crs1), clz.normalize_crs(crs2))
+        def create_transformer():
+            return functools.partial(transform, clz.get_crs(crs1),
+                                     clz.get_crs(crs2))
+        return clz.transformer_cache.get(key, create_transformer)
+
+    @classmethod
+    def get_crs_cache_stats(clz):
+        return {
+            'crs': clz.crs_cache.get_stats(),
+            'transformers': clz.transformer_cache.get_stats(),
+        }
+
     @classmethod
     def proj4_to_wkt(clz, proj4_crs):
         if isinstance(proj4_crs, dict):
@@ -4,7 +4,35 @@ from test_common_gis import GISCommonTest
 
 
 class PyGISTestCase(unittest.TestCase, GISCommonTest):
-    pass
+
+    def test_crs_cache(self):
+        py_gis.crs_cache.clear()
+        crs1 = py_gis.get_crs(py_gis.get_mollweide_crs())
+        crs2 = py_gis.get_crs("  %s\n" % py_gis.get_mollweide_crs())
+        self.assertTrue(crs1 is crs2)
+        stats = py_gis.get_crs_cache_stats()['crs']
+        self.assertEquals(stats['misses'], 1)
+        self.assertEquals(stats['hits'], 1)
+
+    def test_transformer_cache(self):
+        t1 = py_gis.get_transformer('EPSG:4326', py_gis.get_mollweide_crs())
+        t2 = py_gis.get_transformer('epsg:4326', py_gis.get_mollweide_crs())
+        self.assertTrue(t1 is t2)
+
+    def test_reproject_shapes(self):
+        shapes = [
+            py_gis.geojson_to_shape(self.generate_rect_geojson([1, -1, 2, -2])),
+            py_gis.polygon_to_multipolygon(py_gis.geojson_to_shape(
+                self.generate_rect_geojson([3, 3, 4, 4]))),
+        ]
+        proj_shapes = py_gis.reproject_shapes(
+            shapes, 'EPSG:4326', py_gis.get_mollweide_crs())
+        self.assertEquals([s.geom_type for s in proj_shapes],
+                          ['Polygon', 'MultiPolygon'])
+        rereproj_shapes = py_gis.reproject_shapes(
+            proj_shapes, py_gis.get_mollweide_crs(), 'EPSG:4326')
+        for shape, rereproj_shape in zip(shapes, rereproj_shapes):
+            self.assertTrue(shape.almost_equals(rereproj_shape, decimal=6))
 
 if __name__ == '__main__':
     unittest.main()
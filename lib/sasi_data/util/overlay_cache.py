@@ -0,0 +1,96 @@
+import cPickle as pickle
+import hashlib
+import os
+import tempfile
+import time
+
+
+class OverlayCache(object):
+    """ On-disk cache of overlay results, e.g. cell habitat compositions.
+    Entries are written to a temp file and then renamed into place, so
+    concurrent readers never see partially written entries.
+    Entries older than max_age seconds are evicted, and then the oldest
+    entries are evicted until the cache is under max_size bytes.
+    Reading an entry refreshes its age.
+    """
+    def __init__(self, cache_dir=None, max_age=None, max_size=None):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_size = max_size
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # Another process may have created it.
+                if not os.path.isdir(self.cache_dir):
+                    raise
+
+    @classmethod
+    def get_key(clz, *parts):
+        h = hashlib.sha1()
+        for part in parts:
+            h.update(repr(part))
+        return h.hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, "%s.pkl" % key)
+
+    def get(self, key):
+        """ Returns the cached value, or None. """
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            path = self.get_path(key)
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)
+            os.rename(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        if self.max_age is not None:
+            cutoff = time.time() - self.max_age
+            while entries and entries[0][0] < cutoff:
+                self.remove(entries.pop(0)[2])
+
+        if self.max_size is not None:
+            total_size = sum([entry[1] for entry in entries])
+            while entries and total_size > self.max_size:
+                mtime, size, path = entries.pop(0)
+                self.remove(path)
+                total_size -= size
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -89,11 +89,16 @@ class JyShapefileReader(object):
             'properties': properties,
         }
 
-    def records(self):
+    def records(self, bbox=None):
         while (self.feature_iterator.hasNext()):
             feature = self.feature_iterator.next()
 
             jgeom = feature.getDefaultGeometry()
+            if bbox is not None:
+                e = jgeom.getEnvelopeInternal()
+                if (e.getMinX() > bbox[2] or e.getMaxX() < bbox[0] or
+                    e.getMinY() > bbox[3] or e.getMaxY() < bbox[1]):
+                    continue
             geojson_geom = json.loads(jy_gis.GeoJSON.toString(jgeom))
 
             properties = {}
@@ -16,7 +16,11 @@ class FionaShapefileReader(object):
     def get_fields(self):
         return self.c.schema['properties'].keys()
 
-    def records(self):
+    def records(self, bbox=None):
+        """ Iterate over records, optionally only those whose
+        geometries intersect bbox. """
+        if bbox is not None:
+            return self.c.filter(bbox=tuple(bbox))
         return self.c.__iter__()
 
     def close(self):
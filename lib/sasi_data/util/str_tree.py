@@ -0,0 +1,79 @@
+from math import ceil, sqrt
+
+
+class STRTree(object):
+    """ Packed R-tree, bulk-loaded with the Sort-Tile-Recursive algorithm.
+    Has the same interface as SpatialHash. Items are collected with
+    add_rect, and the tree is built on the first query after adding
+    items.
+    """
+    def __init__(self, node_capacity=10):
+        self.node_capacity = int(node_capacity)
+        self.entries = []
+        self.root = None
+
+    def add_rect(self, r, obj):
+        self.entries.append((tuple(r), obj))
+        self.root = None
+
+    def build(self):
+        """ Pack entries into nodes, level by level, until
+        one root node is left. Nodes are (mbr, children, is_leaf)
+        tuples. """
+        if not self.entries:
+            self.root = ((0, 0, 0, 0), [], True)
+            return
+        nodes = self._pack(self.entries, True)
+        while len(nodes) > 1:
+            nodes = self._pack([(n[0], n) for n in nodes], False)
+        self.root = nodes[0]
+
+    def _pack(self, items, is_leaf):
+        capacity = self.node_capacity
+        num_nodes = int(ceil(len(items)/float(capacity)))
+        num_slices = int(ceil(sqrt(num_nodes)))
+        slice_size = num_slices * capacity
+
+        items = sorted(items, key=lambda item: item[0][0] + item[0][2])
+        nodes = []
+        for i in range(0, len(items), slice_size):
+            slice_items = sorted(items[i:i + slice_size],
+                                 key=lambda item: item[0][1] + item[0][3])
+            for j in range(0, len(slice_items), capacity):
+                children = slice_items[j:j + capacity]
+                if is_leaf:
+                    children = list(children)
+                else:
+                    children = [child for mbr, child in children]
+                nodes.append((self._get_mbr(slice_items[j:j + capacity]),
+                              children, is_leaf))
+        return nodes
+
+    def _get_mbr(self, items):
+        return (
+            min([item[0][0] for item in items]),
+            min([item[0][1] for item in items]),
+            max([item[0][2] for item in items]),
+            max([item[0][3] for item in items]),
+        )
+
+    def items_for_point(self, p):
+        return self.items_for_rect((p[0], p[1], p[0], p[1]))
+
+    def items_for_rect(self, r):
+        if self.root is None:
+            self.build()
+        x0, y0, x1, y1 = r
+        items = set()
+        stack = [self.root]
+        while stack:
+            mbr, children, is_leaf = stack.pop()
+            if mbr[0] > x1 or mbr[2] < x0 or mbr[1] > y1 or mbr[3] < y0:
+                continue
+            if is_leaf:
+                for c, obj in children:
+                    if not (c[0] > x1 or c[2] < x0 or c[1] > y1 or c[3] < y0):
+                        items.add(obj)
+            else:
+                stack.extend(children)
+        return items
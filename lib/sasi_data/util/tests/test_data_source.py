@@ -0,0 +1,85 @@
+import unittest
+from sasi_data.util.data_source import (get_data_source, DirDataSource,
+                                        ZipDataSource)
+import sasi_data.util.data_generators as dg
+import sasi_data.util.shapefile as shapefile_util
+import os
+import shutil
+import tempfile
+import zipfile
+
+
+class DataSourceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp_dir, 'data')
+        os.makedirs(os.path.join(self.data_dir, 'grid'))
+        with open(os.path.join(self.data_dir, 'gears.csv'), 'wb') as f:
+            f.write("id,label\nG1,Gear 1\n")
+        dg.generate_map_layer(layer_id='grid',
+                              layer_dir=os.path.join(self.data_dir, 'grid'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def zip_data_dir(self, basename=None):
+        zip_path = os.path.join(self.tmp_dir, 'data.zip')
+        z = zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED)
+        for root, dirs, files in os.walk(self.data_dir):
+            for fn in files:
+                path = os.path.join(root, fn)
+                name = os.path.relpath(path, self.data_dir)
+                if basename:
+                    name = os.path.join(basename, name)
+                z.write(path, name)
+        z.close()
+        return zip_path
+
+    def check_data_source(self, data_source):
+        self.assertTrue(data_source.exists('gears.csv'))
+        self.assertFalse(data_source.exists('va.csv'))
+        self.assertTrue(data_source.isdir('grid'))
+        self.assertFalse(data_source.isdir('habitats'))
+        self.assertEquals(data_source.open('gears.csv').read(),
+                          "id,label\nG1,Gear 1\n")
+        self.assertEquals(data_source.get_size('gears.csv'), 19)
+        extensions = [os.path.splitext(path)[1] for path in
+                      data_source.get_shapefile_paths(
+                          os.path.join('grid', 'grid.shp'))]
+        for extension in ['.shp', '.shx', '.dbf']:
+            self.assertTrue(extension in extensions)
+        reader = shapefile_util.get_shapefile_reader(
+            data_source.get_shapefile_path(os.path.join('grid', 'grid.shp')))
+        self.assertEquals(len(list(reader.records())), 3)
+        reader.close()
+
+    def test_dir_data_source(self):
+        data_source = get_data_source(self.data_dir)
+        self.assertTrue(isinstance(data_source, DirDataSource))
+        self.check_data_source(data_source)
+
+    def test_zip_data_source(self):
+        data_source = get_data_source(self.zip_data_dir())
+        self.assertTrue(isinstance(data_source, ZipDataSource))
+        self.assertEquals(data_source.root, '')
+        self.check_data_source(data_source)
+        data_source.close()
+
+    def test_zip_data_source_root(self):
+        data_source = get_data_source(self.zip_data_dir(basename='data'))
+        self.assertEquals(data_source.root, 'data/')
+        self.check_data_source(data_source)
+        data_source.close()
+
+    def test_zip_fingerprint(self):
+        data_source = get_data_source(self.zip_data_dir())
+        fingerprint = data_source.get_fingerprint(['gears.csv'])
+        self.assertEquals(fingerprint,
+                          data_source.get_fingerprint(['gears.csv']))
+        self.assertNotEquals(fingerprint, data_source.get_fingerprint(
+            ['gears.csv'], extra='EPSG:4326'))
+        data_source.close()
+
+if __name__ == '__main__':
+    unittest.main()
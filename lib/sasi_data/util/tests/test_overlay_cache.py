@@ -0,0 +1,41 @@
+import unittest
+from sasi_data.util.overlay_cache import OverlayCache
+import tempfile
+import shutil
+import os
+import time
+
+
+class OverlayCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_get_put(self):
+        cache = OverlayCache(cache_dir=self.cache_dir)
+        key = OverlayCache.get_key('grid_hash', 'habs_hash', 'crs')
+        self.assertEquals(cache.get(key), None)
+        value = {1: ({('S1', 'E1'): 1.0}, 10.0)}
+        cache.put(key, value)
+        self.assertEquals(OverlayCache(cache_dir=self.cache_dir).get(key),
+                          value)
+
+    def test_evict_by_size(self):
+        cache = OverlayCache(cache_dir=self.cache_dir, max_size=1)
+        cache.put('a', range(100))
+        self.assertEquals(cache.get('a'), None)
+
+    def test_evict_by_age(self):
+        cache = OverlayCache(cache_dir=self.cache_dir, max_age=60)
+        cache.put('a', 'a')
+        old_time = time.time() - 120
+        os.utime(cache.get_path('a'), (old_time, old_time))
+        cache.put('b', 'b')
+        self.assertEquals(cache.get('a'), None)
+        self.assertEquals(cache.get('b'), 'b')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from sasi_data.util.str_tree import STRTree
+
+
+class STRTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rects = {}
+        for x in range(20):
+            for y in range(20):
+                self.rects[(x, y)] = (x, y, x + .5, y + .5)
+        # A large rect, spanning many small ones.
+        self.rects['big'] = (-100, -100, 100, 100)
+
+    def brute_force(self, r):
+        return set([key for key, c in self.rects.items()
+                    if not (c[0] > r[2] or c[2] < r[0] or 
+                            c[1] > r[3] or c[3] < r[1])])
+
+    def test_items_for_rect(self):
+        tree = STRTree(node_capacity=4)
+        for key, rect in self.rects.items():
+            tree.add_rect(rect, key)
+        for r in [(0, 0, 1, 1), (3.7, 2.2, 8.1, 4), (50, 50, 60, 60),
+                  (-200, -200, -150, -150)]:
+            self.assertEquals(tree.items_for_rect(r), self.brute_force(r))
+
+    def test_items_for_point(self):
+        tree = STRTree()
+        for key, rect in self.rects.items():
+            tree.add_rect(rect, key)
+        self.assertEquals(tree.items_for_point((2.25, 3.25)),
+                          set([(2, 3), 'big']))
+
+    def test_add_after_query(self):
+        tree = STRTree()
+        self.assertEquals(tree.items_for_rect((0, 0, 1, 1)), set())
+        tree.add_rect((0, 0, 1, 1), 'a')
+        self.assertEquals(tree.items_for_rect((0, 0, 1, 1)), set(['a']))
+
+if __name__ == '__main__':
+    unittest.main()
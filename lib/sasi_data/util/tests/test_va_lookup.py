@@ -0,0 +1,56 @@
+import unittest
+from sasi_data.util.va_lookup import VALookup
+from sasi_data.util.dictionary_encoding import DictionaryEncoding
+from sasi_data.models import VA
+import numpy as np
+
+
+class VALookupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.vas = [
+            VA(gear_id='G1', feature_id='F1', substrate_id='S1',
+               energy_id='High', s=1, r=2),
+            VA(gear_id='G1', feature_id='F2', substrate_id='S1',
+               energy_id='Low', s=3, r=0),
+            {'gear_id': 'G2', 'feature_id': 'F1', 'substrate_id': 'S2',
+             'energy_id': 'High', 's': 2, 'r': 1},
+        ]
+
+    def test_get(self):
+        va_lookup = VALookup(vas=self.vas)
+        self.assertEquals(va_lookup.get('G1', 'F1', 'S1', 'High'), (1, 2))
+        self.assertEquals(va_lookup.get('G2', 'F1', 'S2', 'High'), (2, 1))
+        self.assertEquals(va_lookup.get('G2', 'F1', 'S1', 'High'), None)
+        self.assertEquals(va_lookup.get('G9', 'F1', 'S1', 'High'), None)
+
+    def test_vectorized_lookup(self):
+        va_lookup = VALookup(vas=self.vas)
+        s, r = va_lookup.lookup(
+            ['G1', 'G1', 'G2', 'G9'],
+            ['F1', 'F2', 'F1', 'F1'],
+            ['S1', 'S1', 'S2', 'S1'],
+            ['High', 'Low', 'High', 'High'],
+        )
+        self.assertEquals(s.tolist(), [1, 3, 2, VALookup.MISSING])
+        self.assertEquals(r.tolist(), [2, 0, 1, VALookup.MISSING])
+
+        # Scalars broadcast against arrays.
+        s, r = va_lookup.lookup('G1', ['F1', 'F2'], 'S1', ['High', 'Low'])
+        self.assertEquals(s.tolist(), [1, 3])
+
+    def test_shared_codebooks(self):
+        gear_codebook = DictionaryEncoding(['G2', 'G1'])
+        va_lookup = VALookup(vas=self.vas, codebooks={'gear': gear_codebook})
+        gear_codes = np.array([gear_codebook.get_code('G1'),
+                               gear_codebook.get_code('G2'), 7])
+        s, r = va_lookup.lookup_codes(
+            gear_codes,
+            va_lookup.encode('feature', ['F1', 'F1', 'F1']),
+            va_lookup.encode('substrate', ['S1', 'S2', 'S1']),
+            va_lookup.encode('energy', ['High', 'High', 'High']),
+        )
+        self.assertEquals(s.tolist(), [1, 2, VALookup.MISSING])
+
+if __name__ == '__main__':
+    unittest.main()
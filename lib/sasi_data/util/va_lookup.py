@@ -0,0 +1,111 @@
+from sasi_data.util.dictionary_encoding import DictionaryEncoding
+import numpy as np
+
+
+class VALookup(object):
+    """ Dense lookup table for vulnerability assessments.
+    Holds s and r values in 4-d arrays indexed by gear, feature, substrate
+    and energy codes. Missing combinations hold MISSING.
+    Codebooks can be shared with a DAO which encodes dimensions, so that
+    encoded ids can be looked up directly.
+    """
+
+    MISSING = -1
+    DIMENSIONS = ['gear', 'feature', 'substrate', 'energy']
+
+    def __init__(self, vas=None, codebooks=None):
+        self.codebooks = {}
+        for dimension in self.DIMENSIONS:
+            codebook = (codebooks or {}).get(dimension)
+            if codebook is None:
+                codebook = DictionaryEncoding()
+            self.codebooks[dimension] = codebook
+        self.load(vas or [])
+
+    @classmethod
+    def from_dao(clz, dao, codebooks=None):
+        if codebooks is None and getattr(dao, 'encode_dimensions', False):
+            codebooks = dao.codebooks
+        return clz(vas=dao.query('__VA'), codebooks=codebooks)
+
+    def load(self, vas):
+        rows = []
+        for va in vas:
+            key = tuple([self.codebooks[dimension].encode(
+                self.get_value(va, "%s_id" % dimension))
+                for dimension in self.DIMENSIONS])
+            rows.append((key, self.get_value(va, 's'),
+                         self.get_value(va, 'r')))
+
+        shape = tuple([len(self.codebooks[dimension])
+                       for dimension in self.DIMENSIONS])
+        self.s = np.empty(shape, dtype='i2')
+        self.s.fill(self.MISSING)
+        self.r = np.empty(shape, dtype='i2')
+        self.r.fill(self.MISSING)
+        for key, s, r in rows:
+            # Skip rows with null ids.
+            if min(key) < 0:
+                continue
+            self.s[key] = self.MISSING if s is None else s
+            self.r[key] = self.MISSING if r is None else r
+
+    def get_value(self, va, attr):
+        if isinstance(va, dict):
+            return va.get(attr)
+        return getattr(va, attr, None)
+
+    def encode(self, dimension, values):
+        """ Returns an array of codes for an array of ids.
+        Unknown ids get code -1. """
+        values = np.asarray(values, dtype=object)
+        if values.size == 0:
+            return np.empty(values.shape, dtype='i4')
+        unique_values, inverse = np.unique(values, return_inverse=True)
+        codebook = self.codebooks[dimension]
+        unique_codes = []
+        for value in unique_values:
+            code = codebook.get_code(value)
+            unique_codes.append(-1 if code is None else code)
+        return np.array(unique_codes, dtype='i4')[inverse].reshape(
+            values.shape)
+
+    def lookup_codes(self, gear_codes, feature_codes, substrate_codes,
+                     energy_codes):
+        """ Returns (s, r) arrays for broadcastable arrays of codes.
+        Unknown codes and missing combinations give MISSING. """
+        keys = np.broadcast_arrays(
+            *[np.asarray(codes, dtype='i8') for codes in [
+                gear_codes, feature_codes, substrate_codes, energy_codes]])
+        shape = keys[0].shape
+        if self.s.size == 0:
+            missing = np.empty(shape, dtype=self.s.dtype)
+            missing.fill(self.MISSING)
+            return missing, missing.copy()
+
+        valid = np.ones(shape, dtype=bool)
+        idxs = []
+        for key, size in zip(keys, self.s.shape):
+            valid &= (key >= 0) & (key < size)
+            idxs.append(np.clip(key, 0, size - 1))
+        idxs = tuple(idxs)
+        s = np.where(valid, self.s[idxs], self.MISSING).astype(self.s.dtype)
+        r = np.where(valid, self.r[idxs], self.MISSING).astype(self.r.dtype)
+        return s, r
+
+    def lookup(self, gear_ids, feature_ids, substrate_ids, energy_ids):
+        """ Returns (s, r) arrays for broadcastable arrays of ids. """
+        return self.lookup_codes(
+            self.encode('gear', gear_ids),
+            self.encode('feature', feature_ids),
+            self.encode('substrate', substrate_ids),
+            self.encode('energy', energy_ids),
+        )
+
+    def get(self, gear_id, feature_id, substrate_id, energy_id):
+        """ Returns (s, r) for one combination, or None if missing. """
+        s, r = self.lookup([gear_id], [feature_id], [substrate_id],
+                           [energy_id])
+        if s[0] == self.MISSING and r[0] == self.MISSING:
+            return None
+        return int(s[0]), int(r[0])
@@ -1,161 +1,231 @@
+from sasi_data.ingestors.ingestor import Ingestor
+from sasi_data.ingestors.csv_reader import CSVReader
+from sasi_data.ingestors.processor import Processor
+import sasi_data.util.shapefile as shapefile_util
+from sasi_data.util.data_source import get_data_source
+from multiprocessing.pool import ThreadPool
 import os
 import csv
-import shapefile
-import tempfile
+import logging
 
 
 shp_extensions = ['shp', 'shx', 'dbf']
 
+# Requirements for CSV sections, keyed by section id.
+# numeric_columns must be empty or parse as numbers, and
+# non_empty_columns must have values.
+csv_sections = {
+    'substrates': {
+        'required_columns': ['id'],
+        'non_empty_columns': ['id'],
+    },
+    'energies': {
+        'required_columns': ['id'],
+        'non_empty_columns': ['id'],
+    },
+    'feature_categories': {
+        'required_columns': ['id'],
+        'non_empty_columns': ['id'],
+    },
+    'features': {
+        'required_columns': ['id', 'category'],
+        'non_empty_columns': ['id'],
+    },
+    'gears': {
+        'required_columns': ['id'],
+        'non_empty_columns': ['id'],
+        'numeric_columns': ['min_depth', 'max_depth'],
+    },
+    'va': {
+        'required_columns': ['gear_id', 'feature_id', 'substrate_id',
+                             'energy_id', 's', 'r'],
+        'non_empty_columns': ['gear_id', 'feature_id', 'substrate_id',
+                              'energy_id'],
+        'numeric_columns': ['s', 'r'],
+    },
+    'fishing_efforts': {
+        'optional': True,
+        'required_columns': ['cell_id', 'time', 'gear_id'],
+        'non_empty_columns': ['cell_id', 'time', 'gear_id'],
+        'numeric_columns': ['cell_id', 'time', 'a', 'hours_fished',
+                            'value'],
+    },
+    'model_parameters': {
+        'required_columns': ['time_start', 'time_end', 'time_step'],
+        'non_empty_columns': ['time_start', 'time_end', 'time_step'],
+        'numeric_columns': ['time_start', 'time_end', 'time_step',
+                            't_0', 't_1', 't_2', 't_3',
+                            'w_0', 'w_1', 'w_2', 'w_3'],
+    },
+}
+
+# Requirements for shapefile sections.
+shp_sections = {
+    'grid': {
+        'required_columns': ['ID'],
+    },
+    'habitats': {
+        'required_columns': ['SUBSTRATE', 'ENERGY', 'Z'],
+    },
+}
+
 class SASIDataValidationError(Exception): pass
 
 class SASIDataValidator(object):
-
-    def __init__(self, config=None):
+    """ Validates a SASI data dir.
+    Sections are validated concurrently, on a pool of 'workers' threads.
+    Errors from all sections are collected, and raised together.
+    If deep is True, rows in CSV sections are also type-checked, in a
+    single streaming pass per file. SASI_Ingestor can do the same checks
+    during ingest, with its 'validate_rows' option.
+    If check_references is True, ids in fact sections are also checked
+    against the sections they refer to.
+    data_dir can be a directory, or a zip archive of one.
+    """
+
+    def __init__(self, data_dir=None, config={}, workers=4, deep=False,
+                 check_references=False, logger=logging.getLogger(),
+                 data_source=None, **kwargs):
+        self.data_dir = data_dir
+        if data_source is None:
+            data_source = get_data_source(data_dir)
+        self.data_source = data_source
         self.config = config
+        self.workers = workers
+        self.deep = deep
+        self.check_references = check_references
+        self.logger = logger
+        self.errors = []
+
+    def get_sections(self):
+        return sorted(csv_sections.keys()) + sorted(shp_sections.keys()) + [
+            'map_layers']
 
     def validate(self):
         """ Validate SASI Data, section by section."""
-        sections = [
-            'substrates',
-            'features',
-            'gears',
-            'va',
-            'habitats',
-            'grid',
-            'model_parameters',
-            'fishing_efforts',
-            'map_layers',
-        ]
-
-        for section in sections:
+        sections = self.get_sections()
+        if self.workers > 1:
+            pool = ThreadPool(self.workers)
+            try:
+                section_errors = pool.map(self.get_section_errors, sections)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            section_errors = [self.get_section_errors(section)
+                              for section in sections]
+
+        self.errors = []
+        for errors in section_errors:
+            self.errors.extend(errors)
+
+        if self.check_references:
+            reference_validator = ReferentialIntegrityValidator(
+                data_dir=self.data_dir, data_source=self.data_source,
+                workers=self.workers, logger=self.logger)
+            try:
+                reference_validator.validate()
+            except SASIDataValidationError:
+                self.errors.extend(reference_validator.get_errors())
+
+        if self.errors:
+            raise SASIDataValidationError("\n".join(self.errors))
+
+    def get_section_errors(self, section):
+        """ Returns a list of error messages for a section. """
+        try:
             self.validate_section(section)
+        except SASIDataValidationError as e:
+            return ["Section '%s': %s" % (section, e)]
+        return []
 
     def validate_section(self, section):
-        validator = self.get_section_validator(self.config, section)
+        validator = self.get_section_validator(section)
         if validator:
             validator.validate()
 
-    def get_section_validator(self, config=None, section=None):
+    def get_section_validator(self, section=None):
         validator = None
+        section_config = self.config.get('sections', {}).get(section, {})
 
         # CSV sections.
-        if section in [
-            'substrates',
-            'features',
-            'gears',
-            'va',
-            'model_parameters',
-        ] :
-            data_file_path = os.path.join(section, 'data', section + '.csv')
-            required_file_paths = [data_file_path]
-
-            required_columns = []
-            if section == 'substrates':
-                required_columns = [
-                    'id'
-                ]
-
-            elif section == 'features':
-                required_columns = [
-                    'id', 
-                    'category'
-                ]
-
-            elif section == 'va':
-                required_columns = [
-                    "Gear ID", 
-                    "Substrate ID",
-                    "Feature ID",
-                    "Energy",
-                    "S",
-                    "R"
-                ]
-
-            elif section == 'model_parameters':
-                required_columns = [
-                    "time_start",
-                    "time_end",
-                    "time_step",
-                ]
-
+        if section in csv_sections:
+            spec = csv_sections[section]
+            data_file_path = "%s.csv" % section
             validator = CSVFileSectionValidator(
-                config=config, 
-                section=section, 
-                required_file_paths=required_file_paths,
+                data_dir=self.data_dir,
+                data_source=self.data_source,
+                section=section,
+                required_file_paths=[data_file_path],
+                optional=spec.get('optional', False),
                 column_requirements=[{
                     'file_path': data_file_path,
-                    'required_columns': required_columns
-                }]
+                    'required_columns': spec['required_columns'],
+                }],
+                deep=self.deep,
+                limit=section_config.get('limit'),
+                logger=self.logger,
             )
 
         # Shapefile sections.
-        elif section in [
-            'habitats',
-            'grid',
-        ] :
+        elif section in shp_sections:
             required_file_paths = [
-                os.path.join(section, 'data', section) + '.' + extension for
+                os.path.join(section, section) + '.' + extension for
                 extension in shp_extensions]
-            shp_file_path = required_file_paths[0]
-
-            required_columns = []
-            if section == 'habitats':
-                required_columns = [
-                    'substrate',
-                    'z',
-                    'energy'
-                ]
-
-            elif section == 'grid':
-                required_columns = [
-                    'type_id',
-                    'type',
-                ]
-
             validator = ShpFileSectionValidator(
-                config=config, 
-                section=section, 
+                data_dir=self.data_dir,
+                data_source=self.data_source,
+                section=section,
                 required_file_paths=required_file_paths,
                 column_requirements=[{
-                    'file_path': shp_file_path,
-                    'required_columns': required_columns
+                    'file_path': required_file_paths[0],
+                    'required_columns': shp_sections[section][
+                        'required_columns'],
                 }]
             )
 
-        # Fishing efforts section.
-        elif section == 'fishing_efforts':
-            validator = FishingEffortsFileSectionValidator(
-                config=config, 
-                section=section, 
-            )
-
         # Map Layers section.
         elif section == 'map_layers':
             validator = MapLayersFileSectionValidator(
-                config=config, 
-                section=section, 
+                data_dir=self.data_dir,
+                data_source=self.data_source,
+                section=section,
             )
 
         return validator
 
 class SectionValidator(object):
-    def __init__(self, data_dir, section=None):
+    def __init__(self, data_dir=None, section=None, data_source=None,
+                 **kwargs):
         self.data_dir = data_dir
         self.section = section
-        self.section_dir = os.path.join(data_dir, section['id'])
+        if data_source is None:
+            data_source = get_data_source(data_dir)
+        self.data_source = data_source
 
 class FileSectionValidator(SectionValidator):
-    def __init__(self, required_file_paths=[], **kwargs):
+    """ Checks that required files exist. If optional is True, the
+    section is skipped when none of its files exist. """
+    def __init__(self, required_file_paths=[], optional=False, **kwargs):
         SectionValidator.__init__(self, **kwargs)
         self.required_file_paths = required_file_paths
+        self.optional = optional
+
+    def is_missing(self):
+        for file_path in self.required_file_paths:
+            if self.data_source.exists(file_path):
+                return False
+        return True
 
     def validate(self):
+        if self.optional and self.is_missing():
+            return False
         self.validate_required_files()
+        return True
 
     def validate_required_files(self):
         for file_path in self.required_file_paths:
-            abs_file_path = os.path.join(self.section_dir, file_path)
-            if not os.path.isfile(abs_file_path):
+            if not self.data_source.exists(file_path):
                 raise SASIDataValidationError("File '%s' was not found. "
                                               " This file is required."
                                               " Names are case-sensitive."
@@ -164,18 +234,25 @@ class FileSectionValidator(SectionValidator):
 
 
 class CSVFileSectionValidator(FileSectionValidator):
-    def __init__(self, column_requirements=[], **kwargs):
+    def __init__(self, column_requirements=[], deep=False, limit=None,
+                 logger=logging.getLogger(), **kwargs):
         FileSectionValidator.__init__(self, **kwargs)
         self.column_requirements = column_requirements
+        self.deep = deep
+        self.limit = limit
+        self.logger = logger
 
     def validate(self):
-        super(CSVFileSectionValidator, self).validate()
+        if not super(CSVFileSectionValidator, self).validate():
+            return False
         for requirement in self.column_requirements:
             file_path = requirement['file_path']
-            abs_file_path os.path.join(self.section_dir, file_path)
             required_columns = requirement['required_columns']
-            csv_reader = csv.DictReader(open(abs_file_path, 'rb'))
-            csv_columns = csv_reader.fieldnames
+            f = self.data_source.open(file_path)
+            try:
+                csv_columns = csv.reader(f).next()
+            finally:
+                f.close()
             for column in required_columns:
                 if column not in csv_columns:
                     raise SASIDataValidationError(
@@ -183,7 +260,23 @@ class CSVFileSectionValidator(FileSectionValidator):
                         " This column is required."
                         " Names are case-sensitive."
                         % (column, file_path)
-                    ) 
+                    )
+            if self.deep:
+                self.validate_rows(file_path)
+        return True
+
+    def validate_rows(self, file_path):
+        Ingestor(
+            reader=CSVReader(
+                csv_file=self.data_source.open(file_path),
+                total_bytes=self.data_source.get_size(file_path)),
+            processors=[get_row_validator(self.section)],
+            logger=self.logger,
+            limit=self.limit,
+            count_records=False,
+            log_interval=1e6,
+            batch_size=1e4,
+        ).ingest()
 
 class ShpFileSectionValidator(FileSectionValidator):
     def __init__(self, column_requirements=[], **kwargs):
@@ -191,95 +284,337 @@ class ShpFileSectionValidator(FileSectionValidator):
         self.column_requirements = column_requirements
 
     def validate(self):
-        super(ShpFileSectionValidator, self).validate()
+        if not super(ShpFileSectionValidator, self).validate():
+            return False
         for requirement in self.column_requirements:
             file_path = requirement['file_path']
             required_columns = requirement['required_columns']
-            abs_file_path = os.path.join(self.section_dir, file_path)
-            shp_reader = shapefile.Reader(abs_file_path)
-            shp_columns = [shp_field[0].upper() 
-                           for shp_field in shp_reader.fields]
+            shp_reader = shapefile_util.get_shapefile_reader(
+                self.data_source.get_shapefile_path(file_path))
+            shp_columns = [field.upper() for field in shp_reader.fields]
+            shp_reader.close()
             for column in required_columns:
                 if column.upper() not in shp_columns:
-                    raise ValidationError(
-                        "Column '%s' was not found in file '%s'." 
+                    raise SASIDataValidationError(
+                        "Column '%s' was not found in file '%s'."
                         " This column is required."
                         " Names are *not* case-sensitive for this type of file."
                         % (column, file_path)
                     )
-
-class FishingEffortsFileSectionValidator(FileSectionValidator):
-    def __init__(self, **kwargs):
-        FileSectionValidator.__init__(self, **kwargs)
-
-    def validate(self):
-        super(FishingEffortsFileSectionValidator, self).validate()
-        model_config_path = os.path.join(self.section_dir, 'model.csv')
-        csv_validator = CSVFileSectionValidator(
-            config=self.config,
-            section=self.section,
-            required_file_paths=[model_config_path],
-            column_requirements=[{
-                'file_path': model_config_path,
-                'required_columns': ['model_type']
-            }]
-        )
-        csv_validator.validate()
-        model_config_reader = csv.DictReader(open(model_config_path, 'rb'))
-        model_config = model_config_reader.next()
-        model_type = model_config.get('model_type')
-
-        if model_type == 'from_data':
-            data_file_path = os.path.join(self.section, 'data',
-                                     'fishing_efforts.csv')
-            data_validator = CSVFileSectionValidator(
-                config=self.config,
-                section=self.section,
-                required_file_paths=[data_file_path],
-                column_requirements=[{
-                    'file_path': data_file_path,
-                    'required_columns': [
-                        #@TODO: FILL THIS IN.
-                    ]
-                }]
-            )
-            data_validator.validate()
-
-        elif not model_type == 'uniform_density':
-            raise SASIDataValidationError(
-                "Invalid fishing effort model type '%s', in file"
-                " '%s', in archive file '%s'."
-                " Model type must be 'from_data', or 'uniform_density'."
-                " Names are case-sensitive."
-            % (model_type, model_config_path, self.section_file.filename)) 
-
+        return True
 
 class MapLayersFileSectionValidator(FileSectionValidator):
-    def __init__(self, **kwargs):
-        FileSectionValidator.__init__(self, **kwargs)
+    """ Checks that each map layer dir has a shapefile.
+    The map layers section is optional. """
 
     def validate(self):
-        super(MapLayersFileSectionValidator, self).validate()
-        map_layers = []
-        data_base_path = os.path.join(self.section_dir, "data")
-        for item in os.listdir(data_base_path):
-            item_path = os.path.join(data_base_path, item)
-            if os.path.isdir(item_path):
-                map_layers.append({
-                    'name': item,
-                    'path': item_path
-                })
-
-        for map_layer in map_layers:
+        if not self.data_source.isdir(self.section):
+            return False
+        for item in sorted(self.data_source.listdir(self.section)):
+            if not self.data_source.isdir(os.path.join(self.section, item)):
+                continue
             required_file_paths = []
             for extension in shp_extensions:
-                required_file_paths.append(os.path.join(self.section, 
-                    'data', map_layer['name'], 
-                    map_layer['name'] + '.' + extension))
-
+                required_file_paths.append(os.path.join(
+                    self.section, item, item + '.' + extension))
             layer_validator = FileSectionValidator(
-                config=self.config,
+                data_dir=self.data_dir,
+                data_source=self.data_source,
                 section=self.section,
                 required_file_paths=required_file_paths
             )
             layer_validator.validate()
+        return True
+
+
+def check_number(value):
+    if value is None or value == '':
+        return
+    float(value)
+
+class RowTypeValidator(Processor):
+    """ Type-checks records, and passes them through unchanged.
+    This can run standalone, or as the first processor in an ingest
+    chain, so that rows are checked in the same pass that ingests them.
+    Failures are counted, and the first max_samples are kept.
+    A SASIDataValidationError is raised once a record or batch has
+    failures, so that invalid rows never reach later processors.
+    """
+    def __init__(self, section=None, numeric_columns=[],
+                 non_empty_columns=[], max_samples=10, **kwargs):
+        self.section = section
+        self.numeric_columns = numeric_columns
+        self.non_empty_columns = non_empty_columns
+        self.max_samples = max_samples
+        self.num_errors = 0
+        self.samples = []
+
+    def check(self, record, counter):
+        for column in self.non_empty_columns:
+            value = record.get(column)
+            if value is None or value == '':
+                self.add_error(counter, column, value, "is empty")
+        for column in self.numeric_columns:
+            try:
+                check_number(record.get(column))
+            except (ValueError, TypeError):
+                self.add_error(counter, column, record.get(column),
+                               "is not a number")
+
+    def add_error(self, counter, column, value, msg):
+        self.num_errors += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append("row %s, column '%s': %r %s" % (
+                counter, column, value, msg))
+
+    def process(self, data=None, counter=None, **kwargs):
+        self.check(data, counter)
+        self.raise_errors()
+        return data
+
+    def process_batch(self, records=None, counter=None, **kwargs):
+        start = counter - len(records)
+        for i, record in enumerate(records):
+            self.check(record, start + i + 1)
+        self.raise_errors()
+        return records
+
+    def finish(self):
+        self.raise_errors()
+
+    def raise_errors(self):
+        if self.num_errors:
+            raise SASIDataValidationError(
+                "%s invalid values in '%s', e.g.:\n%s" % (
+                    self.num_errors, self.section, "\n".join(self.samples)))
+
+def get_row_validator(section, **kwargs):
+    """ Returns a RowTypeValidator for a CSV section. """
+    spec = csv_sections.get(section, {})
+    return RowTypeValidator(
+        section=section,
+        numeric_columns=spec.get('numeric_columns', []),
+        non_empty_columns=spec.get('non_empty_columns', []),
+        **kwargs
+    )
+
+
+def parse_cell_id(value):
+    return int(float(value))
+
+# Dimension key sets: (section, key column, key parser).
+key_sections = {
+    'substrates': ('substrates', 'id', None),
+    'energies': ('energies', 'id', None),
+    'feature_categories': ('feature_categories', 'id', None),
+    'features': ('features', 'id', None),
+    'gears': ('gears', 'id', None),
+    'grid': ('grid', 'ID', parse_cell_id),
+}
+
+# References from fact sections: section -> [(column, key set)].
+reference_checks = {
+    'features': [('category', 'feature_categories')],
+    'gears': [('generic_id', 'gears')],
+    'va': [
+        ('gear_id', 'gears'),
+        ('feature_id', 'features'),
+        ('substrate_id', 'substrates'),
+        ('energy_id', 'energies'),
+    ],
+    'fishing_efforts': [
+        ('gear_id', 'gears'),
+        ('cell_id', 'grid'),
+    ],
+    'habitats': [
+        ('SUBSTRATE', 'substrates'),
+        ('ENERGY', 'energies'),
+    ],
+}
+
+class ReferentialIntegrityValidator(object):
+    """ Checks that ids in fact sections exist in the sections they
+    refer to, e.g. that effort gear_ids exist in gears.csv.
+    Key sets for dimension sections are loaded into memory, and each
+    fact section is then read once, checking all of its references.
+    Empty values are not checked. Results have counts of missing
+    values, and samples of (row number, value).
+    Checks which refer to missing sections are skipped.
+    """
+
+    def __init__(self, data_dir=None, workers=4, max_samples=10,
+                 logger=logging.getLogger(), data_source=None, **kwargs):
+        self.data_dir = data_dir
+        if data_source is None:
+            data_source = get_data_source(data_dir)
+        self.data_source = data_source
+        self.workers = workers
+        self.max_samples = max_samples
+        self.logger = logger
+        self.key_sets = {}
+        self.results = []
+
+    def get_csv_path(self, section):
+        return "%s.csv" % section
+
+    def get_shp_path(self, section):
+        return os.path.join(section, "%s.shp" % section)
+
+    def map(self, func, items):
+        if self.workers > 1:
+            pool = ThreadPool(self.workers)
+            try:
+                return pool.map(func, items)
+            finally:
+                pool.close()
+                pool.join()
+        return [func(item) for item in items]
+
+    def validate(self):
+        """ Runs all checks, and raises a SASIDataValidationError
+        if any values are missing. """
+        self.load_key_sets()
+        sections = sorted(reference_checks.keys())
+        self.results = []
+        for section_results in self.map(self.check_section, sections):
+            self.results.extend(section_results)
+        errors = self.get_errors()
+        if errors:
+            raise SASIDataValidationError("\n".join(errors))
+
+    def get_errors(self):
+        errors = []
+        for result in self.results:
+            if result['num_missing']:
+                errors.append(
+                    "Section '%s': %s of %s values in column '%s' were not"
+                    " found in '%s', e.g.: %s" % (
+                        result['section'], result['num_missing'],
+                        result['num_rows'], result['column'],
+                        result['key_set'],
+                        ", ".join(["row %s: %r" % sample
+                                   for sample in result['samples']])))
+        return errors
+
+    def load_key_sets(self):
+        names = sorted(key_sections.keys())
+        key_sets = self.map(self.load_key_set, names)
+        self.key_sets = dict([(name, key_set) for name, key_set in
+                              zip(names, key_sets) if key_set is not None])
+
+    def load_key_set(self, name):
+        """ Returns a set of keys, or None if the section is missing. """
+        section, column, parse = key_sections[name]
+        if name == 'grid':
+            values = self.iter_shp_values(section, [column])
+        else:
+            values = self.iter_csv_values(section, [column])
+        if values is None:
+            return None
+        key_set = set()
+        for row in values:
+            value = row[0]
+            if value is None or value == '':
+                continue
+            if parse:
+                try:
+                    value = parse(value)
+                except (ValueError, TypeError):
+                    continue
+            key_set.add(value)
+        return key_set
+
+    def iter_csv_values(self, section, columns):
+        """ Returns an iterator over lists of values for columns,
+        or None if the file or any column is missing. """
+        csv_path = self.get_csv_path(section)
+        if not self.data_source.exists(csv_path):
+            return None
+        csv_file = self.data_source.open(csv_path)
+        reader = csv.reader(csv_file)
+        try:
+            header = reader.next()
+        except StopIteration:
+            header = []
+        if not set(columns).issubset(header):
+            csv_file.close()
+            return None
+        idxs = [header.index(column) for column in columns]
+
+        def iter_values():
+            try:
+                for row in reader:
+                    yield [row[i] if i < len(row) else None for i in idxs]
+            finally:
+                csv_file.close()
+        return iter_values()
+
+    def iter_shp_values(self, section, columns):
+        shp_path = self.get_shp_path(section)
+        if not self.data_source.exists(shp_path):
+            return None
+        shp_reader = shapefile_util.get_shapefile_reader(
+            self.data_source.get_shapefile_path(shp_path))
+        # Shapefile field names are not case-sensitive.
+        fields = dict([(field.upper(), field) for field in shp_reader.fields])
+        if not set([c.upper() for c in columns]).issubset(fields):
+            shp_reader.close()
+            return None
+        fields = [fields[c.upper()] for c in columns]
+
+        def iter_values():
+            try:
+                for record in shp_reader.records():
+                    properties = record['properties']
+                    yield [properties.get(field) for field in fields]
+            finally:
+                shp_reader.close()
+        return iter_values()
+
+    def check_section(self, section):
+        """ Checks all references from a section in one pass. """
+        checks = [(column, key_set) for column, key_set
+                  in reference_checks[section] if key_set in self.key_sets]
+        if not checks:
+            return []
+        columns = [column for column, key_set in checks]
+        if section in shp_sections:
+            values = self.iter_shp_values(section, columns)
+        else:
+            values = self.iter_csv_values(section, columns)
+        if values is None:
+            return []
+
+        results = []
+        for column, key_set in checks:
+            results.append({
+                'section': section,
+                'column': column,
+                'key_set': key_set,
+                'num_rows': 0,
+                'num_missing': 0,
+                'samples': [],
+            })
+        check_key_sets = [self.key_sets[key_set] for column, key_set
+                          in checks]
+        parsers = [key_sections[key_set][2] for column, key_set in checks]
+        num_rows = 0
+        for row in values:
+            num_rows += 1
+            for i, value in enumerate(row):
+                if value is None or value == '':
+                    continue
+                key = value
+                if parsers[i]:
+                    try:
+                        key = parsers[i](value)
+                    except (ValueError, TypeError):
+                        key = None
+                if key not in check_key_sets[i]:
+                    result = results[i]
+                    result['num_missing'] += 1
+                    if len(result['samples']) < self.max_samples:
+                        result['samples'].append((num_rows, value))
+        for result in results:
+            result['num_rows'] = num_rows
+        return results